@@ -1,9 +1,10 @@
 from django.contrib import admin
 from apps.banks.models import Bank
+from apps.core.admin import SoftDeleteAdmin
 
 # Register your models here.
 @admin.register(Bank)
-class BankAdmin(admin.ModelAdmin):
+class BankAdmin(SoftDeleteAdmin):
     list_display = ('name', 'type_bank', 'address')
     search_fields = ('name',)
-    list_filter = ('type_bank',)
\ No newline at end of file
+    list_filter = ('type_bank',)
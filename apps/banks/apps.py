@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class BanksConfig(AppConfig):
     name = 'apps.banks'
+
+    def ready(self):
+        from django.db.models.signals import post_save
+        from apps.core.sharding import replicate_bank
+
+        post_save.connect(replicate_bank, sender=self.get_model('Bank'), dispatch_uid='replicate_bank')
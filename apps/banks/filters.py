@@ -0,0 +1,10 @@
+from apps.banks.models import Bank
+from apps.credits.summaries import CreditSummaryFilterSet
+
+
+class BankFilter(CreditSummaryFilterSet):
+    """Filters for Bank list, including the credit summary totals."""
+
+    class Meta:
+        model = Bank
+        fields = ['type_bank']
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banks', '0002_bank_banks_bank_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bank',
+            name='shard',
+            field=models.CharField(blank=True, default='', editable=False, max_length=63),
+        ),
+    ]
@@ -11,6 +11,20 @@ class Bank(BaseModel):
     name = models.CharField(max_length=100)
     type_bank = models.CharField(max_length=20, choices=TYPE_CHOICES)
     address = models.CharField(max_length=255)
+    # Database alias holding the bank's clients and credits (apps.core.sharding); blank is the default one.
+    shard = models.CharField(max_length=63, blank=True, default='', editable=False)
+
+    event_resource = 'banks'
+
+    def event_payload(self):
+        return {'bank': self.pk}
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.shard:
+            from apps.core.sharding import placement_for_new_bank
+
+            self.shard = placement_for_new_bank()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
\ No newline at end of file
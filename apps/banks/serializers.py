@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from apps.banks.models import Bank
+from apps.core.fieldsets import SparseFieldsetSerializerMixin
+from apps.core.renderers import NativeValuesSerializerMixin
+from apps.credits.summaries import SUMMARY_FIELDS, CreditSummarySerializerMixin
 
 
-class BankSerializer(serializers.ModelSerializer):
+class BankSerializer(SparseFieldsetSerializerMixin, NativeValuesSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Bank
         fields = ['id', 'name', 'type_bank', 'address', 'created_at', 'updated_at']
@@ -17,3 +20,10 @@ class BankSerializer(serializers.ModelSerializer):
         if not value or not value.strip():
             raise serializers.ValidationError("Address cannot be empty.")
         return value.strip()
+
+
+class BankWithSummarySerializer(CreditSummarySerializerMixin, BankSerializer):
+    """Bank serializer with credit summary totals, used by the bank endpoints."""
+
+    class Meta(BankSerializer.Meta):
+        fields = BankSerializer.Meta.fields + SUMMARY_FIELDS
@@ -1,28 +1,37 @@
 from rest_framework import viewsets
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.batch import BatchRetrieveMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.pagination import StreamingListMixin
+from apps.core.snapshots import SnapshotMixin
+from apps.banks.filters import BankFilter
 from apps.banks.models import Bank
-from apps.banks.serializers import BankSerializer
+from apps.banks.serializers import BankWithSummarySerializer
+from apps.credits.summaries import SUMMARY_FIELDS, summary_annotations
 
 
-class BankViewSet(viewsets.ModelViewSet):
+class BankViewSet(SnapshotMixin, BatchRetrieveMixin, StreamingListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Bank model.
-    Provides: list, create, retrieve, update, partial_update, destroy
+    Provides: list, create, retrieve, update, partial_update, destroy, snapshot
     """
-    queryset = Bank.objects.filter(deleted_at__isnull=True)
-    serializer_class = BankSerializer
+    queryset = Bank.objects.filter(deleted_at__isnull=True).annotate(**summary_annotations())
+    serializer_class = BankWithSummarySerializer
     
-    # Filtering
-    filterset_fields = ['type_bank']
+    # Filtering (type_bank and credit summary totals)
+    filterset_class = BankFilter
     
     # Search
     search_fields = ['name', 'address']
     
     # Ordering
-    ordering_fields = ['name', 'created_at']
+    ordering_fields = ['name', 'created_at', *SUMMARY_FIELDS]
     ordering = ['-created_at']
 
+    # Rate limiting (DEFAULT_THROTTLE_RATES)
+    throttle_scope = 'banks'
+
     def perform_destroy(self, instance):
         """Soft delete instead of hard delete."""
         instance.soft_delete()
@@ -1,10 +1,14 @@
 from django.contrib import admin
 from apps.clients.models import Client
-from apps.banks.models import Bank
+from apps.core.admin import SoftDeleteAdmin
 
 # Register your models here.
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
-    list_display = ('full_name', 'person_type', 'email', 'phone')
+class ClientAdmin(SoftDeleteAdmin):
+    list_display = ('full_name', 'person_type', 'email', 'phone', 'bank')
+    list_select_related = ('bank',)
+    # Matched through the full-text index on these columns (see Client.search_document).
     search_fields = ('full_name', 'email', 'phone')
-    list_filter = ('person_type', 'bank')
\ No newline at end of file
+    # No bank filter: it would list every bank on each page load; filter one bank with ?bank__id__exact=<id>.
+    list_filter = ('person_type',)
+    autocomplete_fields = ['bank']
@@ -0,0 +1,16 @@
+from apps.clients.models import Client
+from apps.credits.summaries import CreditSummaryFilterSet
+
+
+class ClientFilter(CreditSummaryFilterSet):
+    """Filters for Client list, including age and birth date ranges and the credit summary totals."""
+
+    class Meta:
+        model = Client
+        fields = {
+            'person_type': ['exact'],
+            'bank': ['exact'],
+            'nationality': ['exact'],
+            'age': ['exact', 'gte', 'lte', 'range'],
+            'birth_date': ['gte', 'lte', 'range'],
+        }
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.clients.models import Client, current_age_expression
+from apps.core.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored age of clients whose birthday changed it, in set-based batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per UPDATE batch.')
+
+    def handle(self, *args, **options):
+        today = date.today()
+        refreshed = sum(self.refresh(alias, today, options['batch_size']) for alias in shard_aliases())
+        self.stdout.write(f'Refreshed the age of {refreshed} clients.')
+
+    def refresh(self, alias, today, batch_size):
+        clients = Client.objects.using(alias)
+        stale = (
+            clients.alias(expected_age=current_age_expression(today))
+            .exclude(age=F('expected_age'))
+            .order_by('pk')
+        )
+        refreshed, last_pk = 0, 0
+        while True:
+            # Keyset over pk: each batch is one short UPDATE, never a scan from the start.
+            pks = list(stale.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic(using=alias):
+                refreshed += clients.filter(pk__in=pks).update(
+                    age=current_age_expression(today), updated_at=timezone.now(),
+                )
+            last_pk = pks[-1]
+        return refreshed
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:46
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('banks', '0002_bank_banks_bank_updated_idx'),
+        ('clients', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='client',
+            index=models.Index(fields=['updated_at', 'id'], name='clients_client_updated_idx'),
+        ),
+    ]
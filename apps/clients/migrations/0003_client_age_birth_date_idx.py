@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:16
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('banks', '0002_bank_banks_bank_updated_idx'),
+        ('clients', '0002_client_clients_client_updated_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='client',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['age'], name='clients_client_age_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='client',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['birth_date'], name='clients_client_birth_idx'),
+        ),
+    ]
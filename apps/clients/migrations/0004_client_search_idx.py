@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('banks', '0002_bank_banks_bank_updated_idx'),
+        ('clients', '0003_client_age_birth_date_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='client',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('full_name', 'email', 'phone', config='simple'), name='clients_client_search_idx'),
+        ),
+    ]
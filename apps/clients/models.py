@@ -1,8 +1,30 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
 from datetime import date
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from apps.core.models import BaseModel
+from apps.core.sharding import atomic_on, fence, follow_moved_banks, instance_shard
+
+# Full-text document searched by the admin; the 'simple' config keeps names and emails unstemmed.
+SEARCH_DOCUMENT = SearchVector('full_name', 'email', 'phone', config='simple')
+
+
+def age_on(birth_date, day):
+    """Completed years between birth_date and day."""
+    return day.year - birth_date.year - ((day.month, day.day) < (birth_date.month, birth_date.day))
+
+
+def current_age_expression(day):
+    """SQL expression of a client's age on ``day``, the set-based twin of age_on()."""
+    birthday_passed = Q(birth_date__month__lt=day.month) | Q(birth_date__month=day.month, birth_date__day__lte=day.day)
+    return Case(
+        When(birthday_passed, then=Value(day.year) - F('birth_date__year')),
+        default=Value(day.year - 1) - F('birth_date__year'),
+    )
+
 
 # Create your models here.
 class Client(BaseModel):
@@ -21,19 +43,57 @@ class Client(BaseModel):
     person_type = models.CharField(max_length=20, choices=PERSON_TYPE_CHOICES)
     bank = models.ForeignKey('banks.Bank', on_delete=models.SET_NULL, null=True, blank=True, related_name='clients')
 
-    def clean(self):
-        # Validate age consistency
+    event_resource = 'clients'
+    # age is derived from birth_date and refreshed in bulk (refresh_client_ages): not tracked.
+    history_fields = (
+        'full_name', 'birth_date', 'nationality', 'address', 'email', 'phone', 'person_type', 'bank',
+    )
+    search_document = SEARCH_DOCUMENT
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            *BaseModel.Meta.indexes,
+            # Age and birth date range filters on active clients.
+            models.Index(fields=['age'], name='clients_client_age_idx', condition=Q(deleted_at__isnull=True)),
+            models.Index(
+                fields=['birth_date'], name='clients_client_birth_idx', condition=Q(deleted_at__isnull=True),
+            ),
+            GinIndex(SEARCH_DOCUMENT, name='clients_client_search_idx'),
+        ]
+
+    def event_payload(self):
+        return {'bank': self.bank_id}
+
+    def derive_age(self):
+        """
+        Set age from birth_date. A stored age that went stale on a birthday is
+        corrected, not rejected, but a birth date giving an age outside the
+        field's 1-99 range is.
+        """
         if self.birth_date:
-            today = date.today()
-            calculated_age = today.year - self.birth_date.year - (
-                (today.month, today.day) < (self.birth_date.month, self.birth_date.day)
-            )
-            if self.age != calculated_age:
-                raise ValidationError({'age': f'The provided age ({self.age}) does not match the birth date ({calculated_age}).'})
+            self.age = age_on(self.birth_date, date.today())
+            try:
+                self._meta.get_field('age').run_validators(self.age)
+            except ValidationError as exc:
+                raise ValidationError({'birth_date': exc.messages})
 
+    def clean(self):
+        self.derive_age()
+
+    @follow_moved_banks
     def save(self, *args, **kwargs):
-        self.clean()
-        super().save(*args, **kwargs)
+        self.derive_age()
+        alias = kwargs.get('using') or instance_shard(self)
+        with atomic_on(alias):
+            fence(alias, {self.bank_id, (self.loaded_values or {}).get('bank_id')})
+            super().save(*args, **kwargs)
+
+    @follow_moved_banks
+    def delete(self, *args, **kwargs):
+        alias = kwargs.get('using') or instance_shard(self)
+        with atomic_on(alias):
+            fence(alias, [self.bank_id])
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return self.full_name
\ No newline at end of file
@@ -1,19 +1,33 @@
 from datetime import date
 from rest_framework import serializers
-from apps.clients.models import Client
+from apps.banks.models import Bank
+from apps.clients.models import Client, age_on
 from apps.credits.serializers import CreditWithBankSerializer
+from apps.credits.summaries import SUMMARY_FIELDS, CreditSummarySerializerMixin
 from apps.banks.serializers import BankSerializer
+from apps.core.fieldsets import SparseFieldsetSerializerMixin
+from apps.core.renderers import NativeValuesSerializerMixin
+from apps.core.relations import CachedRelatedField, CachedRelatedListSerializer
+from apps.core.sharding import check_same_shard
 
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(
+    SparseFieldsetSerializerMixin, NativeValuesSerializerMixin, CreditSummarySerializerMixin, serializers.ModelSerializer,
+):
+    # Resolved from the in-process bank cache instead of one query per write.
+    bank = CachedRelatedField(Bank, cache='versioned', allow_null=True, required=False)
+
     class Meta:
         model = Client
+        list_serializer_class = CachedRelatedListSerializer
         fields = [
             'id', 'full_name', 'birth_date', 'age', 'nationality',
             'address', 'email', 'phone', 'person_type', 'bank',
-            'created_at', 'updated_at'
+            'created_at', 'updated_at', *SUMMARY_FIELDS
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
+        # Derived from birth_date on save; when given it must still match.
+        extra_kwargs = {'age': {'required': False}}
 
     def validate_full_name(self, value):
         if not value or not value.strip():
@@ -36,24 +50,30 @@ class ClientSerializer(serializers.ModelSerializer):
         return value.strip()
 
     def validate(self, attrs):
-        """Cross-field validation for age consistency with birth_date."""
-        birth_date = attrs.get('birth_date')
+        """Cross-field validation for age consistency with birth_date (age itself is derived on save)."""
+        birth_date = attrs.get('birth_date') or getattr(self.instance, 'birth_date', None)
         age = attrs.get('age')
 
-        if birth_date and age is not None:
-            today = date.today()
-            calculated_age = today.year - birth_date.year - (
-                (today.month, today.day) < (birth_date.month, birth_date.day)
-            )
-            if age != calculated_age:
+        if birth_date:
+            calculated_age = age_on(birth_date, date.today())
+            if age is not None and age != calculated_age:
                 raise serializers.ValidationError({
                     'age': f'The provided age ({age}) does not match the birth date. Expected: {calculated_age}.'
                 })
+            if not 1 <= calculated_age <= 99:
+                raise serializers.ValidationError({
+                    'birth_date': f'The birth date gives an age of {calculated_age}; it must be between 1 and 99.'
+                })
+
+        if 'bank' in attrs:
+            check_same_shard(attrs['bank'], self.instance)
 
         return attrs
 
 
-class ClientDetailSerializer(serializers.ModelSerializer):
+class ClientDetailSerializer(
+    SparseFieldsetSerializerMixin, NativeValuesSerializerMixin, CreditSummarySerializerMixin, serializers.ModelSerializer,
+):
     """Client serializer with nested credits and bank details for retrieve operations."""
     credits = CreditWithBankSerializer(many=True, read_only=True)
     bank = BankSerializer(read_only=True)
@@ -63,6 +83,6 @@ class ClientDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'full_name', 'birth_date', 'age', 'nationality',
             'address', 'email', 'phone', 'person_type', 'bank',
-            'created_at', 'updated_at', 'credits'
+            'created_at', 'updated_at', *SUMMARY_FIELDS, 'credits'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
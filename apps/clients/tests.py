@@ -1,10 +1,18 @@
 import pytest
+from io import StringIO
 from datetime import date, timedelta
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from apps.clients.models import Client
+from apps.clients.models import Client, age_on, current_age_expression
 from apps.banks.models import Bank
+from apps.core.models import HistoryEntry
+from apps.credits.models import Credit
 
 
 @pytest.fixture
@@ -165,3 +173,252 @@ class TestClientAPI:
         url = reverse('client-list') + '?search=Jane'
         response = authenticated_client.get(url)
         assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    """Tests for ?fields= and ?exclude= projections."""
+
+    @pytest.fixture
+    def credit(self, client_instance, bank):
+        return Credit.objects.create(
+            client=client_instance, description='Car Loan', minimum_payment=Decimal('100.00'),
+            maximum_payment=Decimal('300.00'), term_months=24, bank=bank, credit_type='AUTOMOTIVE'
+        )
+
+    def test_list_fields(self, authenticated_client, client_instance):
+        """Test that only the requested fields are rendered."""
+        response = authenticated_client.get(reverse('client-list'), {'fields': 'id,full_name,bank'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == [
+            {'id': client_instance.pk, 'full_name': 'Jane Doe', 'bank': client_instance.bank_id}
+        ]
+
+    def test_nested_fields_are_pushed_down(self, authenticated_client, client_instance, credit):
+        """Test that nested paths project the prefetch and skip unrequested columns."""
+        url = reverse('client-detail', kwargs={'pk': client_instance.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(url, {'fields': 'id,credits.description,credits.bank.name'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            'id': client_instance.pk,
+            'credits': [{'description': 'Car Loan', 'bank': {'name': 'Test Bank'}}],
+        }
+        credits_sql = next(query['sql'] for query in queries if 'FROM "credits_credit"' in query['sql'])
+        assert '"minimum_payment"' not in credits_sql
+        assert '"banks_bank"."name"' in credits_sql
+        assert '"banks_bank"."address"' not in credits_sql
+        assert '"clients_client"."email"' not in queries[0]['sql']
+
+    def test_exclude_skips_relation(self, authenticated_client, client_instance, credit):
+        """Test that excluded relations are neither rendered nor fetched."""
+        url = reverse('client-detail', kwargs={'pk': client_instance.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(url, {'exclude': 'credits,email'})
+        assert response.status_code == status.HTTP_200_OK
+        assert 'credits' not in response.data
+        assert 'email' not in response.data
+        assert response.data['bank']['name'] == 'Test Bank'
+        assert not any('FROM "credits_credit"' in query['sql'] for query in queries)
+
+    def test_unknown_field(self, authenticated_client, client_instance):
+        """Test that unknown field names are rejected."""
+        response = authenticated_client.get(reverse('client-list'), {'fields': 'id,salary'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_writes_ignore_fieldsets(self, authenticated_client, client_data):
+        """Test that projections only apply to reads."""
+        response = authenticated_client.post(reverse('client-list') + '?fields=id', client_data)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['full_name'] == 'John Doe'
+
+
+@pytest.mark.django_db
+class TestClientRangeFilters:
+    """Tests for age and birth date range filters on clients."""
+
+    @pytest.fixture
+    def clients(self, bank):
+        today = date.today()
+        return [
+            Client.objects.create(
+                full_name=f'Client {age}', birth_date=today.replace(year=today.year - age), age=age,
+                nationality='USA', address='1 Main St', email=f'c{age}@example.com', phone='+100',
+                person_type='INDIVIDUAL', bank=bank,
+            )
+            for age in (20, 35, 60)
+        ]
+
+    def names(self, client, params):
+        response = client.get(reverse('client-list'), params)
+        assert response.status_code == status.HTTP_200_OK
+        return sorted(item['full_name'] for item in response.data['results'])
+
+    def test_age_range(self, authenticated_client, clients):
+        """Test age gte/lte/range filters."""
+        assert self.names(authenticated_client, {'age__gte': 30}) == ['Client 35', 'Client 60']
+        assert self.names(authenticated_client, {'age__range': '18,40'}) == ['Client 20', 'Client 35']
+
+    def test_birth_date_range(self, authenticated_client, clients):
+        """Test birth date ranges."""
+        cutoff = date.today().replace(year=date.today().year - 40)
+        assert self.names(authenticated_client, {'birth_date__lte': cutoff.isoformat()}) == ['Client 60']
+
+    @pytest.mark.parametrize('lookup, index', [
+        ({'age__gte': 95}, 'clients_client_age_idx'),
+        ({'birth_date__gte': date(2000, 1, 1)}, 'clients_client_birth_idx'),
+    ])
+    def test_explain_uses_index(self, bank, lookup, index):
+        """Test that age and birth date ranges can be answered from their indexes."""
+        Client.objects.bulk_create(
+            Client(
+                full_name=f'Client {number}', birth_date=date(1930, 1, 1) + timedelta(days=number * 13),
+                age=1 + number % 99, nationality='USA', address='1 Main St', email=f'c{number}@example.com',
+                phone='+100', person_type='INDIVIDUAL', bank=bank,
+            )
+            for number in range(2000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE clients_client')
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                plan = Client.objects.filter(deleted_at__isnull=True, **lookup).explain()
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        assert index in plan
+
+
+@pytest.mark.django_db
+class TestClientAge:
+    """Tests for the derived client age and the nightly age refresh."""
+
+    def stored_client(self, bank, birth_date, age, email):
+        """A client row written with ``age`` as is, like one stored before a birthday came around."""
+        client = Client(
+            full_name=email, birth_date=birth_date, age=age, nationality='USA', address='1 Main St',
+            email=email, phone='+100', person_type='INDIVIDUAL', bank=bank,
+        )
+        # bulk_create skips save(), which would derive the age.
+        Client.objects.bulk_create([client])
+        return client
+
+    def test_expression_matches_age_on(self, bank):
+        """Test that the SQL age expression agrees with age_on() around birthdays and leap days."""
+        birth_dates = [date(1990, 2, 28), date(1992, 2, 29), date(1985, 12, 31), date(2000, 1, 1), date(1970, 6, 15)]
+        for number, birth_date in enumerate(birth_dates):
+            self.stored_client(bank, birth_date, 1, f'c{number}@example.com')
+        for day in (date(2025, 2, 28), date(2025, 3, 1), date(2024, 2, 29), date(2025, 6, 14), date(2025, 12, 31)):
+            ages = dict(Client.objects.annotate(expected=current_age_expression(day)).values_list('birth_date', 'expected'))
+            assert ages == {birth_date: age_on(birth_date, day) for birth_date in birth_dates}
+
+    def test_save_corrects_stale_age(self, bank):
+        """Test that saving a client whose birthday passed corrects the age instead of failing."""
+        today = date.today()
+        client = self.stored_client(bank, today.replace(year=today.year - 40) - timedelta(days=1), 39, 'a@example.com')
+        client = Client.objects.get(pk=client.pk)
+        client.phone = '+200'
+        client.save()
+        client.refresh_from_db()
+        assert (client.age, client.phone) == (40, '+200')
+
+    def test_age_derived_when_omitted(self, authenticated_client, client_data):
+        """Test that age is optional on create and derived from birth_date."""
+        del client_data['age']
+        response = authenticated_client.post(reverse('client-list'), client_data, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['age'] == 30
+
+    def test_partial_update_of_stale_client(self, authenticated_client, bank):
+        """Test that a PATCH not touching age succeeds on a client with a stale age."""
+        today = date.today()
+        client = self.stored_client(bank, today.replace(year=today.year - 40) - timedelta(days=1), 39, 'a@example.com')
+        url = reverse('client-detail', kwargs={'pk': client.pk})
+        response = authenticated_client.patch(url, {'phone': '+200'}, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['age'] == 40
+
+    def test_full_clean_corrects_stale_age(self, bank):
+        """Test that full_clean() derives a stale age instead of rejecting the client."""
+        today = date.today()
+        client = self.stored_client(bank, today.replace(year=today.year - 40) - timedelta(days=1), 39, 'a@example.com')
+        client = Client.objects.get(pk=client.pk)
+        client.full_clean()
+        assert client.age == 40
+
+    def test_admin_saves_stale_client(self, client, django_user_model, bank, settings):
+        """Test that the admin change form saves a client whose birthday passed since its age was stored."""
+        settings.STORAGES = {
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        client.force_login(django_user_model.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        today = date.today()
+        stale = self.stored_client(bank, today.replace(year=today.year - 40) - timedelta(days=1), 39, 'a@example.com')
+        response = client.post(reverse('admin:clients_client_change', args=[stale.pk]), {
+            'full_name': stale.full_name, 'birth_date': stale.birth_date.isoformat(), 'age': 39,
+            'nationality': stale.nationality, 'address': stale.address, 'email': stale.email, 'phone': '+200',
+            'person_type': stale.person_type, 'bank': bank.pk,
+        })
+        assert response.status_code == 302, response.context['adminform'].form.errors
+        stale.refresh_from_db()
+        assert (stale.age, stale.phone) == (40, '+200')
+
+    def test_age_out_of_range_rejected(self, authenticated_client, client_data, bank):
+        """Test that a birth date giving an age outside 1-99 is rejected by the API and by save()."""
+        client_data['birth_date'] = date.today().isoformat()
+        del client_data['age']
+        response = authenticated_client.post(reverse('client-list'), client_data, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'birth_date' in response.data
+
+        client = Client(
+            full_name='Newborn', birth_date=date.today(), nationality='USA', address='1 Main St',
+            email='n@example.com', phone='+100', person_type='INDIVIDUAL', bank=bank,
+        )
+        with pytest.raises(ValidationError):
+            client.save()
+        assert not Client.objects.filter(email='n@example.com').exists()
+
+    def test_refresh_client_ages(self, bank):
+        """Test that the refresh command updates only stale ages, across batches."""
+        today = date.today()
+        stale = [
+            self.stored_client(bank, today.replace(year=today.year - 30) - timedelta(days=1), 29, f's{n}@example.com')
+            for n in range(5)
+        ]
+        current = self.stored_client(bank, today.replace(year=today.year - 30) + timedelta(days=1), 29, 'c@example.com')
+        untouched = Client.objects.get(pk=current.pk).updated_at
+
+        out = StringIO()
+        call_command('refresh_client_ages', batch_size=2, stdout=out)
+
+        assert 'Refreshed the age of 5 clients.' in out.getvalue()
+        assert set(Client.objects.filter(pk__in=[c.pk for c in stale]).values_list('age', flat=True)) == {30}
+        current = Client.objects.get(pk=current.pk)
+        assert (current.age, current.updated_at) == (29, untouched)
+
+    def test_age_not_in_history(self, authenticated_client, bank, settings):
+        """Test that the derived age is left out of the history, which the bulk refresh never writes to."""
+        settings.AUDIT_HISTORY_ASYNC = False
+        today = date.today()
+        client = self.stored_client(bank, today.replace(year=today.year - 40) - timedelta(days=1), 39, 'a@example.com')
+        url = reverse('client-detail', kwargs={'pk': client.pk})
+        authenticated_client.patch(url, {'phone': '+200'}, format='json')
+        assert HistoryEntry.objects.get(resource='clients', object_id=client.pk).changes == {'phone': ['+100', '+200']}
+
+
+@pytest.mark.django_db
+class TestClientHistory:
+    """Tests for the audit history of client data."""
+
+    def test_history(self, authenticated_client, client_instance, settings):
+        """Test that client data changes are listed newest first."""
+        settings.AUDIT_HISTORY_ASYNC = False
+        url = reverse('client-detail', kwargs={'pk': client_instance.pk})
+        authenticated_client.patch(url, {'phone': '+200', 'address': '1 New St'}, format='json')
+
+        response = authenticated_client.get(reverse('client-history', kwargs={'pk': client_instance.pk}))
+        assert response.status_code == status.HTTP_200_OK
+        assert [entry['action'] for entry in response.data['results']] == ['update', 'insert']
+        assert response.data['results'][0]['changes'] == {
+            'phone': [client_instance.phone, '+200'], 'address': [client_instance.address, '1 New St'],
+        }
@@ -1,27 +1,45 @@
 from rest_framework import viewsets
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.core.batch import BatchRetrieveMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.history import HistoryMixin
+from apps.core.idempotency import IdempotentMixin
+from apps.core.pagination import StreamingListMixin
+from apps.core.sharding import ShardedViewSetMixin
+from apps.core.snapshots import SnapshotMixin
+from apps.clients.filters import ClientFilter
 from apps.clients.models import Client
 from apps.clients.serializers import ClientSerializer, ClientDetailSerializer
+from apps.credits.summaries import SUMMARY_FIELDS, summary_annotations
 
 
-class ClientViewSet(viewsets.ModelViewSet):
+class ClientViewSet(IdempotentMixin, ShardedViewSetMixin, HistoryMixin, SnapshotMixin, BatchRetrieveMixin, StreamingListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Client model.
-    Provides: list, create, retrieve, update, partial_update, destroy
+    Provides: list, create, retrieve, update, partial_update, destroy, history, snapshot
     """
-    queryset = Client.objects.filter(deleted_at__isnull=True).select_related('bank').prefetch_related('credits__bank')
+    queryset = (
+        Client.objects.filter(deleted_at__isnull=True)
+        .select_related('bank')
+        .prefetch_related('credits__bank')
+        .annotate(**summary_annotations())
+    )
     
-    # Filtering
-    filterset_fields = ['person_type', 'bank', 'nationality']
+    # Filtering (person_type, bank, nationality and credit summary totals)
+    filterset_class = ClientFilter
     
     # Search by client name
     search_fields = ['full_name', 'email', 'phone']
     
     # Ordering
-    ordering_fields = ['full_name', 'created_at', 'age']
+    ordering_fields = ['full_name', 'created_at', 'age', *SUMMARY_FIELDS]
     ordering = ['-created_at']
 
+    # Rate limiting (DEFAULT_THROTTLE_RATES); the detail prefetches every credit
+    throttle_scope = 'clients'
+    throttle_costs = {'retrieve': 3}
+
     def get_serializer_class(self):
         """Use detailed serializer for retrieve, simple for list/create/update."""
         if self.action == 'retrieve':
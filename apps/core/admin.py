@@ -1,3 +1,166 @@
+"""
+Admin building blocks for large soft-deleted tables.
+
+SoftDeleteAdmin changelists:
+
+- hide soft-deleted rows unless the "deleted" filter asks for them;
+- report a planner estimate instead of COUNT(*) for large results
+  (EstimatedCountPaginator) and skip the unfiltered total;
+- page by primary key (``?after=<pk>``) under the default newest-first
+  ordering, so deep pages cost as much as the first one; other orderings keep
+  page numbers;
+- search the model's ``search_document`` full-text index (and those of
+  ``search_relations``) instead of ``icontains`` scans, when the model has one;
+- soft delete and restore the selected rows with one UPDATE each.
+"""
+import re
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.contrib.postgres.search import SearchQuery
+from django.core.exceptions import ValidationError
+
+from apps.core.models import Job
+from apps.core.pagination import EstimatedCountPaginator
+
+KEYSET_VAR = 'after'
+
+
+def prefix_search_query(search_term):
+    """A tsquery matching every word of ``search_term`` as a prefix, None without any word."""
+    words = [word for word in search_term.split() if re.search(r'\w', word)]
+    if not words:
+        return None
+    raw = ' & '.join("'{}':*".format(word.replace('\\', '\\\\').replace("'", "''")) for word in words)
+    return SearchQuery(raw, search_type='raw', config='simple')
+
+
+class SoftDeletedListFilter(admin.SimpleListFilter):
+    """Shows active rows by default; soft-deleted rows only when asked for."""
+    title = 'deleted'
+    parameter_name = 'deleted'
+
+    def lookups(self, request, model_admin):
+        return [('yes', 'Deleted'), ('all', 'All')]
+
+    def choices(self, changelist):
+        choices = list(super().choices(changelist))
+        choices[0]['display'] = 'Active'
+        return choices
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(deleted_at__isnull=False)
+        if self.value() != 'all':
+            return queryset.filter(deleted_at__isnull=True)
+        return queryset
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList paged with ``?after=<pk>`` while ordered newest first by primary key."""
+
+    def __init__(self, request, *args, **kwargs):
+        self.after = request.GET.get(KEYSET_VAR)
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filter, search and sort links start over from the first page.
+        if KEYSET_VAR not in (new_params or {}):
+            remove = [*(remove or []), KEYSET_VAR]
+        return super().get_query_string(new_params, remove)
+
+    @property
+    def keyset(self):
+        return self.queryset.query.order_by == ('-pk',) and not self.show_all
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+        queryset = self.queryset
+        if self.after is not None:
+            try:
+                queryset = queryset.filter(pk__lt=self.model._meta.pk.to_python(self.after))
+            except ValidationError:
+                raise IncorrectLookupParameters
+        # One row past the page tells whether a next page exists.
+        rows = list(queryset[:self.list_per_page + 1])
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = rows[:self.list_per_page]
+        if len(rows) > self.list_per_page:
+            self.next_cursor = self.result_list[-1].pk
+        self.can_show_all = False
+        self.multi_page = self.after is not None or self.next_cursor is not None
+
+    @property
+    def next_page_url(self):
+        return self.get_query_string({KEYSET_VAR: self.next_cursor}, [PAGE_VAR])
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[PAGE_VAR])
+
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """ModelAdmin for BaseModel tables that can grow to millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/keyset_change_list.html'
+    actions = ['soft_delete_selected', 'restore_selected']
+    # Relations whose ``search_document`` also matches, e.g. ('client',) for credits.
+    search_relations = ()
+
+    def get_list_filter(self, request):
+        return [*super().get_list_filter(request), SoftDeletedListFilter]
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Rows are soft deleted; the stock action would DELETE them one by one.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        document = getattr(self.model, 'search_document', None)
+        if document is None:
+            return super().get_search_results(request, queryset, search_term)
+        query = prefix_search_query(search_term)
+        if query is None:
+            return queryset, False
+        manager = self.model._default_manager
+        matching = manager.alias(document=document).filter(document=query).values('pk')
+        for name in self.search_relations:
+            related = self.model._meta.get_field(name).related_model
+            related_matching = related._default_manager.alias(document=related.search_document).filter(document=query)
+            # A UNION of index scans rather than an OR the planner can only answer with a full scan.
+            matching = matching.union(manager.filter(**{f'{name}__in': related_matching.values('pk')}).values('pk'))
+        return queryset.filter(pk__in=matching), False
+
+    @admin.action(description='Soft delete selected %(verbose_name_plural)s')
+    def soft_delete_selected(self, request, queryset):
+        self.message_user(request, f'Soft deleted {queryset.soft_delete()} rows.')
+
+    @admin.action(description='Restore selected %(verbose_name_plural)s')
+    def restore_selected(self, request, queryset):
+        self.message_user(request, f'Restored {queryset.restore()} rows.')
+
 
 # Register your models here.
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'progress', 'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    list_select_related = ('created_by',)
+    readonly_fields = ('started_at', 'finished_at', 'error')
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'apps.core'
+
+    def ready(self):
+        from apps.core import checks  # noqa: F401
+        from apps.core import jobs
+        jobs.autodiscover()
+        # Registers the snapshot job (apps.core.jobs is the queue itself, not a handler module).
+        from apps.core import snapshots  # noqa: F401
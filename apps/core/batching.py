@@ -0,0 +1,123 @@
+"""
+Group commit: writes submitted by many request threads, flushed together.
+
+GroupCommitWriter queues objects and a background thread per process hands
+them to ``flush`` in batches of up to ``<SETTING>_MAX_ROWS`` objects, waiting at
+most ``<SETTING>_MAX_DELAY_MS`` for a batch to fill. One transaction (and one
+fsync) then covers the whole batch. Each submitter gets a Future resolved with
+its object once the batch committed, or with the error that rejected it: when
+a batch fails, its objects are retried one by one so a bad row only fails its
+own request. A submitter that gives up waiting withdraws its object with
+``future.cancel()``, which succeeds only while its batch has not started.
+
+The thread keeps one database connection for all its batches, whatever
+CONN_MAX_AGE says: it is only closed after a failed batch (the retries get a
+fresh one) and when the writer is stopped.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, wait
+
+from django.conf import settings
+from django.db import connections
+
+
+class GroupCommitWriter:
+    """Batches objects from concurrent submit() calls into calls of ``flush(objects)``."""
+
+    def __init__(self, flush, setting):
+        self.flush = flush
+        self.setting = setting
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last = None
+        self._thread = None
+
+    def _start(self):
+        # Per process: a preloaded master forks workers without this thread.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name=f'group-commit-{self.setting}', daemon=True,
+                )
+                self._thread.start()
+                self._last = None
+                self._pid = os.getpid()
+
+    def submit(self, obj):
+        """Queue ``obj``; the returned Future resolves once its batch committed, or cancels before it starts."""
+        if self._pid != os.getpid():
+            self._start()
+        future = Future()
+        self._queue.put((obj, future))
+        self._last = future
+        return future
+
+    def drain(self, timeout=None):
+        """Wait until everything submitted so far was written or failed; False if ``timeout`` ran out."""
+        # Batches are written in submission order, so the last future resolves last.
+        last = self._last if self._pid == os.getpid() else None
+        return last is None or bool(wait([last], timeout=timeout).done)
+
+    def stop(self, timeout=None):
+        """
+        Write what is queued, then end the thread and close its connection; the next submit()
+        starts a new one. False if ``timeout`` ran out first.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                return True
+            pending, thread, self._pid = self._queue, self._thread, None
+        pending.put(None)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _run(self, pending):
+        try:
+            stopping = False
+            while not stopping:
+                item = pending.get()
+                if item is None:
+                    break
+                batch = [item]
+                max_rows = getattr(settings, f'{self.setting}_MAX_ROWS')
+                deadline = time.monotonic() + getattr(settings, f'{self.setting}_MAX_DELAY_MS') / 1000
+                while len(batch) < max_rows:
+                    try:
+                        item = pending.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._write(batch)
+        finally:
+            connections.close_all()
+
+    def _write(self, batch):
+        # Marks the rest as started: from here on they can no longer be withdrawn.
+        batch = [(obj, future) for obj, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            self.flush([obj for obj, _ in batch])
+        except Exception:
+            # The failure may have come from a broken connection: the retries open a fresh one.
+            connections.close_all()
+            for obj, future in batch:
+                # Undo what the failed attempt assigned (e.g. primary keys) before retrying alone.
+                obj.pk = None
+                obj._state.adding = True
+                try:
+                    self.flush([obj])
+                except Exception as exc:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(obj)
+        else:
+            for obj, future in batch:
+                future.set_result(obj)
@@ -0,0 +1,37 @@
+"""System checks for deployments running several worker processes."""
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache(alias):
+    """Whether the ``alias`` cache is seen by every worker process."""
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared_cache('default'):
+        return []
+    return [Warning(
+        'The default cache is local to each worker process.',
+        hint='Set CACHE_URL: bank changes made by one worker otherwise reach the others only after '
+             'RELATED_CACHE_TIMEOUT seconds.',
+        id='core.W001',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_throttle_cache(app_configs, **kwargs):
+    if is_shared_cache(settings.THROTTLE_CACHE):
+        return []
+    return [Error(
+        f'The THROTTLE_CACHE cache ({settings.THROTTLE_CACHE!r}) is local to each worker process.',
+        hint='Point THROTTLE_CACHE at a shared cache (CACHE_URL): rate limits and in-flight counters '
+             'kept per process multiply the limits by the number of workers.',
+        id='core.E001',
+    )]
@@ -0,0 +1,109 @@
+"""
+Composite requests: several API calls executed within one HTTP request.
+
+Sub-requests are dispatched straight to the resolved views in this thread, so
+they share the outer request's authentication and database connection and
+skip the middleware stack. With ``consistent`` the (read-only) sub-requests run
+in one REPEATABLE READ transaction and see a single snapshot. That snapshot is
+the default database's, so consistent batches are refused when SHARD_DATABASES
+is set: snapshots taken on several databases are not one point in time.
+"""
+import io
+import json
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connection, transaction
+from django.http import Http404
+from django.urls import Resolver404, resolve
+
+from apps.core.renderers import ExactJSONEncoder
+
+API_PREFIX = '/api/'
+# Not reachable from a batch: nesting, and async streams that never finish.
+EXCLUDED_PREFIXES = ('/api/batch/', '/api/stream/')
+FORWARDED_HEADERS = ('Content-Type', 'Location', 'ETag')
+
+
+def _sub_request(request, method, path, body):
+    """A WSGIRequest for ``path`` carrying the outer request's metadata and user."""
+    url = urlsplit(path)
+    payload = b'' if body is None else json.dumps(body, cls=ExactJSONEncoder).encode()
+    environ = {
+        key: value for key, value in request.META.items()
+        # The outer Idempotency-Key covers the batch, not each call in it.
+        if key not in ('CONTENT_LENGTH', 'CONTENT_TYPE', 'QUERY_STRING', 'wsgi.input', 'HTTP_IDEMPOTENCY_KEY')
+    }
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': url.path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.url_scheme': request.scheme,
+    })
+    sub_request = WSGIRequest(environ)
+    # Authenticated once by the outer request; DRF views pick these up instead of re-authenticating.
+    sub_request._force_auth_user = request.user
+    sub_request._force_auth_token = request.auth
+    return sub_request
+
+
+def _error(status, detail):
+    return {'status': status, 'headers': {}, 'body': {'detail': detail}}
+
+
+def _dispatch(request, method, path, body):
+    url = urlsplit(path)
+    if not url.path.startswith(API_PREFIX) or url.path.startswith(EXCLUDED_PREFIXES):
+        return _error(400, f'"{url.path}" cannot be called from a batch.')
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        return _error(404, 'Not found.')
+    if iscoroutinefunction(match.func):
+        return _error(400, f'"{url.path}" cannot be called from a batch.')
+
+    try:
+        response = match.func(_sub_request(request, method, path, body), *match.args, **match.kwargs)
+    except Http404:
+        return _error(404, 'Not found.')
+    is_json = response.get('Content-Type', '').startswith('application/json')
+    if response.streaming and not is_json:
+        return _error(400, 'Streaming responses cannot be returned from a batch.')
+
+    if hasattr(response, 'data'):
+        payload = response.data
+    elif response.streaming:
+        payload = json.loads(b''.join(response.streaming_content))
+    elif is_json:
+        payload = json.loads(response.content or b'null')
+    else:
+        payload = response.content.decode(response.charset)
+    return {
+        'status': response.status_code,
+        'headers': {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)},
+        'body': payload,
+    }
+
+
+def execute_batch(request, subrequests, consistent=False):
+    """Run ``subrequests`` ({'id', 'method', 'path', 'body'}) in order and return their responses."""
+    def run():
+        return [
+            {'id': item.get('id'), **_dispatch(request, item['method'], item['path'], item.get('body'))}
+            for item in subrequests
+        ]
+
+    if not consistent:
+        return run()
+    # Inside an outer transaction (ATOMIC_REQUESTS) the snapshot is that transaction's own.
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        return run()
@@ -0,0 +1,129 @@
+"""
+Negotiated compression (zstd, brotli, gzip) of API responses.
+
+Responses of a compressible content type are compressed with the best encoding
+the client accepts, in COMPRESSION_ENCODINGS preference order. Regular
+responses below COMPRESSION_MIN_SIZE are left alone; streaming responses are
+compressed chunk by chunk as they are produced. Brotli and zstd are used when
+their packages are installed, gzip is always available; the packages are only
+imported by the first response compressed with them.
+"""
+from importlib.util import find_spec
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+def _gzip(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def _brotli(level):
+    import brotli
+
+    compressor = brotli.Compressor(quality=level)
+    return compressor.process, compressor.finish
+
+
+def _zstd(level):
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+    return compressor.compress, compressor.flush
+
+
+# encoding -> factory returning (compress(chunk), finish()) for one response body.
+COMPRESSORS = {'gzip': _gzip}
+if find_spec('brotli') is not None:
+    COMPRESSORS['br'] = _brotli
+if find_spec('zstandard') is not None:
+    COMPRESSORS['zstd'] = _zstd
+
+
+def compressor(encoding):
+    return COMPRESSORS[encoding](settings.COMPRESSION_LEVELS[encoding])
+
+
+def compress(data, encoding):
+    push, finish = compressor(encoding)
+    return push(data) + finish()
+
+
+def compress_stream(chunks, encoding):
+    push, finish = compressor(encoding)
+    for chunk in chunks:
+        output = push(chunk)
+        if output:
+            yield output
+    yield finish()
+
+
+async def acompress_stream(chunks, encoding):
+    push, finish = compressor(encoding)
+    async for chunk in chunks:
+        output = push(chunk)
+        if output:
+            yield output
+    yield finish()
+
+
+def negotiate(accept_encoding):
+    """Best available encoding acceptable per the Accept-Encoding header, or None."""
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                continue
+        if name:
+            weights[name.strip().lower()] = quality
+
+    candidates = [
+        (weights.get(encoding, weights.get('*', 0)), -rank, encoding)
+        for rank, encoding in enumerate(settings.COMPRESSION_ENCODINGS)
+        if encoding in COMPRESSORS
+    ]
+    quality, _, encoding = max(candidates, default=(0, 0, None))
+    return encoding if quality > 0 else None
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress API responses with zstd, brotli or gzip as negotiated with the client."""
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if response.has_header('Content-Encoding') or content_type not in settings.COMPRESSION_CONTENT_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The compressed body is a different byte sequence: only a weak validator still applies.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
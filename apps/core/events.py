@@ -0,0 +1,121 @@
+"""
+In-process event bus for bank, client and credit changes.
+
+BaseModel.save publishes a compact event once the transaction commits. With the
+"postgres" backend the event travels through NOTIFY, so writes made by any
+process (gunicorn workers, job runners) reach the ASGI process serving the
+streams, where a single LISTEN connection feeds the bus. With the "local"
+backend events are dispatched directly and only writes from the same process
+are seen. Either way one change produces one fan-out pass over the subscribers.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'your_credit_changes'
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class Subscription:
+    """One connected stream: a bounded queue on the subscriber's event loop plus its filters."""
+
+    def __init__(self, loop, resources=None, banks=None, credit_types=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.resources = set(resources or ())
+        self.banks = set(banks or ())
+        self.credit_types = set(credit_types or ())
+        self.dropped = 0
+
+    def matches(self, event):
+        if self.resources and event['resource'] not in self.resources:
+            return False
+        if self.banks and event.get('bank') not in self.banks:
+            return False
+        if self.credit_types and event.get('credit_type') not in self.credit_types:
+            return False
+        return True
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Slow consumers lose events instead of growing memory without bound.
+            self.dropped += 1
+
+
+class EventBus:
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def subscribe(self, **filters):
+        """Register a subscription on the running event loop (call from async code)."""
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(loop, **filters)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        if get_backend() == 'postgres' and (self._listener is None or self._listener.done()):
+            self._listener = loop.create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def dispatch(self, event):
+        """Deliver an event to every matching subscriber. Safe to call from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                subscription.loop.call_soon_threadsafe(subscription._put, event)
+
+    async def _listen(self):
+        """Relay NOTIFY payloads to local subscribers while anyone is subscribed."""
+        import psycopg
+
+        db = settings.DATABASES['default']
+        while self._subscriptions:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    dbname=db['NAME'], user=db['USER'], password=db['PASSWORD'],
+                    host=db['HOST'], port=db['PORT'], autocommit=True,
+                ) as conn:
+                    await conn.execute(f'LISTEN {CHANNEL}')
+                    async for notify in conn.notifies():
+                        self.dispatch(json.loads(notify.payload))
+                        if not self._subscriptions:
+                            return
+            except Exception:
+                logger.exception('Event listener connection lost, reconnecting')
+                await asyncio.sleep(1)
+
+
+bus = EventBus()
+
+
+def get_backend():
+    if settings.EVENTS_BACKEND == 'postgres' and connection.vendor != 'postgresql':
+        return 'local'
+    return settings.EVENTS_BACKEND
+
+
+def _send(event):
+    if get_backend() == 'postgres':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(event)])
+    else:
+        bus.dispatch(event)
+
+
+def publish(event, using=None):
+    """Emit an event after the current transaction on ``using`` commits (immediately in autocommit)."""
+    transaction.on_commit(lambda: _send(event), using=using)
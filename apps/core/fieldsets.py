@@ -0,0 +1,144 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?exclude=`` on GET requests.
+
+Both take comma-separated field names; dotted paths reach into nested
+serializers (``?fields=id,full_name,credits.bank.name``). The serializer mixin
+drops the unselected fields, and the viewset mixin pushes the same projection
+into the queryset (``only()``, ``select_related()`` and ``Prefetch``) so skipped
+columns and relations are never fetched.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def parse_field_paths(value):
+    """'id,credits.bank.name' -> {'id': {}, 'credits': {'bank': {'name': {}}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def requested_fieldsets(request):
+    """(fields tree or None, exclude tree) requested by a GET request, or None without either parameter."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = getattr(request, 'query_params', request.GET)
+    if 'fields' not in params and 'exclude' not in params:
+        return None
+    fields = parse_field_paths(params['fields']) if 'fields' in params else None
+    return fields, parse_field_paths(params.get('exclude', ''))
+
+
+def _subtree(tree, path):
+    for name in path:
+        if tree is None:
+            return None
+        tree = tree.get(name)
+    return tree
+
+
+class SparseFieldsetSerializerMixin:
+    """Serializer mixin restricting its fields to the request's ?fields= and ?exclude=."""
+
+    def _field_path(self):
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return path[::-1]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldsets = requested_fieldsets(self.context.get('request'))
+        if fieldsets is None:
+            return fields
+
+        path = self._field_path()
+        include, exclude = _subtree(fieldsets[0], path), _subtree(fieldsets[1], path) or {}
+        unknown = (set(include or ()) | set(exclude)) - set(fields)
+        if unknown:
+            label = '.'.join(path + [sorted(unknown)[0]])
+            raise serializers.ValidationError({'fields': f'Unknown field "{label}".'})
+        if include:
+            fields = {name: field for name, field in fields.items() if name in include}
+        # Only leaves are excluded here; deeper paths are handled by the nested serializer.
+        return {name: field for name, field in fields.items() if exclude.get(name, True) != {}}
+
+
+def queryset_projection(serializer, model):
+    """
+    (only, select_related, prefetch) lookups loading exactly what ``serializer``
+    renders for ``model``. Fields that are not model fields (annotations,
+    properties) are left to the queryset as it is.
+    """
+    only, select, prefetch = {model._meta.pk.name}, [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        name = field.source_attrs[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+
+        if not model_field.is_relation:
+            only.add(name)
+        elif not isinstance(nested, serializers.BaseSerializer):
+            # Primary key relations: the forward FK column, or a prefetch of related ids.
+            if model_field.concrete:
+                only.add(name)
+            else:
+                prefetch.append(name)
+        elif model_field.concrete and (model_field.many_to_one or model_field.one_to_one):
+            sub_only, sub_select, sub_prefetch = queryset_projection(nested, model_field.related_model)
+            only.add(name)
+            only.update(f'{name}__{lookup}' for lookup in sub_only)
+            select.append(name)
+            select.extend(f'{name}__{lookup}' for lookup in sub_select)
+            prefetch.extend(_prefixed(sub_prefetch, name))
+        else:
+            related = model_field.related_model
+            sub_only, sub_select, sub_prefetch = queryset_projection(nested, related)
+            if model_field.one_to_many:
+                # The prefetch joins the rows back to their parents through this column.
+                sub_only.add(model_field.field.name)
+            queryset = _project(related._default_manager.all(), sub_only, sub_select, sub_prefetch)
+            prefetch.append(Prefetch(name, queryset=queryset))
+    return only, select, prefetch
+
+
+def _project(queryset, only, select, prefetch):
+    queryset = queryset.only(*only).prefetch_related(*prefetch)
+    # select_related() without arguments would follow every foreign key.
+    return queryset.select_related(*select) if select else queryset
+
+
+def _prefixed(lookups, prefix):
+    for lookup in lookups:
+        if isinstance(lookup, Prefetch):
+            yield Prefetch(f'{prefix}__{lookup.prefetch_through}', queryset=lookup.queryset)
+        else:
+            yield f'{prefix}__{lookup}'
+
+
+class SparseFieldsetMixin:
+    """
+    Viewset mixin pushing ?fields= / ?exclude= down to the queryset for list and
+    retrieve. Without either parameter the queryset is left untouched.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve') or requested_fieldsets(self.request) is None:
+            return queryset
+        queryset = queryset.select_related(None).prefetch_related(None)
+        return _project(queryset, *queryset_projection(self.get_serializer(), queryset.model))
@@ -0,0 +1,337 @@
+"""
+GraphQL over banks, clients and credits (POST /api/graphql/).
+
+Every request gets its own GraphLoaders as the execution context. Rows are
+resolved level by level: the rows one field returns are registered as a batch
+of siblings, and the first time a relation is asked of any of them it is loaded
+for the whole batch with one query: ``pk__in`` for foreign keys, and for nested
+lists one ROW_NUMBER() window partitioned by parent, so ``first``/``offset``
+page each parent's rows. Loaded rows are cached for the request, so a bank met
+again deeper in the graph costs nothing. A query costs one database query per
+relation level (per shard with SHARD_DATABASES), however many rows it returns.
+
+Queries are validated as usual and then priced before they run: every field
+costs 1 and the fields below a list count ``first`` times (the largest page
+when ``first`` is a variable). Queries above GRAPHQL_MAX_COST or nested deeper
+than GRAPHQL_MAX_DEPTH are rejected without touching the database.
+"""
+import functools
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from graphql import (
+    FieldNode, FragmentSpreadNode, GraphQLArgument, GraphQLError, GraphQLField, GraphQLID, GraphQLInt,
+    GraphQLList, GraphQLNonNull, GraphQLObjectType, GraphQLScalarType, GraphQLSchema, GraphQLString,
+    InlineFragmentNode, IntValueNode, ValidationRule, execute, get_named_type, get_nullable_type, parse,
+    validate,
+)
+from rest_framework import serializers
+
+from apps.core.sharding import scatter, shard_for_bank
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+
+
+def _active(model):
+    from apps.credits.summaries import summary_annotations
+
+    queryset = model.objects.filter(deleted_at__isnull=True)
+    if model._meta.label_lower in ('banks.bank', 'clients.client'):
+        queryset = queryset.annotate(**summary_annotations())
+    return queryset
+
+
+def _pk(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise GraphQLError(f'"{value}" is not a valid id.')
+
+
+def _page(first, offset):
+    if not 0 <= first <= settings.PAGINATION_MAX_PAGE_SIZE:
+        raise GraphQLError(f'first must be between 0 and {settings.PAGINATION_MAX_PAGE_SIZE}.')
+    if offset < 0:
+        raise GraphQLError('offset cannot be negative.')
+    return first, offset
+
+
+class GraphLoaders:
+    """Per-request batch loading and caching of the rows a query resolves."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self._rows = {}
+        self._children = {}
+        self._siblings = {}
+
+    def batch(self, rows):
+        """Register ``rows`` as one level of siblings and cache them by primary key."""
+        rows = list(rows)
+        for row in rows:
+            self._siblings[id(row)] = rows
+            self._rows[(type(row), row.pk)] = row
+        return rows
+
+    def siblings(self, row):
+        return self._siblings.get(id(row), [row])
+
+    def one(self, row, name):
+        """The active row the foreign key ``name`` of ``row`` points to, loaded for all its siblings."""
+        field = row._meta.get_field(name)
+        model, pk = field.related_model, getattr(row, field.attname)
+        if pk is None:
+            return None
+        if (model, pk) not in self._rows:
+            pks = {getattr(sibling, field.attname) for sibling in self.siblings(row)} - {None}
+            pks = {key for key in pks if (model, key) not in self._rows}
+            self.batch(scatter(_active(model).filter(pk__in=pks)))
+            for key in pks:
+                # Missing or soft deleted: remembered too, so it is not asked for again.
+                self._rows.setdefault((model, key), None)
+        return self._rows[(model, pk)]
+
+    def many(self, row, model, name, ordering, first, offset):
+        """Page of the active ``model`` rows whose foreign key ``name`` is ``row``, loaded for all its siblings."""
+        first, offset = _page(first, offset)
+        attname = model._meta.get_field(name).attname
+        key = (model, attname, first, offset)
+        if (key, row.pk) not in self._children:
+            parents = [sibling.pk for sibling in self.siblings(row) if (key, sibling.pk) not in self._children]
+            ranked = _active(model).filter(**{f'{attname}__in': parents}).annotate(
+                graph_rank=Window(RowNumber(), partition_by=[F(attname)], order_by=[*ordering, 'pk']),
+            ).filter(graph_rank__gt=offset, graph_rank__lte=offset + first)
+            grouped = defaultdict(list)
+            for child in self.batch(sorted(scatter(ranked.order_by()), key=lambda child: child.graph_rank)):
+                grouped[getattr(child, attname)].append(child)
+            for parent in parents:
+                self._children[(key, parent)] = grouped[parent]
+        return self._children[(key, row.pk)]
+
+    def top(self, queryset, first, offset):
+        """A page of a root list, registered as the first level."""
+        first, offset = _page(first, offset)
+        return self.batch(scatter(queryset)[offset:offset + first])
+
+
+def _serialize_date(value):
+    return serializers.DateField().to_representation(value)
+
+
+def _serialize_datetime(value):
+    return serializers.DateTimeField().to_representation(value)
+
+
+DecimalType = GraphQLScalarType('Decimal', serialize=str, description='Decimal number, as a string.')
+DateType = GraphQLScalarType('Date', serialize=_serialize_date, description='ISO 8601 date.')
+DateTimeType = GraphQLScalarType('DateTime', serialize=_serialize_datetime, description='ISO 8601 date and time.')
+
+
+def _page_args():
+    return {
+        'first': GraphQLArgument(GraphQLNonNull(GraphQLInt), default_value=DEFAULT_PAGE_SIZE),
+        'offset': GraphQLArgument(GraphQLNonNull(GraphQLInt), default_value=0),
+    }
+
+
+def _fields(**types):
+    return {name: GraphQLField(field_type) for name, field_type in types.items()}
+
+
+def _summary_fields():
+    return _fields(
+        credit_count=GraphQLInt, minimum_payment_total=DecimalType, maximum_payment_total=DecimalType,
+        automotive_count=GraphQLInt, mortgage_count=GraphQLInt, commercial_count=GraphQLInt,
+    )
+
+
+def _nested(model, name, ordering):
+    """Resolver of a nested list: rows of ``model`` pointing to the parent through ``name``."""
+    def resolve(row, info, first, offset):
+        return info.context.many(row, model, name, ordering, first, offset)
+    return resolve
+
+
+def _related(name):
+    def resolve(row, info):
+        return info.context.one(row, name)
+    return resolve
+
+
+def _by_id(model):
+    def resolve(root, info, id):
+        rows = info.context.batch(scatter(_active(model).filter(pk=_pk(id))))
+        return rows[0] if rows else None
+    return resolve
+
+
+def _list(queryset_for):
+    def resolve(root, info, first, offset, **filters):
+        return info.context.top(queryset_for(**filters), first, offset)
+    return resolve
+
+
+@functools.cache
+def get_schema():
+    from apps.banks.models import Bank
+    from apps.clients.models import Client
+    from apps.credits.models import Credit
+
+    def clients_queryset(bank=None, person_type=None):
+        queryset = _active(Client).order_by('-created_at')
+        if bank is not None:
+            # One bank's clients live on one shard.
+            queryset = queryset.filter(bank_id=_pk(bank)).using(shard_for_bank(_pk(bank)))
+        if person_type is not None:
+            queryset = queryset.filter(person_type=person_type)
+        return queryset
+
+    def credits_queryset(bank=None, client=None, credit_type=None):
+        queryset = _active(Credit).order_by('-registration_date')
+        if bank is not None:
+            queryset = queryset.filter(bank_id=_pk(bank)).using(shard_for_bank(_pk(bank)))
+        if client is not None:
+            queryset = queryset.filter(client_id=_pk(client))
+        if credit_type is not None:
+            queryset = queryset.filter(credit_type=credit_type)
+        return queryset
+
+    bank_type = GraphQLObjectType('Bank', lambda: {
+        'id': GraphQLField(GraphQLNonNull(GraphQLID)),
+        **_fields(name=GraphQLString, type_bank=GraphQLString, address=GraphQLString,
+                  created_at=DateTimeType, updated_at=DateTimeType),
+        **_summary_fields(),
+        'clients': GraphQLField(
+            GraphQLNonNull(GraphQLList(GraphQLNonNull(client_type))), args=_page_args(),
+            resolve=_nested(Client, 'bank', ['-created_at']),
+        ),
+        'credits': GraphQLField(
+            GraphQLNonNull(GraphQLList(GraphQLNonNull(credit_type))), args=_page_args(),
+            resolve=_nested(Credit, 'bank', ['-registration_date']),
+        ),
+    })
+    client_type = GraphQLObjectType('Client', lambda: {
+        'id': GraphQLField(GraphQLNonNull(GraphQLID)),
+        **_fields(full_name=GraphQLString, birth_date=DateType, age=GraphQLInt, nationality=GraphQLString,
+                  address=GraphQLString, email=GraphQLString, phone=GraphQLString, person_type=GraphQLString,
+                  created_at=DateTimeType, updated_at=DateTimeType),
+        **_summary_fields(),
+        'bank': GraphQLField(bank_type, resolve=_related('bank')),
+        'credits': GraphQLField(
+            GraphQLNonNull(GraphQLList(GraphQLNonNull(credit_type))), args=_page_args(),
+            resolve=_nested(Credit, 'client', ['-registration_date']),
+        ),
+    })
+    credit_type = GraphQLObjectType('Credit', lambda: {
+        'id': GraphQLField(GraphQLNonNull(GraphQLID)),
+        **_fields(description=GraphQLString, minimum_payment=DecimalType, maximum_payment=DecimalType,
+                  term_months=GraphQLInt, registration_date=DateTimeType, credit_type=GraphQLString,
+                  created_at=DateTimeType, updated_at=DateTimeType),
+        'client': GraphQLField(client_type, resolve=_related('client')),
+        'bank': GraphQLField(bank_type, resolve=_related('bank')),
+    })
+
+    def root_list(item_type, resolve, **filters):
+        return GraphQLField(
+            GraphQLNonNull(GraphQLList(GraphQLNonNull(item_type))),
+            args={**_page_args(), **{name: GraphQLArgument(arg_type) for name, arg_type in filters.items()}},
+            resolve=_list(resolve),
+        )
+
+    def root_one(item_type, model):
+        return GraphQLField(item_type, args={'id': GraphQLArgument(GraphQLNonNull(GraphQLID))}, resolve=_by_id(model))
+
+    query_type = GraphQLObjectType('Query', {
+        'bank': root_one(bank_type, Bank),
+        'banks': root_list(bank_type, lambda **filters: _active(Bank).filter(**filters).order_by('-created_at'),
+                           type_bank=GraphQLString),
+        'client': root_one(client_type, Client),
+        'clients': root_list(client_type, clients_queryset, bank=GraphQLID, person_type=GraphQLString),
+        'credit': root_one(credit_type, Credit),
+        'credits': root_list(credit_type, credits_queryset, bank=GraphQLID, client=GraphQLID,
+                             credit_type=GraphQLString),
+    })
+    return GraphQLSchema(query=query_type)
+
+
+def _page_size(node, field):
+    """Rows a list field can return: its ``first`` literal, or the most a variable could ask for."""
+    for argument in node.arguments or ():
+        if argument.name.value == 'first':
+            if isinstance(argument.value, IntValueNode):
+                return int(argument.value.value)
+            return settings.PAGINATION_MAX_PAGE_SIZE
+    default = field.args['first'].default_value if 'first' in field.args else None
+    return default if isinstance(default, int) else settings.PAGINATION_MAX_PAGE_SIZE
+
+
+class QueryCostRule(ValidationRule):
+    """Rejects operations above GRAPHQL_MAX_COST or GRAPHQL_MAX_DEPTH (run after the standard rules)."""
+
+    def enter_operation_definition(self, node, *args):
+        # Only queries get here: the schema has no mutations or subscriptions.
+        cost, depth = self.price(node.selection_set, self.context.schema.query_type)
+        if depth > settings.GRAPHQL_MAX_DEPTH:
+            self.report_error(GraphQLError(
+                f'Query depth {depth} exceeds the maximum of {settings.GRAPHQL_MAX_DEPTH}.', node,
+            ))
+        elif cost > settings.GRAPHQL_MAX_COST:
+            self.report_error(GraphQLError(
+                f'Query cost {cost} exceeds the maximum of {settings.GRAPHQL_MAX_COST}.', node,
+                extensions={'cost': cost, 'max_cost': settings.GRAPHQL_MAX_COST},
+            ))
+
+    def price(self, selection_set, parent_type):
+        """(cost, depth) of a selection set on ``parent_type``."""
+        cost = depth = 0
+        for selection in selection_set.selections if selection_set else ():
+            if isinstance(selection, FieldNode):
+                fields = getattr(parent_type, 'fields', {})
+                if selection.name.value.startswith('__') or selection.name.value not in fields:
+                    continue
+                field = fields[selection.name.value]
+                child_cost, child_depth = self.price(selection.selection_set, get_named_type(field.type))
+                rows = _page_size(selection, field) if isinstance(get_nullable_type(field.type), GraphQLList) else 1
+                cost += 1 + rows * child_cost
+                depth = max(depth, 1 + child_depth)
+                continue
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = self.context.get_fragment(selection.name.value)
+                if fragment is None:
+                    continue
+                condition, selections = fragment.type_condition, fragment.selection_set
+            elif isinstance(selection, InlineFragmentNode):
+                condition, selections = selection.type_condition, selection.selection_set
+            else:
+                continue
+            fragment_type = self.context.schema.get_type(condition.name.value) if condition else parent_type
+            fragment_cost, fragment_depth = self.price(selections, fragment_type)
+            cost += fragment_cost
+            depth = max(depth, fragment_depth)
+        return cost, depth
+
+
+def execute_query(query, variables=None, operation_name=None, request=None):
+    """Run one GraphQL request; returns (response body, HTTP status)."""
+    schema = get_schema()
+    try:
+        document = parse(query)
+    except GraphQLError as error:
+        return {'errors': [error.formatted]}, 400
+    # Priced only once valid: the standard rules also rule out fragment cycles.
+    errors = validate(schema, document) or validate(schema, document, [QueryCostRule])
+    if errors:
+        return {'errors': [error.formatted for error in errors]}, 400
+    result = execute(
+        schema, document, variable_values=variables, operation_name=operation_name,
+        context_value=GraphLoaders(request),
+    )
+    for error in result.errors or ():
+        if error.original_error is not None and not isinstance(error.original_error, GraphQLError):
+            logger.error('GraphQL resolver failed.', exc_info=error.original_error)
+    return result.formatted, 200
@@ -0,0 +1,121 @@
+"""
+Append-only audit history of model changes.
+
+BaseModel.save diffs a model's ``history_fields`` against the values the
+instance was loaded with (``loaded_values``) and records a HistoryEntry with
+the ``{field: [old, new]}`` pairs that changed; inserts, soft deletes and
+restores are always recorded. Old values are null on insert and when the
+instance was not loaded from the database.
+
+By default entries are inserted by the saving transaction itself, on the
+default database, and commit atomically with the change: saves run inside
+``atomic_on()``, which collects the transaction's entries and inserts them with
+one multi-row INSERT as it ends (``queue_insert``).
+
+With AUDIT_HISTORY_ASYNC entries are queued once the saving transaction
+commits instead, and ``history_writer`` inserts them in batches from a
+background thread: the request only pays for the diff, worker shutdown drains
+the queue, but a worker killed outright loses what was still queued.
+
+Like change events, queryset.update() and bulk_create() bypass the history.
+"""
+import atexit
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+from apps.core.batching import GroupCommitWriter
+from apps.core.models import HistoryEntry
+from apps.core.serializers import HistoryEntrySerializer
+from apps.core.sharding import queue_insert, scatter
+
+logger = logging.getLogger(__name__)
+
+
+def field_changes(instance, action, update_fields=None):
+    """``{attname: [old, new]}`` for the tracked fields this save wrote with a new value."""
+    before = {} if action == 'insert' else (instance.loaded_values or {})
+    deferred = instance.get_deferred_fields()
+    changes = {}
+    for name in instance.history_fields:
+        field = instance._meta.get_field(name)
+        if field.attname in deferred:
+            continue
+        if update_fields is not None and name not in update_fields and field.attname not in update_fields:
+            continue
+        old, new = before.get(field.attname), getattr(instance, field.attname)
+        if action == 'insert' or field.attname not in before or old != new:
+            changes[field.attname] = [old, new]
+    return changes
+
+
+def record(instance, action, update_fields=None):
+    changes = field_changes(instance, action, update_fields)
+    if action == 'update' and not changes:
+        return
+    entry = HistoryEntry(
+        resource=instance.event_resource, object_id=instance.pk, action=action, changes=changes,
+        changed_at=instance.updated_at,
+    )
+    if not settings.AUDIT_HISTORY_ASYNC:
+        queue_insert(entry)
+        return
+    transaction.on_commit(
+        lambda: history_writer.submit(entry).add_done_callback(_log_failure), using=instance._state.db,
+    )
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error('Could not write a history entry.', exc_info=future.exception())
+
+
+def insert_entries(entries):
+    with transaction.atomic():
+        HistoryEntry.objects.bulk_create(entries)
+
+
+history_writer = GroupCommitWriter(insert_entries, 'AUDIT_HISTORY')
+
+
+@atexit.register
+def drain():
+    """Write the queued entries and close the writer's connection before the process exits."""
+    if not history_writer.stop(timeout=settings.AUDIT_HISTORY_DRAIN_TIMEOUT):
+        logger.error('History entries were still queued at exit.')
+
+
+class HistoryPagination(CursorPagination):
+    """Newest first, paged by an opaque id cursor: every page is one index range scan."""
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINATION_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        # Not the viewset's ordering (OrderingFilter), which applies to the objects themselves.
+        return (self.ordering,)
+
+
+class HistoryMixin:
+    """Viewset mixin adding ``GET {id}/history/`` for the model's audit history."""
+
+    @action(detail=True, methods=['get'], pagination_class=HistoryPagination, serializer_class=HistoryEntrySerializer)
+    def history(self, request, pk=None):
+        """Recorded changes of one object, newest first (soft-deleted objects included)."""
+        model = self.get_queryset().model
+        try:
+            exists = scatter(model.objects.filter(pk=pk)).exists()
+        except (TypeError, ValueError):
+            exists = False
+        if not exists:
+            raise NotFound()
+        entries = HistoryEntry.objects.filter(resource=model.event_resource, object_id=pk)
+        page = self.paginate_queryset(entries)
+        return self.get_paginated_response(HistoryEntrySerializer(page, many=True).data)
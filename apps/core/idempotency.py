@@ -0,0 +1,102 @@
+"""
+Idempotency-Key support for create and update actions.
+
+The first request with a key inserts an IdempotencyKey row, runs the action
+and stores its response, all in one transaction (one per database with shards,
+the one holding the key committed last, see ``atomic_on``). A retry with the same key
+replays that response without running validation or writes again. A
+concurrent duplicate blocks on the unique (user, key) index until the first
+transaction commits, then replays its response. Failed requests (validation
+errors included) store nothing, so a corrected retry can reuse the key.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from apps.core.models import IdempotencyKey
+from apps.core.renderers import ExactJSONEncoder
+from apps.core.sharding import atomic_on, shard_aliases
+
+HEADER = 'Idempotency-Key'
+# Response headers stored with the body and sent again on replay.
+REPLAYED_HEADERS = ('Location',)
+
+
+def request_fingerprint(request):
+    data = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method}\n{request.path}\n{data}'.encode()).hexdigest()
+
+
+def _claim(user, key, fingerprint):
+    """The new record for ``key``, or None when another request already holds it."""
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=user, key=key, fingerprint=fingerprint,
+                expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            )
+    except IntegrityError:
+        return None
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {'detail': f'This {HEADER} was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        record.response_body, status=record.status_code,
+        headers={**record.response_headers, 'Idempotent-Replayed': 'true'},
+    )
+
+
+class IdempotentMixin:
+    """Viewset mixin honouring the Idempotency-Key header on create and update."""
+
+    def idempotent(self, handler, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or not request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        if not 0 < len(key) <= 255:
+            raise serializers.ValidationError({HEADER: 'Must be between 1 and 255 characters.'})
+
+        fingerprint = request_fingerprint(request)
+        # On every shard: the row the request writes may live on any of them.
+        with atomic_on(*shard_aliases()):
+            record = _claim(request.user, key, fingerprint)
+            if record is None:
+                existing = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+                if existing is not None and existing.expires_at > timezone.now():
+                    return _replay(existing, fingerprint)
+                # Expired but not purged yet: the key is free again.
+                IdempotencyKey.objects.filter(user=request.user, key=key).delete()
+                record = _claim(request.user, key, fingerprint)
+                if record is None:
+                    return _replay(IdempotencyKey.objects.get(user=request.user, key=key), fingerprint)
+
+            response = handler(request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                # Only successful writes are replayed: roll back so a retry runs again.
+                for alias in shard_aliases():
+                    transaction.set_rollback(True, using=alias)
+                return response
+            record.status_code = response.status_code
+            # As JSON renders it: native decimals and timestamps (binary renderers) are stored exactly.
+            record.response_body = json.loads(json.dumps(response.data, cls=ExactJSONEncoder))
+            record.response_headers = {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)}
+            record.save(update_fields=['status_code', 'response_body', 'response_headers'])
+        return response
+
+    def create(self, request, *args, **kwargs):
+        return self.idempotent(super().create, request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        return self.idempotent(super().update, request, *args, **kwargs)
@@ -0,0 +1,154 @@
+"""
+Lightweight database-backed job queue.
+
+Apps register handlers in their ``jobs.py`` module with the ``job`` decorator;
+views enqueue work with ``enqueue`` and the ``runjobs`` management command
+claims and executes pending jobs in a process pool.
+
+A claimed job holds a lease: run_job renews ``heartbeat_at`` from a background
+thread while the handler runs. When the process running it dies, the lease
+runs out after JOB_LEASE_TIMEOUT and the next claim_next() hands the job back
+to the queue, or fails it once it has been attempted JOB_MAX_ATTEMPTS times.
+A run only records its outcome while it still holds its claim (the job is
+RUNNING with the attempt number it was claimed with): a worker that missed its
+heartbeats long enough for the job to be claimed again discards its result.
+"""
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from apps.core.models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def job(name):
+    """Register the decorated function as the handler for jobs called ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_handler(name):
+    return _registry.get(name)
+
+
+def autodiscover():
+    """Import ``jobs`` modules from installed apps so their handlers register."""
+    autodiscover_modules('jobs')
+
+
+def enqueue(name, params=None, user=None):
+    """Create a pending job. Raises ValueError for unknown job names."""
+    if name not in _registry:
+        raise ValueError(f'Unknown job "{name}".')
+    return Job.objects.create(name=name, params=params or {}, created_by=user)
+
+
+def release(job_ids, error):
+    """
+    Give RUNNING jobs whose worker died back to the queue, or fail those already
+    attempted JOB_MAX_ATTEMPTS times (a job that kills its worker stops there).
+    """
+    now = timezone.now()
+    running = Job.objects.filter(pk__in=job_ids, status='RUNNING')
+    running.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS).update(
+        status='FAILED', error=error, finished_at=now, heartbeat_at=None, updated_at=now,
+    )
+    running.update(status='PENDING', error=error, started_at=None, heartbeat_at=None, updated_at=now)
+
+
+def reclaim_abandoned():
+    """Release RUNNING jobs whose lease expired: the process running them is gone."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LEASE_TIMEOUT)
+    abandoned = list(Job.objects.filter(status='RUNNING', heartbeat_at__lt=cutoff).values_list('pk', flat=True))
+    if abandoned:
+        logger.warning('Reclaiming jobs with an expired lease: %s', abandoned)
+        release(abandoned, f'Lease expired: no heartbeat for {settings.JOB_LEASE_TIMEOUT} seconds.')
+    return abandoned
+
+
+def claim_next():
+    """
+    Atomically move the oldest pending job to RUNNING and return its id.
+    SKIP LOCKED lets several workers poll the same table without blocking.
+    """
+    reclaim_abandoned()
+    with transaction.atomic():
+        job_obj = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='PENDING', deleted_at__isnull=True)
+            .order_by('created_at', 'id')
+            .only('id')
+            .first()
+        )
+        if job_obj is None:
+            return None
+        _start(Job.objects.filter(pk=job_obj.pk))
+        return job_obj.pk
+
+
+def _start(queryset):
+    """Mark the jobs of ``queryset`` RUNNING under a new attempt; returns how many were."""
+    now = timezone.now()
+    return queryset.update(
+        status='RUNNING', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1, updated_at=now,
+    )
+
+
+def _claim(job_obj):
+    """The job's row while ``job_obj``'s run still holds it: RUNNING, under the attempt it started."""
+    return Job.objects.filter(pk=job_obj.pk, status='RUNNING', attempts=job_obj.attempts)
+
+
+def _heartbeat(job_obj, stopped):
+    """Renew the lease of a running job until ``stopped`` is set (own thread, own connection)."""
+    try:
+        while not stopped.wait(settings.JOB_LEASE_TIMEOUT / 3):
+            _claim(job_obj).update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+
+def _finish(job_obj, status, **fields):
+    """Record the run's outcome, unless the job was reclaimed meanwhile; returns the status recorded."""
+    now = timezone.now()
+    if _claim(job_obj).update(status=status, finished_at=now, updated_at=now, **fields):
+        return status
+    logger.warning(
+        'Job %s (%s) was reclaimed while attempt %s ran; discarding its %s outcome.',
+        job_obj.pk, job_obj.name, job_obj.attempts, status,
+    )
+    return 'RECLAIMED'
+
+
+def run_job(job_id):
+    """Execute a claimed job and record its outcome. Returns the status recorded, RECLAIMED if none was."""
+    # A pending job run directly (inline debugging, tests) is claimed here.
+    _start(Job.objects.filter(pk=job_id, status='PENDING'))
+    job_obj = Job.objects.get(pk=job_id)
+    if job_obj.status != 'RUNNING':
+        return job_obj.status
+    handler = get_handler(job_obj.name)
+    stopped = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job_obj, stopped), daemon=True).start()
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job "{job_obj.name}".')
+        result = handler(job_obj, **job_obj.params)
+    except Exception:
+        logger.exception('Job %s (%s) failed', job_obj.pk, job_obj.name)
+        return _finish(job_obj, 'FAILED', error=traceback.format_exc())
+    finally:
+        stopped.set()
+    return _finish(job_obj, 'SUCCEEDED', progress=100, result=result)
@@ -0,0 +1,32 @@
+"""
+URL helpers that postpone imports until the first request that needs them.
+
+Used by the production startup mode (DEFER_ADMIN_AND_DOCS) so worker boots and
+management commands do not pay for the admin and API documentation modules.
+"""
+from django.urls import URLResolver
+from django.urls.resolvers import RoutePattern
+from django.utils.module_loading import import_string
+from django.views.decorators.csrf import csrf_exempt
+
+
+def lazy_view(view_path, **initkwargs):
+    """Class-based view imported and built on its first request."""
+    resolved = None
+
+    @csrf_exempt
+    def view(request, *args, **kwargs):
+        nonlocal resolved
+        if resolved is None:
+            resolved = import_string(view_path).as_view(**initkwargs)
+        return resolved(request, *args, **kwargs)
+
+    return view
+
+
+def lazy_include(route, urlconf_module):
+    """
+    Like path(route, include(urlconf_module)), but the module is imported when a
+    URL under ``route`` is first resolved or reversed, not when this URLconf loads.
+    """
+    return URLResolver(RoutePattern(route, is_endpoint=False), urlconf_module)
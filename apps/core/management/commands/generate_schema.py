@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.schema import write_schema
+
+
+class Command(BaseCommand):
+    help = 'Render the OpenAPI schema (YAML and JSON, precompressed) into the directory served by /api/schema/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=settings.OPENAPI_SCHEMA_DIR,
+            help='Output directory. Defaults to OPENAPI_SCHEMA_DIR.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError('Set OPENAPI_SCHEMA_DIR or pass --dir.')
+        for path in write_schema(options['dir']):
+            self.stdout.write(f'{path} ({path.stat().st_size:,} bytes)')
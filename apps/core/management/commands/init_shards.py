@@ -0,0 +1,38 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from apps.banks.models import Bank
+from apps.clients.models import Client
+from apps.core.sharding import SHARD_ID_SPAN, replicate_bank, shard_aliases
+from apps.credits.models import Credit
+
+
+class Command(BaseCommand):
+    help = 'Migrate the SHARD_DATABASES, give every shard its own id range and copy the banks to them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-migrate', action='store_true', help='Only set the id ranges and copy the banks.')
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        for index, alias in enumerate(aliases):
+            connection = connections[alias]
+            if connection.vendor != 'postgresql':
+                raise CommandError(f'Shard "{alias}" is not a PostgreSQL database.')
+            if index and not options['skip_migrate']:
+                call_command('migrate', database=alias, verbosity=options['verbosity'], interactive=False)
+            low, high = index * SHARD_ID_SPAN, (index + 1) * SHARD_ID_SPAN
+            with connection.cursor() as cursor:
+                for model in (Client, Credit):
+                    table = model._meta.db_table
+                    # The next id after the newest one of this shard's range (ids moved in keep theirs).
+                    cursor.execute(
+                        f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE("
+                        f'(SELECT MAX(id) FROM {connection.ops.quote_name(table)} WHERE id > %s AND id <= %s), %s'
+                        f') + 1, false)',
+                        [table, low, high, low],
+                    )
+        for bank in Bank._base_manager.using(DEFAULT_DB_ALIAS).iterator():
+            replicate_bank(Bank, bank)
+        self.stdout.write(f'Initialized {len(aliases)} shards.')
@@ -0,0 +1,183 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+
+from apps.banks.models import Bank
+from apps.clients.models import Client
+from apps.core.sharding import shard_aliases
+from apps.credits.models import ClientCreditSummary, Credit
+from apps.credits.summaries import refresh_client_summaries
+
+
+def _copy(model, rows, target):
+    """Insert ``rows`` on ``target`` as they are (ids and timestamps kept), overwriting earlier copies."""
+    fields = list(model._meta.concrete_fields)
+    # raw: auto_now and auto_now_add would otherwise stamp the copies with the current time.
+    model._base_manager.using(target)._insert(
+        rows, fields=fields, raw=True, using=target, on_conflict=OnConflict.UPDATE,
+        update_fields=[field for field in fields if not field.primary_key],
+        unique_fields=[model._meta.pk],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Move the clients and credits of banks to another shard, keeping their ids.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('bank_ids', nargs='+', type=int, help='Banks to move.')
+        parser.add_argument('--to', required=True, help='Database alias of the destination shard.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT and DELETE batch.')
+        parser.add_argument(
+            '--grace', type=int, default=None,
+            help='Seconds the source rows are kept after the switch, for processes still reading them '
+                 '(default: RELATED_CACHE_TIMEOUT, the longest a process keeps its bank map).',
+        )
+
+    def handle(self, *args, **options):
+        target = options['to']
+        if target not in shard_aliases():
+            raise CommandError(f'"{target}" is not one of the shards: {", ".join(shard_aliases())}.')
+        banks = list(Bank._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__in=options['bank_ids']))
+        missing = set(options['bank_ids']) - {bank.pk for bank in banks}
+        if missing:
+            raise CommandError(f'Unknown banks: {", ".join(map(str, sorted(missing)))}.')
+
+        by_source = {}
+        for bank in banks:
+            # As stored, not as this process's bank map has it.
+            by_source.setdefault(bank.shard or DEFAULT_DB_ALIAS, []).append(bank)
+        grace = settings.RELATED_CACHE_TIMEOUT if options['grace'] is None else options['grace']
+        for source, source_banks in by_source.items():
+            if source == target:
+                continue
+            moved = self.move(source_banks, source, target, options['batch_size'], grace)
+            self.stdout.write(
+                f'Moved banks {", ".join(str(bank.pk) for bank in source_banks)} from {source} to {target}: '
+                f'{moved[Client]} clients, {moved[Credit]} credits.'
+            )
+
+    def check_colocated(self, bank_ids, source):
+        """Refuse to split a credit from its client: both have to move with their banks."""
+        credits = Credit._base_manager.using(source)
+        strays = credits.filter(
+            Q(bank_id__in=bank_ids) & ~Q(client__bank_id__in=bank_ids)
+            | Q(client__bank_id__in=bank_ids) & ~Q(bank_id__in=bank_ids)
+        )
+        related = set()
+        for bank_id, client_bank_id in strays.values_list('bank_id', 'client__bank_id').distinct():
+            related.update({bank_id, client_bank_id})
+        related -= {*bank_ids, None}
+        if related or strays.exists():
+            others = ', '.join(map(str, sorted(related))) or 'clients without a bank'
+            raise CommandError(f'Credits link these banks to {others}; move them together.')
+
+    def move(self, banks, source, target, batch_size, grace):
+        bank_ids = [bank.pk for bank in banks]
+        self.check_colocated(bank_ids, source)
+        querysets = {
+            Client: Client._base_manager.using(source).filter(bank_id__in=bank_ids),
+            Credit: Credit._base_manager.using(source).filter(bank_id__in=bank_ids),
+        }
+
+        # pk -> updated_at of every row copied, as copied.
+        copied = {model: {} for model in querysets}
+        for model, queryset in querysets.items():
+            self.copy(model, queryset, target, batch_size, copied[model])
+        # A first cut of the copied clients' summaries; they are recomputed once the rows have caught up.
+        client_ids = sorted(copied[Client])
+        for start in range(0, len(client_ids), batch_size):
+            summaries = ClientCreditSummary._base_manager.using(source).filter(pk__in=client_ids[start:start + batch_size])
+            self.copy(ClientCreditSummary, summaries, target, batch_size, {})
+
+        # Switch over. Saving a bank rewrites its copy on every shard, which waits for the writes
+        # in flight on the source and fences later ones off it (apps.core.sharding.fence).
+        for bank in banks:
+            bank.shard = target
+            bank.save(update_fields=['shard'])
+        # Rows written to the source before the switch, until a round finds none left.
+        while self.catch_up(querysets, target, batch_size, copied):
+            pass
+        client_ids = list(copied[Client])
+        for start in range(0, len(client_ids), batch_size):
+            batch = client_ids[start:start + batch_size]
+            refresh_client_summaries(
+                Client._base_manager.using(target).filter(pk__in=batch).values_list('pk', flat=True), using=target,
+            )
+
+        if grace:
+            # Processes whose bank map predates the switch still read the source until they reload it.
+            self.stdout.write(f'Keeping the source rows on {source} for {grace} seconds.')
+            time.sleep(grace)
+        return self.delete_copied(querysets, batch_size, copied)
+
+    def copy(self, model, queryset, target, batch_size, copied):
+        last_pk = None
+        queryset = queryset.order_by('pk')
+        while True:
+            # Keyset over pk: each batch is one short read and one INSERT.
+            batch = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic(using=target):
+                _copy(model, batch, target)
+            copied.update((row.pk, getattr(row, 'updated_at', None)) for row in batch)
+            last_pk = batch[-1].pk
+
+    def catch_up(self, querysets, target, batch_size, copied):
+        """
+        Copy the rows added or changed on the source since they were copied and drop
+        the copies of rows deleted there. Copies written to on the target since the
+        switch are left as they are. Returns how many rows it changed.
+        """
+        changed = 0
+        for model, queryset in querysets.items():
+            versions = dict(queryset.order_by().values_list('pk', 'updated_at').iterator(chunk_size=batch_size))
+            stale = [pk for pk, updated_at in versions.items() if copied[model].get(pk) != updated_at]
+            gone = [pk for pk in copied[model] if pk not in versions]
+            for start in range(0, len(stale), batch_size):
+                pks = stale[start:start + batch_size]
+                on_target = dict(model._base_manager.using(target).filter(pk__in=pks).values_list('pk', 'updated_at'))
+                # Untouched since copied, or new on the source (a copy deleted on the target stays deleted).
+                rows = [row for row in queryset.filter(pk__in=pks) if on_target.get(row.pk) == copied[model].get(row.pk)]
+                with transaction.atomic(using=target):
+                    _copy(model, rows, target)
+                copied[model].update((pk, versions[pk]) for pk in pks)
+                changed += len(rows)
+            for start in range(0, len(gone), batch_size):
+                pks = gone[start:start + batch_size]
+                on_target = model._base_manager.using(target).filter(pk__in=pks).values_list('pk', 'updated_at')
+                untouched = [pk for pk, updated_at in on_target if copied[model][pk] == updated_at]
+                model._base_manager.using(target).filter(pk__in=untouched).delete()
+                for pk in pks:
+                    del copied[model][pk]
+                changed += len(pks)
+        return changed
+
+    def delete_copied(self, querysets, batch_size, copied):
+        """Delete the source rows still as they were copied; anything else is left there and reported."""
+        moved = {}
+        # Credits first: deleting a client would take its credits along.
+        for model in (Credit, Client):
+            moved[model] = 0
+            pks = sorted(copied[model])
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                with transaction.atomic(using=querysets[model].db):
+                    rows = querysets[model].filter(pk__in=batch)
+                    if model is Client:
+                        rows = rows.filter(credits__isnull=True)
+                    rows = rows.select_for_update(of=('self',))
+                    doomed = [pk for pk, updated_at in rows.values_list('pk', 'updated_at') if copied[model][pk] == updated_at]
+                    # A plain delete: summaries are already on the target (the client's go with it),
+                    # cached clients are evicted.
+                    model._base_manager.using(querysets[model].db).filter(pk__in=doomed).delete()
+                moved[model] += len(doomed)
+            left = querysets[model].count()
+            if left:
+                self.stderr.write(f'{left} {model._meta.verbose_name_plural} changed on the source after the switch were left there.')
+        return moved
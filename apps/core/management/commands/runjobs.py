@@ -0,0 +1,98 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.core import workers
+from apps.core.jobs import claim_next, release, run_job
+from apps.core.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Claim pending background jobs from the database and run them in a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes. 0 runs jobs inline in this process.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds to wait between polls when the queue is empty.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit once the queue is drained instead of polling forever.',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 0:
+            self._run_inline(options)
+        else:
+            self._run_pool(options)
+
+    def _run_inline(self, options):
+        while True:
+            job_id = claim_next()
+            if job_id is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            status = run_job(job_id)
+            self.stdout.write(f'Job {job_id}: {status}')
+
+    def _new_pool(self, max_workers):
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=workers.get_context(), initializer=workers.setup)
+
+    def _run_pool(self, options):
+        max_workers = options['workers']
+        in_flight = {}
+        pool = self._new_pool(max_workers)
+        try:
+            while True:
+                try:
+                    while len(in_flight) < max_workers:
+                        job_id = claim_next()
+                        if job_id is None:
+                            break
+                        # Tracked before submit(), so a broken pool releases this job too.
+                        in_flight[job_id] = None
+                        in_flight[job_id] = pool.submit(workers.run_job, job_id)
+
+                    if not in_flight:
+                        if options['once']:
+                            return
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    futures = {future: job_id for job_id, future in in_flight.items()}
+                    done, _ = wait(futures, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = futures[future]
+                        try:
+                            status = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as exc:
+                            # The job could not be run in the worker (e.g. unpicklable); run_job never recorded it.
+                            Job.objects.filter(pk=job_id).update(
+                                status='FAILED', error=repr(exc), finished_at=timezone.now(), updated_at=timezone.now()
+                            )
+                            status = 'FAILED'
+                        del in_flight[job_id]
+                        self.stdout.write(f'Job {job_id}: {status}')
+                except BrokenProcessPool as exc:
+                    # A worker process died (killed, out of memory): every job in the pool is lost with it.
+                    # They go back to the queue, and a job that keeps killing workers fails after
+                    # JOB_MAX_ATTEMPTS.
+                    self.stderr.write(f'Worker pool broke ({exc}); requeueing jobs {", ".join(map(str, in_flight))}.')
+                    release(list(in_flight), f'Worker process died: {exc!r}')
+                    in_flight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self._new_pool(max_workers)
+        finally:
+            pool.shutdown()
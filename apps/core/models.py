@@ -1,4 +1,30 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    """QuerySet with set-based soft delete and restore (a single UPDATE each)."""
+
+    def create(self, **kwargs):
+        from apps.core.sharding import BankMoved, instance_shard, is_sharded
+
+        if self._db is None and is_sharded(self.model):
+            # Insert on the shard of the new row's bank, not wherever the queryset would read.
+            try:
+                return self.using(instance_shard(self.model(**kwargs))).create(**kwargs)
+            except BankMoved:
+                # The bank map was stale and has been reloaded.
+                return self.using(instance_shard(self.model(**kwargs))).create(**kwargs)
+        return super().create(**kwargs)
+
+    def soft_delete(self):
+        now = timezone.now()
+        return self.filter(deleted_at__isnull=True).update(deleted_at=now, updated_at=now)
+
+    def restore(self):
+        return self.filter(deleted_at__isnull=False).update(deleted_at=None, updated_at=timezone.now())
 
 
 class BaseModel(models.Model):
@@ -12,8 +38,81 @@ class BaseModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
+    objects = SoftDeleteQuerySet.as_manager()
+
+    # Resource name used for change events; models leaving it None publish nothing.
+    event_resource = None
+    # Fields whose changes are kept in the audit history (apps.core.history); empty keeps none.
+    history_fields = ()
+
     class Meta:
         abstract = True
+        indexes = [
+            # Backs the change feed: rows changed since a (updated_at, id) cursor.
+            models.Index(fields=['updated_at', 'id'], name='%(app_label)s_%(class)s_updated_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the values loaded from the database so saves can tell what changed."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    @property
+    def loaded_values(self):
+        """Column values (by attname) as last read from or written to the database, None if unsaved."""
+        return getattr(self, '_loaded_values', None)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        was_deleted = (self.loaded_values or {}).get('deleted_at') is not None
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if self.event_resource:
+            self._publish_event(adding, was_deleted)
+        if self.history_fields:
+            self._record_history(adding, was_deleted, update_fields)
+        deferred = self.get_deferred_fields()
+        saved = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+            and (update_fields is None or field.name in update_fields or field.attname in update_fields)
+        }
+        if update_fields is None or self.loaded_values is None:
+            self._loaded_values = saved
+        else:
+            self._loaded_values.update(saved)
+
+    def event_payload(self):
+        """Extra event fields subscribers can filter on (e.g. bank, credit_type)."""
+        return {}
+
+    def _change_action(self, adding, was_deleted):
+        if adding:
+            return 'insert'
+        if self.deleted_at is not None and not was_deleted:
+            return 'delete'
+        if self.deleted_at is None and was_deleted:
+            return 'restore'
+        return 'update'
+
+    def _publish_event(self, adding, was_deleted):
+        from apps.core import events
+
+        events.publish({
+            'resource': self.event_resource,
+            'id': self.pk,
+            'event': self._change_action(adding, was_deleted),
+            'updated_at': self.updated_at.isoformat(),
+            **self.event_payload(),
+        }, using=self._state.db)
+
+    def _record_history(self, adding, was_deleted, update_fields=None):
+        from apps.core import history
+
+        history.record(self, self._change_action(adding, was_deleted), update_fields)
 
     @property
     def is_deleted(self):
@@ -22,7 +121,6 @@ class BaseModel(models.Model):
 
     def soft_delete(self):
         """Perform a soft delete by setting deleted_at to current time."""
-        from django.utils import timezone
         self.deleted_at = timezone.now()
         self.save(update_fields=['deleted_at', 'updated_at'])
 
@@ -30,3 +128,111 @@ class BaseModel(models.Model):
         """Restore a soft-deleted record."""
         self.deleted_at = None
         self.save(update_fields=['deleted_at', 'updated_at'])
+
+
+class Job(BaseModel):
+    """
+    Background job stored in the database and executed by the runjobs worker.
+    Handlers are registered by name in each app's jobs.py module.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    progress = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.FileField(upload_to='jobs/', blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs'
+    )
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Lease of a RUNNING job: renewed while it runs, reclaimed by any worker once JOB_LEASE_TIMEOUT old.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='core_job_status_created_idx'),
+        ]
+
+    def set_progress(self, progress):
+        """Persist job progress (0-100) without touching the rest of the row."""
+        self.progress = max(0, min(100, int(progress)))
+        now = timezone.now()
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, heartbeat_at=now, updated_at=now)
+
+    def store_result_file(self, filename, content):
+        """Save ``content`` (a django File) on the default storage as this job's result file."""
+        self.result_file.save(f'{self.pk}/{filename}', content, save=False)
+        # Only while this run holds the job: a run the job was reclaimed from must not replace the file.
+        Job.objects.filter(pk=self.pk, status='RUNNING', attempts=self.attempts).update(
+            result_file=self.result_file.name,
+        )
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response stored for an Idempotency-Key sent with a create or update, replayed on
+    retries with the same key until it expires (purge_idempotency_keys deletes it).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # sha256 of method, path and request data: a key reused for a different request is refused.
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Race guard: of two concurrent requests with one key, only one insert succeeds.
+            models.UniqueConstraint(fields=['user', 'key'], name='core_idempotencykey_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='core_idemkey_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code})"
+
+
+class HistoryEntry(models.Model):
+    """
+    One recorded save of a model with ``history_fields``: the action and, for
+    each tracked field that changed, its [old, new] values. Append-only.
+    """
+    ACTION_CHOICES = [
+        ('insert', 'Insert'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+        ('restore', 'Restore'),
+    ]
+
+    resource = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'history entries'
+        indexes = [
+            # Backs the per-object history endpoints: newest first, paged by id cursor.
+            models.Index(fields=['resource', 'object_id', 'id'], name='core_history_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource} {self.object_id} {self.action}"
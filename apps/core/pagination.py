@@ -0,0 +1,188 @@
+"""
+Page number pagination with a client-selectable page size and an optional
+count estimate.
+
+``?page_size=`` is capped at PAGINATION_MAX_PAGE_SIZE. With ``?count=estimate``
+the total comes from the PostgreSQL planner instead of a COUNT(*) over the
+filtered rows; small results (below PAGINATION_ESTIMATE_THRESHOLD, where
+estimates are least reliable and COUNT(*) is cheap) are counted exactly and the
+count is cached briefly per query. Pages are then fetched one row long to tell
+whether a next page exists, so navigation never depends on the estimate.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.core.sharding import ScatterGather
+
+
+def planner_estimate(queryset):
+    """Row count estimated by the PostgreSQL planner for ``queryset``, None on other databases."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def cached_count(queryset):
+    """Exact COUNT(*) cached for PAGINATION_COUNT_CACHE_TIMEOUT seconds per query signature."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    signature = hashlib.sha256(repr((queryset.db, sql, params)).encode()).hexdigest()
+    key = f'page-count:{signature}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class LookaheadPage(Page):
+    """Page that knows whether a next page exists without knowing the total."""
+
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count is a planner estimate for large results. Page numbers
+    are only checked against the rows actually present, never the estimate.
+    Also usable as ModelAdmin.paginator.
+    """
+
+    count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, ScatterGather):
+            # Estimated and counted shard by shard.
+            querysets = [self.object_list.queryset.using(alias) for alias in self.object_list.aliases]
+        elif hasattr(self.object_list, 'query'):
+            querysets = [self.object_list]
+        else:
+            return super().count
+        estimates = [planner_estimate(queryset) for queryset in querysets]
+        if None not in estimates and sum(estimates) >= settings.PAGINATION_ESTIMATE_THRESHOLD:
+            self.count_is_estimate = True
+            return sum(estimates)
+        return sum(cached_count(queryset) for queryset in querysets)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        return LookaheadPage(rows[:self.per_page], number, self, more=len(rows) > self.per_page)
+
+
+class StandardPagination(PageNumberPagination):
+    """Default API pagination: ?page=, ?page_size= (capped) and ?count=estimate."""
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    count_query_description = (
+        '"estimate" to return a planner estimate of the total instead of counting every matching row.'
+    )
+
+    @property
+    def max_page_size(self):
+        return settings.PAGINATION_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.estimate = request.query_params.get(self.count_query_param) == 'estimate'
+        self.django_paginator_class = EstimatedCountPaginator if self.estimate else Paginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_envelope(self):
+        envelope = {
+            'count': self.page.paginator.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.estimate:
+            envelope['count_is_estimate'] = self.page.paginator.count_is_estimate
+        return envelope
+
+    def get_paginated_response(self, data):
+        return Response({**self.get_envelope(), 'results': data})
+
+    def get_streaming_response(self, serializer):
+        """
+        The same JSON body as get_paginated_response, encoded one row at a time so
+        the full payload is never held in memory (and is compressed as it goes).
+        """
+        def dumps(value):
+            return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode()
+
+        def chunks():
+            yield dumps(self.get_envelope())[:-1] + b',"results":['
+            for index, instance in enumerate(serializer.instance):
+                yield (b',' if index else b'') + dumps(serializer.child.to_representation(instance))
+            yield b']}'
+
+        return StreamingHttpResponse(chunks(), content_type='application/json')
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count_is_estimate'] = {
+            'type': 'boolean',
+            'description': 'Present with ?count=estimate; true when count is a planner estimate.',
+        }
+        return schema
+
+    def get_schema_operation_parameters(self, view):
+        parameters = super().get_schema_operation_parameters(view)
+        parameters.append({
+            'name': self.count_query_param,
+            'required': False,
+            'in': 'query',
+            'description': self.count_query_description,
+            'schema': {'type': 'string', 'enum': ['exact', 'estimate']},
+        })
+        return parameters
+
+
+class StreamingListMixin:
+    """
+    Viewset mixin streaming JSON list pages of at least LIST_STREAMING_MIN_ROWS
+    rows instead of rendering the whole body first.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.get_serializer(queryset, many=True).data)
+        serializer = self.get_serializer(page, many=True)
+        if len(page) >= settings.LIST_STREAMING_MIN_ROWS and isinstance(request.accepted_renderer, JSONRenderer):
+            return self.paginator.get_streaming_response(serializer)
+        return self.get_paginated_response(serializer.data)
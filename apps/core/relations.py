@@ -0,0 +1,184 @@
+"""
+Cached foreign key resolution for serializers.
+
+PrimaryKeyRelatedField runs ``queryset.get(pk=...)`` for every related id it
+validates. CachedRelatedField resolves ids from a cache instead:
+
+- ``versioned``: every active row of a small, rarely changing table (banks)
+  held in process and reloaded when the version in the shared cache changes
+  (any save or delete bumps it) or after RELATED_CACHE_TIMEOUT seconds. Ids
+  missing from it are looked up with one ``pk__in`` query, so rows created by
+  another process are found even when the version key is not shared (a
+  process-local cache, see CACHE_URL).
+- ``ttl``: rows cached one by one in the shared cache for
+  RELATED_CACHE_ROW_TIMEOUT seconds (clients); misses are fetched with one
+  ``pk__in`` query, and list payloads warm every id they reference at once.
+
+Missing and soft-deleted targets fail with PrimaryKeyRelatedField's errors.
+Soft deletes done with queryset.update() bypass the invalidation and are
+picked up when the cached entries expire.
+"""
+import copy
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from rest_framework import serializers
+
+
+def _active(model):
+    return model._default_manager.filter(deleted_at__isnull=True)
+
+
+class VersionedModelCache:
+    """All active rows of ``model``, kept in process and invalidated through a shared version key."""
+
+    def __init__(self, model):
+        self.model = model
+        self.version_key = f'related:{model._meta.label_lower}:version'
+        self._rows, self._version, self._loaded_at = {}, None, 0.0
+        self._lock = threading.Lock()
+        post_save.connect(self.invalidate, sender=model, weak=False)
+        post_delete.connect(self.invalidate, sender=model, weak=False)
+
+    def invalidate(self, **kwargs):
+        # Again once committed: a process reloading in between would not have seen the change yet.
+        self._bump()
+        transaction.on_commit(self._bump)
+
+    def _bump(self):
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+
+    def _current(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # First use, or evicted: start a version every process will pick up.
+            cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.version_key)
+        with self._lock:
+            if version != self._version or time.monotonic() - self._loaded_at > settings.RELATED_CACHE_TIMEOUT:
+                self._rows = self.load()
+                self._version, self._loaded_at = version, time.monotonic()
+            return self._rows
+
+    def load(self):
+        return {row.pk: row for row in _active(self.model)}
+
+    def reload(self):
+        """Drop the rows held by this process; the next lookup reads them again."""
+        with self._lock:
+            self._version = None
+
+    def get_many(self, pks):
+        rows = self._current()
+        # Copies: callers attach these to new objects and must not share one instance.
+        found = {pk: copy.copy(rows[pk]) for pk in pks if pk in rows}
+        missing = set(pks) - set(found)
+        if missing:
+            fetched = {row.pk: row for row in _active(self.model).filter(pk__in=missing)}
+            if fetched:
+                # Created since the snapshot was loaded, so it is out of date.
+                self.reload()
+            found.update(fetched)
+        return found
+
+
+class TTLModelCache:
+    """Active rows of ``model`` cached one by one in the shared cache for a short time."""
+
+    def __init__(self, model):
+        self.model = model
+        self.prefix = f'related:{model._meta.label_lower}:'
+        post_save.connect(self.invalidate, sender=model, weak=False)
+        post_delete.connect(self.invalidate, sender=model, weak=False)
+
+    def invalidate(self, instance, **kwargs):
+        key = f'{self.prefix}{instance.pk}'
+        cache.delete(key)
+        transaction.on_commit(lambda: cache.delete(key))
+
+    def get_many(self, pks):
+        found = {int(key[len(self.prefix):]): row for key, row in cache.get_many(
+            [f'{self.prefix}{pk}' for pk in pks]
+        ).items()}
+        missing = set(pks) - set(found)
+        if missing:
+            from apps.core.sharding import scatter
+
+            fetched = {row.pk: row for row in scatter(_active(self.model)).filter(pk__in=missing)}
+            cache.set_many(
+                {f'{self.prefix}{pk}': row for pk, row in fetched.items()}, timeout=settings.RELATED_CACHE_ROW_TIMEOUT
+            )
+            found.update(fetched)
+        return found
+
+
+CACHE_CLASSES = {'versioned': VersionedModelCache, 'ttl': TTLModelCache}
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def model_cache(model, kind):
+    """The process-wide cache of ``kind`` for ``model``."""
+    with _caches_lock:
+        if (model, kind) not in _caches:
+            _caches[(model, kind)] = CACHE_CLASSES[kind](model)
+        return _caches[(model, kind)]
+
+
+class CachedRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField resolving active ``model`` rows from a ``versioned`` or ``ttl`` cache."""
+
+    def __init__(self, model, cache='ttl', **kwargs):
+        self.model = model
+        self.cache_kind = cache
+        # Still used for the browsable API choices and the OpenAPI schema.
+        kwargs.setdefault('queryset', _active(model))
+        super().__init__(**kwargs)
+        self._prefetched = {}
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        try:
+            return self.model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            raise ValueError
+
+    def prefetch(self, values):
+        """Resolve ``values`` up front with one lookup (list payloads)."""
+        pks = set()
+        for value in values:
+            try:
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError):
+                pass
+        self._prefetched.update(model_cache(self.model, self.cache_kind).get_many(pks - set(self._prefetched)))
+
+    def to_internal_value(self, data):
+        try:
+            pk = self.to_pk(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk in self._prefetched:
+            return copy.copy(self._prefetched[pk])
+        instance = model_cache(self.model, self.cache_kind).get_many([pk]).get(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class CachedRelatedListSerializer(serializers.ListSerializer):
+    """Resolves every CachedRelatedField id of a list payload with one lookup per field."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            for name, field in self.child.fields.items():
+                if isinstance(field, CachedRelatedField) and not field.read_only:
+                    field.prefetch(item[name] for item in data if isinstance(item, dict) and item.get(name) is not None)
+        return super().to_internal_value(data)
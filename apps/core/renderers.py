@@ -0,0 +1,119 @@
+"""
+Binary MessagePack and CBOR bodies for services exchanging large payloads.
+
+Clients pick the format through content negotiation: ``Accept`` (or
+``?format=msgpack`` / ``?format=cbor``) for responses and ``Content-Type`` for
+request bodies. With a binary renderer, serializers using
+NativeValuesSerializerMixin hand decimals, dates and timestamps to the encoder as
+they are instead of formatting them as strings, and each format encodes them
+losslessly:
+
+- MessagePack: timestamps as the Timestamp extension type (-1), decimals as
+  their exact ``'1234.50'`` string (the format has no decimal type), dates as
+  ISO strings.
+- CBOR: decimals as decimal fractions (tag 4), timestamps as RFC 3339 strings
+  (tag 0, epoch floats would round microseconds) and dates as tag 1004.
+
+The parsers decode these back (MessagePack decimals stay strings), and the
+serializer fields accept the native values as they accept strings.
+
+The msgpack and cbor2 packages are imported on the first binary request, not
+when the renderer classes load with every process.
+"""
+import decimal
+
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ExactJSONEncoder(JSONEncoder):
+    """DRF's JSON encoder, writing decimals as exact strings rather than floats."""
+
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return format(obj, 'f')
+        return super().default(obj)
+
+
+_default = ExactJSONEncoder().default
+
+
+def _msgpack_default(value):
+    # Aware datetimes are packed natively; naive ones come here and are sent as ISO strings.
+    return _default(value)
+
+
+def _cbor_default(encoder, value):
+    encoder.encode(_default(value))
+
+
+class NativeValuesSerializerMixin:
+    """Serializer mixin keeping decimals, dates and timestamps native when the renderer encodes them itself."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        renderer = getattr(self.context.get('request'), 'accepted_renderer', None)
+        if getattr(renderer, 'native_values', False):
+            for field in fields.values():
+                if isinstance(field, serializers.DecimalField):
+                    field.coerce_to_string = False
+                elif isinstance(field, (serializers.DateTimeField, serializers.DateField)):
+                    field.format = None
+        return fields
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    native_values = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, datetime=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        import msgpack
+
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class CBORRenderer(BaseRenderer):
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+    native_values = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import cbor2
+
+        if data is None:
+            return b''
+        return cbor2.dumps(data, default=_cbor_default)
+
+
+class CBORParser(BaseParser):
+    media_type = 'application/cbor'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        import cbor2
+
+        try:
+            return cbor2.loads(stream.read())
+        except (cbor2.CBORError, ValueError, TypeError) as exc:
+            raise ParseError(f'CBOR parse error - {exc}')
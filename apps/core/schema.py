@@ -0,0 +1,155 @@
+"""
+OpenAPI schema precomputed to disk and served as a static file.
+
+``manage.py generate_schema`` renders the drf-spectacular schema into
+OPENAPI_SCHEMA_DIR as ``schema.yaml`` and ``schema.json``, each with
+precompressed copies (``.gz``, ``.br``, ``.zst``). /api/schema/ serves those
+bytes from memory with a content-hash ETag, picking the copy that matches the
+client's Accept-Encoding. The schema is generated in-process only when the
+files are missing, and then written back for the next process.
+"""
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+
+from apps.core.compression import COMPRESSORS, negotiate
+
+FORMATS = {
+    'yaml': ('schema.yaml', 'application/vnd.oai.openapi'),
+    'json': ('schema.json', 'application/vnd.oai.openapi+json'),
+}
+EXTENSIONS = {'gzip': '.gz', 'br': '.br', 'zstd': '.zst'}
+# Precompressed once at build time, so the slowest, smallest settings are affordable.
+PRECOMPRESS_LEVELS = {'gzip': 9, 'br': 11, 'zstd': 19}
+
+# (directory, format) -> (modification time, etag, {encoding or None: bytes})
+_loaded = {}
+_lock = threading.Lock()
+
+
+def render_schema():
+    """The API schema rendered in every format, as {format: bytes}."""
+    from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    schema = spectacular_settings.DEFAULT_GENERATOR_CLASS().get_schema(request=None, public=True)
+    return {
+        'yaml': OpenApiYamlRenderer().render(schema, renderer_context={}),
+        'json': OpenApiJsonRenderer().render(schema, renderer_context={}),
+    }
+
+
+def precompress(content):
+    """``content`` under every available encoding, as {encoding or None: bytes}."""
+    variants = {None: content}
+    for encoding, factory in COMPRESSORS.items():
+        push, finish = factory(PRECOMPRESS_LEVELS[encoding])
+        variants[encoding] = push(content) + finish()
+    return variants
+
+
+def _write(path, content):
+    # Written next to the target and renamed: a concurrent reader never sees half a file.
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    temporary.write_bytes(content)
+    os.replace(temporary, path)
+
+
+def write_schema(directory, rendered=None):
+    """Write every format and encoding of the schema into ``directory``; returns the paths."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rendered = rendered or render_schema()
+    paths = []
+    for fmt, (filename, _) in FORMATS.items():
+        variants = precompress(rendered[fmt])
+        # Compressed copies first: the plain file's mtime marks a complete set.
+        for encoding, extension in EXTENSIONS.items():
+            if encoding in variants:
+                paths.append(directory / (filename + extension))
+                _write(paths[-1], variants[encoding])
+        paths.append(directory / filename)
+        _write(paths[-1], variants[None])
+    return paths
+
+
+def _read(path):
+    variants = {None: path.read_bytes()}
+    for encoding, extension in EXTENSIONS.items():
+        compressed = path.with_name(path.name + extension)
+        if encoding in COMPRESSORS and compressed.is_file():
+            variants[encoding] = compressed.read_bytes()
+    return variants
+
+
+def _entry(variants):
+    digest = hashlib.sha256(variants[None]).hexdigest()[:32]
+    return digest, variants
+
+
+def load_schema(fmt):
+    """(etag, {encoding or None: bytes}) of the schema in ``fmt``, generating it if missing."""
+    directory = Path(settings.OPENAPI_SCHEMA_DIR) if settings.OPENAPI_SCHEMA_DIR else None
+    path = directory / FORMATS[fmt][0] if directory else None
+    key = (directory, fmt)
+    mtime = path.stat().st_mtime_ns if path and path.is_file() else None
+
+    cached = _loaded.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1:]
+    with _lock:
+        cached = _loaded.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1:]
+        if mtime is not None:
+            _loaded[key] = (mtime, *_entry(_read(path)))
+            return _loaded[key][1:]
+
+        rendered = render_schema()
+        if directory:
+            try:
+                write_schema(directory, rendered)
+            except OSError:
+                pass  # Read-only image: keep serving the in-memory copy.
+        for other, content in rendered.items():
+            other_path = directory / FORMATS[other][0] if directory else None
+            other_mtime = other_path.stat().st_mtime_ns if other_path and other_path.is_file() else None
+            _loaded[(directory, other)] = (other_mtime, *_entry(precompress(content)))
+        return _loaded[key][1:]
+
+
+def requested_format(request):
+    if request.GET.get('format') in FORMATS:
+        return request.GET['format']
+    return 'json' if 'json' in request.headers.get('Accept', '') else 'yaml'
+
+
+@require_safe
+def schema_view(request):
+    """The OpenAPI schema as YAML (default) or JSON (?format=json or a JSON Accept header)."""
+    fmt = requested_format(request)
+    digest, variants = load_schema(fmt)
+    encoding = negotiate(request.headers.get('Accept-Encoding', ''))
+    if encoding not in variants:
+        encoding = None
+    # One strong validator per representation: the bytes differ per format and encoding.
+    etag = f'"{digest}-{fmt}-{encoding}"' if encoding else f'"{digest}-{fmt}"'
+
+    if_none_match = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+    if etag in if_none_match or '*' in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(variants[encoding], content_type=FORMATS[fmt][1])
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    patch_cache_control(response, public=True, max_age=settings.OPENAPI_SCHEMA_MAX_AGE)
+    return response
@@ -0,0 +1,168 @@
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from apps.core.models import HistoryEntry, Job
+from apps.core.renderers import ExactJSONEncoder
+
+FEED_RESOURCES = ['banks', 'clients', 'credits']
+
+
+def _split_csv(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _validate_resources(value):
+    resources = _split_csv(value)
+    unknown = set(resources) - set(FEED_RESOURCES)
+    if unknown:
+        raise serializers.ValidationError(f'Unknown resource "{sorted(unknown)[0]}".')
+    return resources
+
+
+class JobSerializer(serializers.ModelSerializer):
+    result_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'name', 'params', 'status', 'progress', 'result', 'result_url', 'error',
+            'started_at', 'finished_at', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+    def get_result_url(self, obj) -> str | None:
+        if not obj.result_file:
+            return None
+        return reverse('job-result', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+
+class JobProgressSerializer(serializers.ModelSerializer):
+    """Minimal payload for clients polling a running job."""
+
+    class Meta:
+        model = Job
+        fields = ['id', 'status', 'progress', 'updated_at']
+        read_only_fields = fields
+
+
+class HistoryEntrySerializer(serializers.ModelSerializer):
+    """One audit history entry; ``changes`` maps each changed field to [old, new]."""
+
+    class Meta:
+        model = HistoryEntry
+        fields = ['id', 'action', 'changes', 'changed_at']
+        read_only_fields = fields
+
+
+class ChangeFeedQuerySerializer(serializers.Serializer):
+    """Query parameters of the change feed."""
+    since = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100)
+    resources = serializers.CharField(required=False)
+
+    def validate_resources(self, value):
+        return _validate_resources(value)
+
+
+class ChangeSerializer(serializers.Serializer):
+    """One row change in the feed; ``data`` is the row as its list endpoint renders it."""
+    resource = serializers.ChoiceField(choices=['banks', 'clients', 'credits'])
+    id = serializers.IntegerField()
+    event = serializers.ChoiceField(choices=['insert', 'update', 'delete'])
+    updated_at = serializers.DateTimeField()
+    data = serializers.DictField()
+
+
+class ChangeFeedSerializer(serializers.Serializer):
+    """Page of the change feed (schema only)."""
+    results = ChangeSerializer(many=True)
+    next_cursor = serializers.CharField(allow_null=True)
+    has_more = serializers.BooleanField()
+
+
+class StreamQuerySerializer(serializers.Serializer):
+    """Subscription filters of the change event stream (comma-separated lists)."""
+    resources = serializers.CharField(required=False)
+    bank = serializers.CharField(required=False)
+    credit_type = serializers.CharField(required=False)
+
+    def validate_resources(self, value):
+        return _validate_resources(value)
+
+    def validate_bank(self, value):
+        try:
+            return [int(bank) for bank in _split_csv(value)]
+        except ValueError:
+            raise serializers.ValidationError('Expected a comma-separated list of bank ids.')
+
+    def validate_credit_type(self, value):
+        from apps.credits.models import Credit
+
+        credit_types = _split_csv(value)
+        valid = {choice for choice, _ in Credit.CREDIT_TYPE_CHOICES}
+        unknown = set(credit_types) - valid
+        if unknown:
+            raise serializers.ValidationError(f'Unknown credit type "{sorted(unknown)[0]}".')
+        return credit_types
+
+    def subscription_filters(self):
+        data = self.validated_data
+        return {
+            'resources': data.get('resources'),
+            'banks': data.get('bank'),
+            'credit_types': data.get('credit_type'),
+        }
+
+
+class SubRequestSerializer(serializers.Serializer):
+    """One call inside a composite batch request."""
+    id = serializers.CharField(max_length=100, required=False)
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField(max_length=2000)
+    # Bodies parsed from CBOR may hold decimals and datetimes.
+    body = serializers.JSONField(required=False, encoder=ExactJSONEncoder)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """Body of /api/batch/: up to BATCH_MAX_REQUESTS sub-requests run in order."""
+    requests = SubRequestSerializer(many=True, allow_empty=False)
+    consistent = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(f'At most {settings.BATCH_MAX_REQUESTS} requests per batch.')
+        return value
+
+    def validate(self, attrs):
+        if attrs['consistent'] and any(item['method'] != 'GET' for item in attrs['requests']):
+            raise serializers.ValidationError({'consistent': 'Consistent batches can only contain GET requests.'})
+        if attrs['consistent'] and settings.SHARD_DATABASES:
+            # Each database has its own snapshots: no single one covers the catalog and every shard.
+            raise serializers.ValidationError({'consistent': 'Consistent batches are not available with shards.'})
+        return attrs
+
+
+class SubResponseSerializer(serializers.Serializer):
+    """Outcome of one call inside a composite batch request."""
+    id = serializers.CharField(allow_null=True)
+    status = serializers.IntegerField()
+    headers = serializers.DictField(child=serializers.CharField())
+    body = serializers.JSONField(allow_null=True)
+
+
+class BatchResponseSerializer(serializers.Serializer):
+    """Response of /api/batch/ (schema only): one entry per sub-request, in order."""
+    responses = SubResponseSerializer(many=True)
+
+
+class GraphQLRequestSerializer(serializers.Serializer):
+    """Body of /api/graphql/."""
+    query = serializers.CharField(trim_whitespace=False)
+    variables = serializers.DictField(required=False, allow_null=True)
+    operationName = serializers.CharField(required=False, allow_null=True)
+
+
+class GraphQLResponseSerializer(serializers.Serializer):
+    """Response of /api/graphql/ (schema only)."""
+    data = serializers.DictField(allow_null=True, required=False)
+    errors = serializers.ListField(child=serializers.DictField(), required=False)
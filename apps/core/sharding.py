@@ -0,0 +1,468 @@
+"""
+Horizontal sharding of clients and credits by bank.
+
+The default database is shard 0 and also the catalog: users, jobs, history,
+idempotency keys and bank summaries live only there. Every bank row is copied
+to each extra shard (SHARD_DATABASES) so foreign keys to banks hold
+everywhere. A client or credit lives on the shard its bank is placed on
+(``Bank.shard``), with its client summary; a credit's client must share that
+shard, and clients without a bank live on the default database.
+
+ShardRouter sends reads and writes of those models to the shard of the
+instance at hand, or to the shard pinned with ``using_shard()``: saves pin
+their own, so summary updates follow the row. Writes touching the catalog too
+(bank summaries, idempotency keys, history) run inside ``atomic_on()``, one
+transaction per database with the catalog's committed last; catalog rows
+passed to ``queue_insert()`` are inserted together at the end of the block. ShardedViewSetMixin pins a
+request to one shard for ``?bank=`` filters and object URLs, and serves other
+lists through ScatterGather: the same query on every shard, merged in its
+ordering. ``init_shards`` gives each shard its own id range, so primary keys
+are unique across shards and rows keep them when ``rebalance_banks`` moves
+banks between shards.
+
+Each process holds the placements in BankShardMap, which may lag behind a
+move. Writes therefore ``fence()`` their bank's copy on the shard they write
+to: a write reaching a shard its bank left fails with BankMoved, and model
+saves decorated with ``follow_moved_banks`` run once more on the new shard.
+
+Without SHARD_DATABASES everything stays on the default database.
+"""
+import contextvars
+import functools
+import heapq
+import itertools
+import operator
+import threading
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import F
+from django.db.models.query import ModelIterable, ValuesListIterable
+from rest_framework import serializers
+from rest_framework.exceptions import APIException
+
+from apps.core.relations import VersionedModelCache
+
+# Ids of shard i start above i * SHARD_ID_SPAN (see init_shards).
+SHARD_ID_SPAN = 2 ** 40
+SHARDED_MODELS = {'clients.client', 'credits.credit', 'credits.clientcreditsummary'}
+
+_pinned = contextvars.ContextVar('pinned_shard', default=None)
+
+
+def shard_aliases():
+    """Database aliases holding clients and credits, the default one first."""
+    return [DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES]
+
+
+def is_sharded(model):
+    return bool(settings.SHARD_DATABASES) and model._meta.label_lower in SHARDED_MODELS
+
+
+class BankShardMap(VersionedModelCache):
+    """Shard of every bank (soft-deleted ones included), reloaded whenever a bank changes."""
+
+    def load(self):
+        return {pk: shard or DEFAULT_DB_ALIAS for pk, shard in self.model._base_manager.values_list('pk', 'shard')}
+
+    def shard_of(self, bank_id):
+        return self._current().get(bank_id, DEFAULT_DB_ALIAS)
+
+    def placements(self):
+        return Counter(self._current().values())
+
+
+_shard_map = None
+_shard_map_lock = threading.Lock()
+
+
+def bank_shard_map():
+    global _shard_map
+    with _shard_map_lock:
+        if _shard_map is None:
+            from apps.banks.models import Bank
+
+            _shard_map = BankShardMap(Bank)
+        return _shard_map
+
+
+def shard_for_bank(bank_id):
+    """Alias of the shard holding the clients and credits of ``bank_id``."""
+    if not settings.SHARD_DATABASES or bank_id is None:
+        return DEFAULT_DB_ALIAS
+    return bank_shard_map().shard_of(bank_id)
+
+
+def placement_for_new_bank():
+    """The shard holding the fewest banks."""
+    if not settings.SHARD_DATABASES:
+        return DEFAULT_DB_ALIAS
+    placements = bank_shard_map().placements()
+    return min(shard_aliases(), key=lambda alias: placements[alias])
+
+
+def current_shard():
+    return _pinned.get()
+
+
+@contextmanager
+def using_shard(alias):
+    """Route queries on sharded models without an instance to ``alias`` inside the block."""
+    token = _pinned.set(alias)
+    try:
+        yield alias
+    finally:
+        _pinned.reset(token)
+
+
+class _Block:
+    """Rows queued in one atomic_on() block, and how deep its atomic block on the default database is."""
+    __slots__ = ('depth', 'rows')
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.rows = []
+
+
+_block = contextvars.ContextVar('atomic_on_block', default=None)
+
+
+@contextmanager
+def atomic_on(*aliases):
+    """
+    An atomic block on each of ``aliases`` and on the default database, which is
+    entered first and so commits last: an error, or a shard failing to commit,
+    rolls the catalog's writes back with the shard's. (There is no two-phase
+    commit; only the default database failing its own commit can split them.)
+
+    Rows queued with queue_insert() are inserted on the default database as the
+    block ends, with one multi-row INSERT per model. A block nested right inside
+    another hands them to it instead, so a transaction of several writes inserts
+    them once.
+    """
+    parent = _block.get()
+    with ExitStack() as stack:
+        for alias in dict.fromkeys([DEFAULT_DB_ALIAS, *aliases]):
+            stack.enter_context(transaction.atomic(using=alias))
+        block = _Block(len(connections[DEFAULT_DB_ALIAS].atomic_blocks))
+        token = _block.set(block)
+        try:
+            yield
+        finally:
+            _block.reset(token)
+        # Only when no other savepoint sits in between: rolling that back has to drop the rows too.
+        if parent is not None and parent.depth == block.depth - 1:
+            parent.rows.extend(block.rows)
+        else:
+            _insert(block.rows)
+
+
+def _insert(rows):
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(type(row), []).append(row)
+    for model, model_rows in by_model.items():
+        model._default_manager.using(DEFAULT_DB_ALIAS).bulk_create(model_rows)
+
+
+def queue_insert(row):
+    """
+    Insert ``row``, a model instance stored on the default database, as the
+    enclosing atomic_on() block ends; right away outside one.
+    """
+    block = _block.get()
+    if block is None:
+        row.save(using=DEFAULT_DB_ALIAS)
+    else:
+        block.rows.append(row)
+
+
+def instance_shard(instance):
+    """Alias ``instance`` is stored on, or will be once saved."""
+    return router.db_for_write(type(instance), instance=instance)
+
+
+def locate(model, pk):
+    """Alias of the shard holding row ``pk`` of ``model``, None when no shard has it."""
+    aliases = shard_aliases()
+    if not is_sharded(model):
+        return DEFAULT_DB_ALIAS
+    try:
+        home = int(pk) // SHARD_ID_SPAN
+    except (TypeError, ValueError):
+        return None
+    # Rows are usually still on the shard that assigned their id.
+    if 0 <= home < len(aliases):
+        aliases.insert(0, aliases.pop(home))
+    for alias in aliases:
+        if model._base_manager.using(alias).filter(pk=pk).exists():
+            return alias
+    return None
+
+
+class BankMoved(APIException):
+    status_code = 503
+    default_detail = 'The bank was moved to another shard while the request ran; retry it.'
+    default_code = 'bank_moved'
+
+
+def fence(alias, bank_ids):
+    """
+    Inside a write's transaction on ``alias``: share-lock the copies of ``bank_ids``
+    there and raise BankMoved if one of them is placed on another shard now.
+    rebalance_banks switches banks over by rewriting those copies, so it waits for
+    the writes in flight, and later writes with a stale map cannot land on the
+    old shard.
+    """
+    if not settings.SHARD_DATABASES:
+        return
+    bank_ids = sorted({pk for pk in bank_ids if pk is not None})
+    if not bank_ids:
+        return
+    from apps.banks.models import Bank
+
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT id, shard FROM {connection.ops.quote_name(Bank._meta.db_table)} WHERE id = ANY(%s) FOR SHARE',
+            [bank_ids],
+        )
+        moved = [pk for pk, shard in cursor.fetchall() if (shard or DEFAULT_DB_ALIAS) != alias]
+    if moved:
+        bank_shard_map().reload()
+        raise BankMoved()
+
+
+def follow_moved_banks(method):
+    """Decorator of a sharded model's save()/delete(): after BankMoved, run once more where the bank is now."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except BankMoved:
+            if kwargs.get('using'):
+                raise
+            # Routed again by bank: the map was reloaded, and a row not copied over yet is inserted there.
+            self._state.db = None
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def check_same_shard(bank, *rows):
+    """Reject writes that would put a row and its bank (or related rows) on different shards."""
+    if not settings.SHARD_DATABASES:
+        return
+    alias = shard_for_bank(bank.pk if bank is not None else None)
+    if any(row is not None and (row._state.db or alias) != alias for row in rows):
+        raise serializers.ValidationError({
+            'bank': 'This bank is placed on another shard; move the banks together with rebalance_banks.',
+        })
+
+
+def replicate_bank(sender, instance, raw=False, **kwargs):
+    """post_save of Bank: copy the row to every extra shard."""
+    if raw or instance._state.db != DEFAULT_DB_ALIAS:
+        return
+    fields = [field.attname for field in sender._meta.concrete_fields if not field.primary_key]
+    for alias in settings.SHARD_DATABASES:
+        copy = sender(pk=instance.pk, **{name: getattr(instance, name) for name in fields})
+        sender._base_manager.using(alias).bulk_create(
+            [copy], update_conflicts=True, unique_fields=['id'], update_fields=fields,
+        )
+
+
+class ShardRouter:
+    """Routes clients, credits and client summaries to their shard; everything else to the default database."""
+
+    def _route(self, model, instance):
+        if not is_sharded(model):
+            return None
+        if instance is not None:
+            label = instance._meta.label_lower
+            if label in SHARDED_MODELS:
+                if instance._state.db:
+                    return instance._state.db
+                if hasattr(instance, 'bank_id'):
+                    return shard_for_bank(instance.bank_id)
+            elif label == 'banks.bank':
+                # bank.clients / bank.credits
+                return shard_for_bank(instance.pk)
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Banks are on every shard; other relations only ever join rows of one shard.
+        return True
+
+
+@functools.total_ordering
+class _SortValue:
+    """One ORDER BY value, compared like PostgreSQL does (nulls last ascending, first descending)."""
+    __slots__ = ('value', 'descending')
+
+    def __init__(self, value, descending):
+        self.value = value
+        self.descending = descending
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        a, b = (other.value, self.value) if self.descending else (self.value, other.value)
+        if a == b or a is None:
+            return False
+        return b is None or a < b
+
+
+class ScatterGather:
+    """
+    One queryset evaluated on every shard and merged in its ordering. Supports
+    what the list views, pagination and jobs use: chaining, count(), slicing
+    and iteration. Ordered querysets can only be merged on field names.
+    """
+    ordered = True
+
+    def __init__(self, queryset, aliases=None):
+        self.queryset = queryset
+        self.aliases = aliases or shard_aliases()
+        self.model = queryset.model
+
+    def _chain(self, queryset):
+        return type(self)(queryset, self.aliases)
+
+    def all(self):
+        return self._chain(self.queryset.all())
+
+    def filter(self, *args, **kwargs):
+        return self._chain(self.queryset.filter(*args, **kwargs))
+
+    def exclude(self, *args, **kwargs):
+        return self._chain(self.queryset.exclude(*args, **kwargs))
+
+    def order_by(self, *fields):
+        return self._chain(self.queryset.order_by(*fields))
+
+    def values_list(self, *fields, **kwargs):
+        return self._chain(self.queryset.values_list(*fields, **kwargs))
+
+    def count(self):
+        return sum(self.queryset.using(alias).count() for alias in self.aliases)
+
+    def exists(self):
+        return any(self.queryset.using(alias).exists() for alias in self.aliases)
+
+    def __bool__(self):
+        return self.exists()
+
+    # No __len__: list() and sorted() would ask every shard for a COUNT before reading it.
+
+    def _ordering(self):
+        query = self.queryset.query
+        fields = list(query.order_by or (self.model._meta.ordering if query.default_ordering else ()))
+        if not fields:
+            return []
+        if not all(isinstance(field, str) and field != '?' for field in fields):
+            raise TypeError('ScatterGather can only merge querysets ordered by field names.')
+        if not {field.lstrip('-') for field in fields} & {'pk', self.model._meta.pk.name}:
+            # Ties broken the same way on every shard and in the merge.
+            fields.append('pk')
+        return fields
+
+    def _sort_keys(self, queryset, ordering):
+        """``queryset`` returning its sort values, and a key function reading them off each row."""
+        iterable = queryset._iterable_class
+        if iterable is ModelIterable:
+            # Annotated rather than read from attributes: they may be deferred or across a relation.
+            names = [f'_shard_sort_{index}' for index in range(len(ordering))]
+            queryset = queryset.annotate(**{name: F(field.lstrip('-')) for name, field in zip(names, ordering)})
+            getters = [operator.attrgetter(name) for name in names]
+        elif iterable is ValuesListIterable:
+            fields = [self.model._meta.pk.name if name == 'pk' else name for name in queryset._fields or ()]
+            getters = []
+            for field in ordering:
+                name = field.lstrip('-')
+                name = self.model._meta.pk.name if name == 'pk' else name
+                if name not in fields:
+                    raise TypeError(f'ScatterGather cannot merge these rows on "{name}" unless they include it.')
+                getters.append(operator.itemgetter(fields.index(name)))
+        else:
+            raise TypeError('ScatterGather can only merge model instances and values_list() rows.')
+        descending = [field.startswith('-') for field in ordering]
+        return queryset, lambda row: [_SortValue(get(row), desc) for get, desc in zip(getters, descending)]
+
+    def _streams(self, limit=None, chunk_size=None):
+        ordering = self._ordering()
+        queryset, key = self.queryset, None
+        if ordering:
+            queryset, key = self._sort_keys(queryset.order_by(*ordering), ordering)
+        streams = []
+        for alias in self.aliases:
+            shard_queryset = queryset.using(alias)
+            if limit is not None:
+                shard_queryset = shard_queryset[:limit]
+            streams.append(shard_queryset.iterator(chunk_size=chunk_size) if chunk_size else shard_queryset)
+        if key is None:
+            return itertools.chain(*streams)
+        return heapq.merge(*streams, key=key)
+
+    def __iter__(self):
+        return iter(self._streams())
+
+    def iterator(self, chunk_size=None):
+        return self._streams(chunk_size=chunk_size or 2000)
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            rows = self[item:item + 1]
+            if not rows:
+                raise IndexError(item)
+            return rows[0]
+        start, stop = item.start or 0, item.stop
+        # Each shard contributes at most ``stop`` rows to the merged slice.
+        return list(itertools.islice(self._streams(limit=stop), start, stop))
+
+
+def scatter(queryset):
+    """``queryset`` over every shard when its model is sharded, else ``queryset`` itself."""
+    if is_sharded(queryset.model) and queryset._db is None:
+        return ScatterGather(queryset)
+    return queryset
+
+
+class ShardedViewSetMixin:
+    """
+    Viewset mixin routing bank-filtered lists and object URLs to one shard and
+    gathering other lists from every shard.
+    """
+    shard_filter = 'bank'
+
+    def request_shard(self):
+        """Alias serving this request, None when every shard has to be read."""
+        if not settings.SHARD_DATABASES:
+            return DEFAULT_DB_ALIAS
+        if not hasattr(self, '_request_shard'):
+            lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+            bank = self.request.query_params.get(self.shard_filter, '')
+            if lookup is not None:
+                self._request_shard = locate(self.queryset.model, lookup) or DEFAULT_DB_ALIAS
+            elif bank.isdigit():
+                self._request_shard = shard_for_bank(int(bank))
+            else:
+                self._request_shard = None
+        return self._request_shard
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        alias = self.request_shard()
+        return queryset.using(alias) if alias is not None else queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return scatter(queryset) if self.request_shard() is None else queryset
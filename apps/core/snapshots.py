@@ -0,0 +1,187 @@
+"""
+Columnar snapshots of banks, clients and credits for the data warehouse.
+
+A snapshot is one Parquet (or Arrow IPC) file per table on the default storage,
+written by the ``snapshot`` management command or by a background job queued
+with ``POST /api/{bancos,clientes,creditos}/snapshot/``. Rows are read through
+a server-side cursor (``QuerySet.iterator``, merged across shards) and every
+SNAPSHOT_CHUNK_SIZE rows become one row group, so memory stays bounded by the
+chunk size however large the table is.
+
+Full snapshots hold the active rows. Incremental ones (``since``) hold every row
+with ``since <= updated_at < until``, soft-deleted rows included with their
+``deleted_at``. Both report ``until``, held back by CHANGE_FEED_SAFETY_LAG like
+the change feed, as the ``since`` of the next incremental run; rows changed
+after it in a full snapshot are simply sent again. Filters are the list
+endpoints' query params.
+"""
+from datetime import datetime, timedelta
+import itertools
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+from apps.core.jobs import enqueue, job
+
+FORMATS = ['parquet', 'arrow']
+
+
+def snapshot_tables():
+    """resource name -> (model, filterset class)."""
+    from apps.banks.filters import BankFilter
+    from apps.banks.models import Bank
+    from apps.clients.filters import ClientFilter
+    from apps.clients.models import Client
+    from apps.credits.filters import CreditFilter
+    from apps.credits.models import Credit
+
+    return {
+        'banks': (Bank, BankFilter),
+        'clients': (Client, ClientFilter),
+        'credits': (Credit, CreditFilter),
+    }
+
+
+def arrow_schema(model):
+    """(column names, pyarrow schema) of the concrete fields of ``model``; foreign keys as their ids."""
+    import pyarrow as pa
+
+    types = {
+        'AutoField': pa.int64(),
+        'BigAutoField': pa.int64(),
+        'BigIntegerField': pa.int64(),
+        'IntegerField': pa.int32(),
+        'PositiveIntegerField': pa.int64(),
+        'PositiveSmallIntegerField': pa.int32(),
+        'SmallIntegerField': pa.int16(),
+        'BooleanField': pa.bool_(),
+        'DateField': pa.date32(),
+        'DateTimeField': pa.timestamp('us', tz='UTC'),
+    }
+    columns, fields = [], []
+    for field in model._meta.concrete_fields:
+        target = field.target_field if field.is_relation else field
+        internal_type = target.get_internal_type()
+        if internal_type == 'DecimalField':
+            arrow_type = pa.decimal128(target.max_digits, target.decimal_places)
+        else:
+            arrow_type = types.get(internal_type, pa.string())
+        columns.append(field.attname)
+        fields.append(pa.field(field.attname, arrow_type, nullable=field.null))
+    return columns, pa.schema(fields)
+
+
+def snapshot_queryset(name, filters=None, since=None, until=None):
+    """Rows of the ``name`` table in a snapshot, gathered from every shard in primary key order."""
+    from apps.core.sharding import scatter
+    from apps.credits.summaries import CreditSummaryFilterSet, summary_annotations
+
+    model, filterset_class = snapshot_tables()[name]
+    queryset = model.objects.all()
+    if since is None:
+        queryset = queryset.filter(deleted_at__isnull=True)
+    else:
+        queryset = queryset.filter(updated_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(updated_at__lt=until)
+    if filters:
+        if issubclass(filterset_class, CreditSummaryFilterSet):
+            # The summary filters read annotations; only filtered snapshots pay for the join.
+            queryset = queryset.annotate(**summary_annotations())
+        filterset = filterset_class(filters, queryset=queryset)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        queryset = filterset.qs
+    return scatter(queryset.order_by('pk'))
+
+
+def snapshot_horizon():
+    """Upper bound of updated_at for a snapshot taken now: rows newer than this may still commit late."""
+    return timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SAFETY_LAG)
+
+
+def write_snapshot(name, sink, fmt='parquet', filters=None, since=None, until=None, on_chunk=None):
+    """
+    Write the ``name`` snapshot to the binary file object ``sink``, one row group
+    per SNAPSHOT_CHUNK_SIZE rows. ``on_chunk(rows_written)`` is called after each.
+    Returns (rows, row groups).
+    """
+    # Imported here: pyarrow is only needed by snapshots, not by every web process.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    model, _ = snapshot_tables()[name]
+    columns, schema = arrow_schema(model)
+    rows = snapshot_queryset(name, filters, since, until).values_list(*columns).iterator(
+        chunk_size=settings.SNAPSHOT_CHUNK_SIZE,
+    )
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression=settings.SNAPSHOT_PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_file(sink, schema)
+
+    written = groups = 0
+    with writer:
+        while chunk := list(itertools.islice(rows, settings.SNAPSHOT_CHUNK_SIZE)):
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            written, groups = written + len(chunk), groups + 1
+            if on_chunk is not None:
+                on_chunk(written)
+    return written, groups
+
+
+@job('core.snapshot')
+def snapshot(job_obj, table, format='parquet', since=None, filters=None):
+    """Write a columnar snapshot of ``table`` as the job's result file."""
+    since = datetime.fromisoformat(since) if since else None
+    until = snapshot_horizon()
+    total = snapshot_queryset(table, filters, since, until).count()
+
+    with tempfile.TemporaryFile() as tmp:
+        rows, groups = write_snapshot(
+            table, tmp, format, filters, since, until,
+            on_chunk=lambda written: job_obj.set_progress(written * 100 // max(total, written)),
+        )
+        tmp.seek(0)
+        job_obj.store_result_file(f'{table}.{format}', File(tmp))
+
+    return {
+        'table': table, 'format': format, 'rows': rows, 'row_groups': groups,
+        'since': since.isoformat() if since else None, 'until': until.isoformat(),
+    }
+
+
+class SnapshotRequestSerializer(serializers.Serializer):
+    """Body of ``POST .../snapshot/``; filters are the list endpoint's query params."""
+    format = serializers.ChoiceField(choices=FORMATS, default='parquet')
+    since = serializers.DateTimeField(required=False, help_text='Incremental: rows updated since, deleted included.')
+
+
+class SnapshotMixin:
+    """Viewset mixin adding ``POST snapshot/``, which queues a columnar snapshot of the model's table."""
+
+    @action(detail=False, methods=['post'], serializer_class=SnapshotRequestSerializer)
+    def snapshot(self, request):
+        """Queue a Parquet or Arrow snapshot of the rows matching the filter query params."""
+        # Imported here: CoreConfig.ready() imports this module, and the views would load the whole API.
+        from apps.core.views import job_accepted_response
+
+        serializer = SnapshotRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        table = self.get_queryset().model.event_resource
+        _, filterset_class = snapshot_tables()[table]
+        filters = {key: request.query_params[key] for key in filterset_class.base_filters if key in request.query_params}
+        # Validated now rather than failing in the job.
+        snapshot_queryset(table, filters)
+        since = serializer.validated_data.get('since')
+        job_obj = enqueue('core.snapshot', {
+            'table': table, 'format': serializer.validated_data['format'],
+            'since': since.isoformat() if since else None, 'filters': filters,
+        }, user=request.user)
+        return job_accepted_response(job_obj, request)
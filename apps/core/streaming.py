@@ -0,0 +1,138 @@
+"""
+Push channels for change events: server-sent events and WebSocket.
+
+Both subscribe to the in-process bus in apps.core.events, so every connected
+client is served from the same event loop without a query per client. They
+need the ASGI application (``uvicorn your_credit.asgi:application``); under
+WSGI a stream would pin a worker for its whole lifetime.
+
+Browsers cannot set headers on EventSource or WebSocket connections, so the
+access token may also be passed as ``?token=``.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import JsonResponse, QueryDict, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from apps.core.events import bus
+from apps.core.serializers import StreamQuerySerializer
+
+SSE_RETRY_MILLISECONDS = 3000
+
+
+def _authenticate(authorization):
+    """Run the configured DRF authentication classes against an Authorization header."""
+    request = SimpleNamespace(META={'HTTP_AUTHORIZATION': authorization})
+    try:
+        for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            try:
+                result = authentication_class().authenticate(request)
+            except AuthenticationFailed:
+                return None
+            if result is not None:
+                return result[0]
+        return None
+    finally:
+        # Streams outlive any request cycle, so release the connection like Django does after a request.
+        close_old_connections()
+
+
+async def authenticate(authorization, params):
+    if not authorization and params.get('token'):
+        authorization = f"{jwt_settings.AUTH_HEADER_TYPES[0]} {params['token']}"
+    if not authorization:
+        return None
+    return await sync_to_async(_authenticate)(authorization)
+
+
+def _format_sse(event, name='change'):
+    return f'event: {name}\ndata: {json.dumps(event)}\n\n'
+
+
+async def _sse_stream(filters):
+    subscription = bus.subscribe(**filters)
+    try:
+        yield f'retry: {SSE_RETRY_MILLISECONDS}\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), settings.STREAM_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if subscription.dropped:
+                # Tell the client to catch up through /api/changes/ before trusting the stream again.
+                yield _format_sse({'dropped': subscription.dropped}, name='overflow')
+                subscription.dropped = 0
+            yield _format_sse(event)
+    finally:
+        bus.unsubscribe(subscription)
+
+
+async def event_stream(request):
+    """
+    Server-sent events stream of bank, client and credit changes.
+    Filters: ?resources=credits,clients&bank=1,2&credit_type=MORTGAGE
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Event streams are served by the ASGI application.'}, status=501)
+    user = await authenticate(request.headers.get('Authorization', ''), request.GET)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+    serializer = StreamQuerySerializer(data=request.GET)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+
+    response = StreamingHttpResponse(_sse_stream(serializer.subscription_filters()), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Disable proxy buffering (nginx) so events are delivered as they happen.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def websocket_stream(scope, receive, send):
+    """
+    WebSocket endpoint (ws://.../ws/stream/) sending one JSON text frame per change.
+    Accepts the same filters as the SSE stream. Rejected connections are closed
+    before the handshake completes.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    params = QueryDict(scope.get('query_string', b'').decode())
+    headers = dict(scope.get('headers', []))
+    user = await authenticate(headers.get(b'authorization', b'').decode(), params)
+    serializer = StreamQuerySerializer(data=params)
+    if user is None or not serializer.is_valid():
+        await send({'type': 'websocket.close', 'code': 4401 if user is None else 4400})
+        return
+
+    subscription = bus.subscribe(**serializer.subscription_filters())
+    await send({'type': 'websocket.accept'})
+    receiver = asyncio.ensure_future(receive())
+    getter = asyncio.ensure_future(subscription.queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                if receiver.result()['type'] == 'websocket.disconnect':
+                    break
+                # Client frames carry no meaning; keep listening for the disconnect.
+                receiver = asyncio.ensure_future(receive())
+            if getter in done:
+                if subscription.dropped:
+                    await send({'type': 'websocket.send', 'text': json.dumps({'overflow': subscription.dropped})})
+                    subscription.dropped = 0
+                await send({'type': 'websocket.send', 'text': json.dumps(getter.result())})
+                getter = asyncio.ensure_future(subscription.queue.get())
+    finally:
+        receiver.cancel()
+        getter.cancel()
+        bus.unsubscribe(subscription)
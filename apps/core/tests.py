@@ -1,3 +1,1617 @@
-from django.test import TestCase
+import asyncio
+import cbor2
+import copy
+import gzip
+import io
+import json
+import msgpack
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from types import SimpleNamespace
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from apps.core import events, jobs
+from apps.core.batching import GroupCommitWriter
+from apps.core.checks import check_throttle_cache
+from apps.core.compression import negotiate
+from apps.core.lazy import lazy_include, lazy_view
+from apps.core.management.commands import rebalance_banks, runjobs
+from apps.core.pagination import EstimatedCountPaginator
+from apps.core.streaming import event_stream, websocket_stream
+from apps.core.throttling import ConcurrencyLimitMiddleware, consume
+from apps.core.models import IdempotencyKey, Job
+from apps.core.sharding import SHARD_ID_SPAN, bank_shard_map
+from apps.banks.models import Bank
+from apps.clients.models import Client
+from apps.credits.models import BankCreditSummary, ClientCreditSummary, Credit
+from apps.credits.views import CreditViewSet
 
-# Create your tests here.
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(django_user_model):
+    return django_user_model.objects.create_user(
+        username='testuser',
+        password='testpass123'
+    )
+
+
+@pytest.fixture
+def authenticated_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+@pytest.fixture
+def credit_instance():
+    bank = Bank.objects.create(name='Test Bank', type_bank='PRIVATE', address='123 Test Street')
+    today = date.today()
+    client = Client.objects.create(
+        full_name='Test Client',
+        birth_date=today.replace(year=today.year - 30),
+        age=30,
+        nationality='USA',
+        address='456 Client Ave',
+        email='test@example.com',
+        phone='+1234567890',
+        person_type='INDIVIDUAL',
+        bank=bank
+    )
+    return Credit.objects.create(
+        client=client,
+        description='Home Loan',
+        minimum_payment=Decimal('500.00'),
+        maximum_payment=Decimal('2000.00'),
+        term_months=36,
+        bank=bank,
+        credit_type='MORTGAGE'
+    )
+
+
+@pytest.mark.django_db
+class TestJobQueue:
+    """Tests for the database-backed job queue."""
+
+    def test_enqueue_unknown_job(self):
+        """Test that enqueueing an unregistered job name is rejected."""
+        with pytest.raises(ValueError):
+            jobs.enqueue('does.not_exist')
+
+    def test_claim_next_oldest_first(self):
+        """Test that workers claim pending jobs in FIFO order."""
+        first = jobs.enqueue('credits.export_csv')
+        jobs.enqueue('credits.export_csv')
+        assert jobs.claim_next() == first.pk
+        first.refresh_from_db()
+        assert first.status == 'RUNNING'
+        assert first.started_at is not None
+
+    def test_run_job_stores_result_file(self, media_root, credit_instance):
+        """Test that a successful job records its result and result file."""
+        job = jobs.enqueue('credits.export_csv', {'credit_type': 'MORTGAGE'})
+        assert jobs.run_job(job.pk) == 'SUCCEEDED'
+        job.refresh_from_db()
+        assert job.progress == 100
+        assert job.result == {'rows': 1}
+        with job.result_file.open('rb') as handle:
+            lines = handle.read().decode().splitlines()
+        assert lines[0].startswith('id,client_id,bank_id')
+        assert 'Home Loan' in lines[1]
+
+    def test_run_job_records_failure(self):
+        """Test that handler exceptions mark the job as failed."""
+        job = Job.objects.create(name='does.not_exist')
+        assert jobs.run_job(job.pk) == 'FAILED'
+        job.refresh_from_db()
+        assert 'No handler registered' in job.error
+
+    def test_abandoned_jobs_are_reclaimed(self, settings):
+        """Test that RUNNING jobs with an expired lease are requeued, then failed after JOB_MAX_ATTEMPTS."""
+        settings.JOB_MAX_ATTEMPTS = 2
+        job = jobs.enqueue('credits.export_csv')
+        assert jobs.claim_next() == job.pk
+        assert jobs.claim_next() is None
+
+        stale = timezone.now() - timedelta(seconds=settings.JOB_LEASE_TIMEOUT + 1)
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        assert jobs.claim_next() == job.pk
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == ('RUNNING', 2)
+        assert 'Lease expired' in job.error
+
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=stale)
+        assert jobs.claim_next() is None
+        job.refresh_from_db()
+        assert job.status == 'FAILED'
+
+    def test_reclaimed_run_discards_its_result(self, settings, monkeypatch):
+        """Test that a run whose job was reclaimed and claimed again does not finalize the new run's job."""
+        def handler(job_obj):
+            # The lease runs out mid-run and another worker claims the job.
+            stale = timezone.now() - timedelta(seconds=settings.JOB_LEASE_TIMEOUT + 1)
+            Job.objects.filter(pk=job_obj.pk).update(heartbeat_at=stale)
+            assert jobs.claim_next() == job_obj.pk
+            return {'rows': 1}
+
+        monkeypatch.setitem(jobs._registry, 'test.reclaimed', handler)
+        job = jobs.enqueue('test.reclaimed')
+        assert jobs.claim_next() == job.pk
+        assert jobs.run_job(job.pk) == 'RECLAIMED'
+        job.refresh_from_db()
+        assert (job.status, job.attempts, job.result, job.finished_at) == ('RUNNING', 2, None, None)
+
+    def test_runjobs_survives_broken_pool(self, media_root, credit_instance, monkeypatch):
+        """Test that a dead worker process requeues its job and the pool is recreated."""
+        class Pool:
+            def __init__(self, broken):
+                self.broken = broken
+
+            def submit(self, func, job_id):
+                if self.broken:
+                    raise BrokenProcessPool('A child process terminated abruptly.')
+                future = Future()
+                future.set_result(jobs.run_job(job_id))
+                return future
+
+            def shutdown(self, wait=True, cancel_futures=False):
+                pass
+
+        pools = iter([Pool(broken=True), Pool(broken=False)])
+        monkeypatch.setattr(runjobs.Command, '_new_pool', lambda self, max_workers: next(pools))
+        job = jobs.enqueue('credits.export_csv')
+        call_command('runjobs', workers=1, once=True, stdout=io.StringIO(), stderr=io.StringIO())
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == ('SUCCEEDED', 2)
+
+    def test_runjobs_command_drains_queue(self, media_root, credit_instance):
+        """Test running the worker inline until the queue is empty."""
+        job = jobs.enqueue('credits.export_csv')
+        call_command('runjobs', workers=0, once=True)
+        job.refresh_from_db()
+        assert job.status == 'SUCCEEDED'
+
+
+@pytest.mark.django_db
+class TestJobAPI:
+    """Tests for Job API endpoints."""
+
+    def test_export_returns_accepted(self, authenticated_client, user):
+        """Test that heavy operations answer 202 with a job id."""
+        url = reverse('credit-export') + '?credit_type=MORTGAGE'
+        response = authenticated_client.post(url)
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job = Job.objects.get(pk=response.data['id'])
+        assert job.params == {'credit_type': 'MORTGAGE'}
+        assert job.created_by == user
+        assert response['Location'].endswith(reverse('job-detail', kwargs={'pk': job.pk}))
+
+    def test_jobs_are_scoped_to_owner(self, authenticated_client, user, django_user_model):
+        """Test that users only list their own jobs."""
+        other = django_user_model.objects.create_user(username='other', password='testpass123')
+        jobs.enqueue('credits.export_csv', user=user)
+        jobs.enqueue('credits.export_csv', user=other)
+        response = authenticated_client.get(reverse('job-list'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 1
+
+    def test_progress(self, authenticated_client, user):
+        """Test the lightweight progress endpoint."""
+        job = jobs.enqueue('credits.export_csv', user=user)
+        job.set_progress(40)
+        response = authenticated_client.get(reverse('job-progress', kwargs={'pk': job.pk}))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['progress'] == 40
+        assert response.data['status'] == 'PENDING'
+
+    def test_result_before_completion(self, authenticated_client, user):
+        """Test that fetching the result of an unfinished job is a conflict."""
+        job = jobs.enqueue('credits.export_csv', user=user)
+        response = authenticated_client.get(reverse('job-result', kwargs={'pk': job.pk}))
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_result_download(self, authenticated_client, user, media_root, credit_instance):
+        """Test downloading the result file of a finished job."""
+        job = jobs.enqueue('credits.export_csv', user=user)
+        jobs.run_job(job.pk)
+        response = authenticated_client.get(reverse('job-result', kwargs={'pk': job.pk}))
+        assert response.status_code == status.HTTP_200_OK
+        assert b'Home Loan' in b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+class TestChangeFeed:
+    """Tests for the /api/changes/ incremental sync feed."""
+
+    @pytest.fixture(autouse=True)
+    def no_safety_lag(self, settings):
+        settings.CHANGE_FEED_SAFETY_LAG = 0
+
+    def poll(self, client, **params):
+        response = client.get(reverse('changes'), params)
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def test_initial_sync_returns_inserts_in_order(self, authenticated_client, credit_instance):
+        """Test that a first poll returns every row as an insert in updated_at order."""
+        data = self.poll(authenticated_client)
+        assert [change['resource'] for change in data['results']] == ['banks', 'clients', 'credits']
+        assert {change['event'] for change in data['results']} == {'insert'}
+        assert data['has_more'] is False
+
+    def test_cursor_paging(self, authenticated_client, credit_instance):
+        """Test that limit and cursor page through the feed without gaps or repeats."""
+        first = self.poll(authenticated_client, limit=2)
+        assert first['has_more'] is True
+        second = self.poll(authenticated_client, limit=2, since=first['next_cursor'])
+        assert [change['resource'] for change in second['results']] == ['credits']
+        empty = self.poll(authenticated_client, since=second['next_cursor'])
+        assert empty['results'] == []
+        assert empty['next_cursor'] == second['next_cursor']
+
+    def test_updates_and_soft_deletes(self, authenticated_client, credit_instance):
+        """Test that later changes surface as update and delete events."""
+        cursor = self.poll(authenticated_client)['next_cursor']
+        credit_instance.description = 'Refinanced'
+        credit_instance.save()
+        credit_instance.client.soft_delete()
+        data = self.poll(authenticated_client, since=cursor)
+        events = [(change['resource'], change['event']) for change in data['results']]
+        assert events == [('credits', 'update'), ('clients', 'delete')]
+        assert data['results'][0]['data']['description'] == 'Refinanced'
+
+    def test_resource_filter(self, authenticated_client, credit_instance):
+        """Test restricting the feed to some resources."""
+        data = self.poll(authenticated_client, resources='credits')
+        assert [change['resource'] for change in data['results']] == ['credits']
+
+    def test_safety_lag(self, authenticated_client, credit_instance, settings):
+        """Test that very recent rows are held back."""
+        settings.CHANGE_FEED_SAFETY_LAG = 60
+        assert self.poll(authenticated_client)['results'] == []
+
+    def test_invalid_cursor(self, authenticated_client):
+        """Test that a malformed cursor is rejected."""
+        response = authenticated_client.get(reverse('changes'), {'since': 'not-a-cursor'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestEventBus:
+    """Tests for change event filtering and fan-out."""
+
+    def test_subscription_filters(self):
+        """Test that subscriptions match on resource, bank and credit type."""
+        subscription = events.Subscription(None, resources=['credits'], banks=[1], credit_types=['MORTGAGE'])
+        event = {'resource': 'credits', 'id': 1, 'bank': 1, 'credit_type': 'MORTGAGE'}
+        assert subscription.matches(event)
+        assert not subscription.matches({**event, 'bank': 2})
+        assert not subscription.matches({**event, 'credit_type': 'AUTOMOTIVE'})
+        assert not subscription.matches({'resource': 'clients', 'id': 1, 'bank': 1})
+
+    def test_dispatch_fans_out(self):
+        """Test that one dispatch reaches every matching subscriber."""
+        async def scenario():
+            first = events.bus.subscribe()
+            second = events.bus.subscribe(resources=['banks'])
+            try:
+                events.bus.dispatch({'resource': 'credits', 'id': 1})
+                received = await asyncio.wait_for(first.queue.get(), 1)
+                await asyncio.sleep(0)
+                return received, second.queue.qsize()
+            finally:
+                events.bus.unsubscribe(first)
+                events.bus.unsubscribe(second)
+
+        received, skipped = asyncio.run(scenario())
+        assert received['id'] == 1
+        assert skipped == 0
+
+
+@pytest.mark.django_db
+class TestChangeEvents:
+    """Tests for the events published by BaseModel writes."""
+
+    @pytest.fixture
+    def published(self, settings, monkeypatch):
+        settings.EVENTS_BACKEND = 'local'
+        received = []
+        monkeypatch.setattr(events.bus, 'dispatch', received.append)
+        return received
+
+    def test_lifecycle_events(self, published, credit_instance, django_capture_on_commit_callbacks):
+        """Test insert, update, delete and restore events with their filter fields."""
+        with django_capture_on_commit_callbacks(execute=True):
+            credit = Credit.objects.create(
+                client=credit_instance.client, description='Car', minimum_payment=Decimal('100.00'),
+                maximum_payment=Decimal('200.00'), term_months=12, bank=credit_instance.bank,
+                credit_type='AUTOMOTIVE'
+            )
+            credit.description = 'Car loan'
+            credit.save()
+            credit.soft_delete()
+            credit.restore()
+        assert [event['event'] for event in published] == ['insert', 'update', 'delete', 'restore']
+        assert published[0] == {
+            'resource': 'credits', 'id': credit.pk, 'event': 'insert', 'updated_at': published[0]['updated_at'],
+            'bank': credit.bank_id, 'client': credit.client_id, 'credit_type': 'AUTOMOTIVE',
+        }
+
+    def test_published_after_commit(self, published, credit_instance, django_capture_on_commit_callbacks, settings):
+        """Test that nothing is published until the transaction commits."""
+        # History entries written in the transaction, so the only callback left is the event's.
+        settings.AUDIT_HISTORY_ASYNC = False
+        with django_capture_on_commit_callbacks() as callbacks:
+            credit_instance.client.soft_delete()
+        assert published == []
+        assert len(callbacks) == 1
+
+    def test_jobs_do_not_publish(self, published, django_capture_on_commit_callbacks):
+        """Test that models without an event resource stay silent."""
+        with django_capture_on_commit_callbacks(execute=True):
+            Job.objects.create(name='credits.export_csv')
+        assert published == []
+
+
+@pytest.mark.django_db(transaction=True)
+class TestEventStreams:
+    """Tests for the SSE and WebSocket push channels."""
+
+    @pytest.fixture(autouse=True)
+    def local_events(self, settings):
+        settings.EVENTS_BACKEND = 'local'
+
+    @pytest.fixture
+    def token(self, user):
+        return str(AccessToken.for_user(user))
+
+    def test_sse_requires_authentication(self):
+        """Test that anonymous stream requests are rejected."""
+        response = asyncio.run(event_stream(AsyncRequestFactory().get('/api/stream/')))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_sse_rejects_unknown_filters(self, token):
+        """Test that invalid filters are reported before streaming."""
+        request = AsyncRequestFactory().get('/api/stream/', {'credit_type': 'BOAT', 'token': token})
+        response = asyncio.run(event_stream(request))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_sse_streams_matching_events(self, token):
+        """Test that subscribers receive only events matching their filters."""
+        async def scenario():
+            request = AsyncRequestFactory().get(
+                '/api/stream/', {'credit_type': 'MORTGAGE'}, headers={'Authorization': f'Bearer {token}'}
+            )
+            response = await event_stream(request)
+            stream = response.streaming_content
+            chunks = [await anext(stream)]
+            events.bus.dispatch({'resource': 'credits', 'id': 1, 'credit_type': 'AUTOMOTIVE'})
+            events.bus.dispatch({'resource': 'credits', 'id': 2, 'credit_type': 'MORTGAGE'})
+            chunks.append(await anext(stream))
+            await stream.aclose()
+            return response, chunks
+
+        response, chunks = asyncio.run(scenario())
+        assert response['Content-Type'] == 'text/event-stream'
+        assert chunks[0].startswith(b'retry:')
+        assert chunks[1].startswith(b'event: change\n')
+        assert json.loads(chunks[1].split(b'data: ')[1])['id'] == 2
+
+    def run_websocket(self, query_string, events_to_send=()):
+        async def scenario():
+            incoming, outgoing = asyncio.Queue(), []
+            await incoming.put({'type': 'websocket.connect'})
+
+            async def send(message):
+                outgoing.append(message)
+                if message['type'] == 'websocket.accept':
+                    for event in events_to_send:
+                        events.bus.dispatch(event)
+                elif message['type'] == 'websocket.send':
+                    await incoming.put({'type': 'websocket.disconnect', 'code': 1000})
+
+            scope = {'type': 'websocket', 'path': '/ws/stream/', 'query_string': query_string.encode(), 'headers': []}
+            await asyncio.wait_for(websocket_stream(scope, incoming.get, send), 5)
+            return outgoing
+
+        return asyncio.run(scenario())
+
+    def test_websocket_rejects_anonymous(self):
+        """Test that WebSocket connections without a token are closed before accepting."""
+        assert self.run_websocket('') == [{'type': 'websocket.close', 'code': 4401}]
+
+    def test_websocket_streams_events(self, token):
+        """Test that accepted WebSocket connections receive filtered events as JSON frames."""
+        outgoing = self.run_websocket(f'token={token}&bank=3', [
+            {'resource': 'clients', 'id': 1, 'bank': 4},
+            {'resource': 'clients', 'id': 2, 'bank': 3},
+        ])
+        assert outgoing[0] == {'type': 'websocket.accept'}
+        assert json.loads(outgoing[1]['text'])['id'] == 2
+
+
+@pytest.mark.django_db
+class TestPagination:
+    """Tests for page_size and count=estimate pagination."""
+
+    @pytest.fixture(autouse=True)
+    def banks(self):
+        cache.clear()
+        for index in range(5):
+            Bank.objects.create(name=f'Bank {index}', type_bank='PRIVATE', address='Main Street')
+
+    def test_page_size(self, authenticated_client):
+        """Test that clients choose the page size."""
+        response = authenticated_client.get(reverse('bank-list'), {'page_size': 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['results']) == 2
+        assert response.data['count'] == 5
+        assert 'count_is_estimate' not in response.data
+
+    def test_page_size_is_capped(self, authenticated_client, settings):
+        """Test that page_size cannot exceed the configured maximum."""
+        settings.PAGINATION_MAX_PAGE_SIZE = 3
+        response = authenticated_client.get(reverse('bank-list'), {'page_size': 100})
+        assert len(response.data['results']) == 3
+
+    def test_estimate_counts_small_results_exactly(self, authenticated_client):
+        """Test that small results are counted exactly and the count is cached."""
+        params = {'count': 'estimate', 'page_size': 2}
+        first = authenticated_client.get(reverse('bank-list'), params)
+        with CaptureQueriesContext(connection) as queries:
+            second = authenticated_client.get(reverse('bank-list'), params)
+        assert first.data['count'] == second.data['count'] == 5
+        assert first.data['count_is_estimate'] is False
+        assert not any('COUNT(' in query['sql'] for query in queries)
+
+    def test_estimate_uses_planner(self, authenticated_client, settings):
+        """Test that large results report the planner estimate without COUNT(*)."""
+        settings.PAGINATION_ESTIMATE_THRESHOLD = 0
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(reverse('bank-list'), {'count': 'estimate', 'page_size': 2})
+        assert response.data['count_is_estimate'] is True
+        assert isinstance(response.data['count'], int)
+        assert response.data['next'] is not None
+        assert not any('COUNT(' in query['sql'] for query in queries)
+
+    def test_estimate_pages_follow_rows(self, settings):
+        """Test that page bounds come from the rows, not from the estimate."""
+        settings.PAGINATION_ESTIMATE_THRESHOLD = 0
+        paginator = EstimatedCountPaginator(Bank.objects.order_by('pk'), 2)
+        last = paginator.page(3)
+        assert len(last) == 1
+        assert not last.has_next()
+        assert paginator.page(2).has_next()
+        with pytest.raises(EmptyPage):
+            paginator.page(4)
+
+
+@pytest.mark.django_db
+class TestBatchRequests:
+    """Tests for the /api/batch/ composite endpoint."""
+
+    def batch(self, client, requests, **options):
+        return client.post(reverse('batch'), {'requests': requests, **options}, format='json')
+
+    def test_runs_subrequests_in_order(self, authenticated_client, credit_instance):
+        """Test that sub-requests share one authentication and return their own responses."""
+        client_url = reverse('client-detail', kwargs={'pk': credit_instance.client_id})
+        response = self.batch(authenticated_client, [
+            {'id': 'client', 'path': client_url},
+            {'id': 'credits', 'path': reverse('credit-list') + f'?client={credit_instance.client_id}'},
+            {'id': 'missing', 'path': reverse('bank-detail', kwargs={'pk': 999999})},
+        ])
+        assert response.status_code == status.HTTP_200_OK
+        client, credits, missing = response.data['responses']
+        assert (client['id'], client['status']) == ('client', 200)
+        assert client['body']['full_name'] == 'Test Client'
+        assert credits['body']['results'][0]['id'] == credit_instance.pk
+        assert missing['status'] == 404
+
+    def test_writes(self, authenticated_client, credit_instance):
+        """Test that sub-requests can change data."""
+        url = reverse('credit-detail', kwargs={'pk': credit_instance.pk})
+        response = self.batch(authenticated_client, [
+            {'method': 'PATCH', 'path': url, 'body': {'description': 'Refinanced'}},
+            {'method': 'PATCH', 'path': url, 'body': {'term_months': 0}},
+        ])
+        updated, invalid = response.data['responses']
+        assert updated['status'] == 200
+        assert invalid['status'] == 400
+        credit_instance.refresh_from_db()
+        assert credit_instance.description == 'Refinanced'
+
+    def test_consistent_snapshot(self, authenticated_client, credit_instance):
+        """Test read-only snapshot batches."""
+        response = self.batch(authenticated_client, [{'path': reverse('credit-list')}], consistent=True)
+        assert response.data['responses'][0]['status'] == 200
+        rejected = self.batch(
+            authenticated_client, [{'method': 'DELETE', 'path': reverse('credit-list')}], consistent=True
+        )
+        assert rejected.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_consistent_refused_with_shards(self, authenticated_client, settings):
+        """Test that consistent batches are refused when the data spans several databases."""
+        settings.SHARD_DATABASES = ['shard1']
+        response = self.batch(authenticated_client, [{'path': reverse('credit-list')}], consistent=True)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'consistent' in response.data
+
+    @pytest.mark.django_db(transaction=True)
+    def test_consistent_snapshot_transaction(self, authenticated_client, credit_instance):
+        """Test that outside a test transaction the batch opens its own read-only snapshot."""
+        response = self.batch(authenticated_client, [
+            {'path': reverse('credit-list')}, {'path': reverse('bank-list')},
+        ], consistent=True)
+        assert [item['status'] for item in response.data['responses']] == [200, 200]
+
+    def test_rejected_paths(self, authenticated_client):
+        """Test that nested batches, streams and non-API paths are refused."""
+        response = self.batch(authenticated_client, [
+            {'path': reverse('batch')}, {'path': reverse('event-stream')}, {'path': '/admin/'},
+        ])
+        assert [item['status'] for item in response.data['responses']] == [400, 400, 400]
+
+    def test_max_requests(self, authenticated_client, settings):
+        """Test that batches are capped."""
+        settings.BATCH_MAX_REQUESTS = 1
+        response = self.batch(authenticated_client, [{'path': reverse('bank-list')}] * 2)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_requires_authentication(self, api_client):
+        """Test that anonymous batches are rejected before running anything."""
+        response = self.batch(api_client, [{'path': reverse('bank-list')}])
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+class TestCompression:
+    """Tests for negotiated response compression and streamed list pages."""
+
+    @pytest.fixture(autouse=True)
+    def banks(self):
+        for index in range(20):
+            Bank.objects.create(name=f'Bank {index}', type_bank='GOVERNMENT', address=f'{index} Main Street')
+
+    def test_negotiate(self):
+        """Test encoding selection from Accept-Encoding."""
+        assert negotiate('gzip, br, zstd') == 'zstd'
+        assert negotiate('gzip;q=1.0, br;q=0.5') == 'gzip'
+        assert negotiate('br;q=0, gzip;q=0.1') == 'gzip'
+        assert negotiate('*') == 'zstd'
+        assert negotiate('identity') is None
+        assert negotiate('') is None
+
+    def test_gzip(self, authenticated_client):
+        """Test that large JSON responses are gzip-compressed."""
+        plain = authenticated_client.get(reverse('bank-list'), {'page_size': 20})
+        response = authenticated_client.get(reverse('bank-list'), {'page_size': 20}, HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert int(response['Content-Length']) < len(plain.content)
+        assert json.loads(gzip.decompress(response.content)) == json.loads(plain.content)
+
+    @pytest.mark.parametrize('encoding', ['br', 'zstd'])
+    def test_other_encodings(self, authenticated_client, encoding):
+        """Test brotli and zstd compression."""
+        import brotli
+        import zstandard
+
+        decompress = {'br': brotli.decompress, 'zstd': zstandard.ZstdDecompressor().decompressobj().decompress}[encoding]
+        response = authenticated_client.get(reverse('bank-list'), {'page_size': 20}, HTTP_ACCEPT_ENCODING=encoding)
+        assert response['Content-Encoding'] == encoding
+        assert len(json.loads(decompress(response.content))['results']) == 20
+
+    def test_small_responses_untouched(self, authenticated_client):
+        """Test that bodies under the threshold are sent as is."""
+        response = authenticated_client.get(reverse('bank-list'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        assert not response.has_header('Content-Encoding')
+
+    def test_streamed_list_page(self, authenticated_client, settings):
+        """Test that large pages are streamed and compressed incrementally with the same body."""
+        plain = authenticated_client.get(reverse('bank-list'), {'page_size': 20})
+        settings.LIST_STREAMING_MIN_ROWS = 5
+        response = authenticated_client.get(reverse('bank-list'), {'page_size': 20}, HTTP_ACCEPT_ENCODING='gzip')
+        assert response.streaming
+        assert response['Content-Encoding'] == 'gzip'
+        body = gzip.decompress(b''.join(response.streaming_content))
+        assert json.loads(body) == json.loads(plain.content)
+
+
+@pytest.mark.django_db
+class TestStartup:
+    """Tests for the deferred admin/docs URLs and the precomputed schema."""
+
+    def test_lazy_include(self):
+        """Test that a lazily included URLconf resolves like include()."""
+        resolver = lazy_include('admin/', 'your_credit.admin_urls')
+        assert resolver.resolve('admin/login/').url_name == 'login'
+
+    def test_lazy_view(self, api_client):
+        """Test that a lazy view is built on first call and serves requests."""
+        view = lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema')
+        request = api_client.get(reverse('swagger-ui')).wsgi_request
+        assert view(request).status_code == status.HTTP_200_OK
+
+    def test_generate_schema(self, tmp_path):
+        """Test that the command writes every format and encoding."""
+        call_command('generate_schema', dir=str(tmp_path), stdout=io.StringIO())
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            'schema.json', 'schema.json.br', 'schema.json.gz', 'schema.json.zst',
+            'schema.yaml', 'schema.yaml.br', 'schema.yaml.gz', 'schema.yaml.zst',
+        ]
+        assert json.loads((tmp_path / 'schema.json').read_bytes())['openapi'].startswith('3.')
+        assert gzip.decompress((tmp_path / 'schema.yaml.gz').read_bytes()) == (tmp_path / 'schema.yaml').read_bytes()
+
+    def test_schema_covers_api_views(self, tmp_path):
+        """Test that the plain API views are described with their request and response bodies."""
+        call_command('generate_schema', dir=str(tmp_path), stdout=io.StringIO())
+        paths = json.loads((tmp_path / 'schema.json').read_bytes())['paths']
+        assert 'requestBody' in paths['/api/batch/']['post']
+        assert 'requestBody' in paths['/api/graphql/']['post']
+        changes = paths['/api/changes/']['get']
+        assert {parameter['name'] for parameter in changes['parameters']} >= {'since', 'limit', 'resources'}
+        assert '200' in changes['responses']
+
+    def test_schema_served_from_disk(self, api_client, settings, tmp_path):
+        """Test that precomputed files are served as is, without generating the schema."""
+        (tmp_path / 'schema.yaml').write_bytes(b'openapi: 3.0.3\n')
+        settings.OPENAPI_SCHEMA_DIR = str(tmp_path)
+        response = api_client.get(reverse('schema'))
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/vnd.oai.openapi'
+        assert response.content == b'openapi: 3.0.3\n'
+        assert 'max-age=300' in response['Cache-Control']
+
+    def test_schema_generated_when_missing(self, api_client, settings, tmp_path):
+        """Test that a missing schema is generated in-process and written to disk."""
+        settings.OPENAPI_SCHEMA_DIR = str(tmp_path / 'openapi')
+        response = api_client.get(reverse('schema'), {'format': 'json'})
+        assert response['Content-Type'] == 'application/vnd.oai.openapi+json'
+        assert '/api/creditos/' in json.loads(response.content)['paths']
+        assert (tmp_path / 'openapi' / 'schema.json').read_bytes() == response.content
+
+    def test_schema_etag(self, api_client, settings, tmp_path):
+        """Test conditional requests against the schema ETag."""
+        call_command('generate_schema', dir=str(tmp_path), stdout=io.StringIO())
+        settings.OPENAPI_SCHEMA_DIR = str(tmp_path)
+        etag = api_client.get(reverse('schema'))['ETag']
+        response = api_client.get(reverse('schema'), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert api_client.get(reverse('schema'), {'format': 'json'}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_schema_precompressed(self, api_client, settings, tmp_path):
+        """Test that the precompressed copy matching Accept-Encoding is served."""
+        call_command('generate_schema', dir=str(tmp_path), stdout=io.StringIO())
+        settings.OPENAPI_SCHEMA_DIR = str(tmp_path)
+        plain = api_client.get(reverse('schema'))
+        response = api_client.get(reverse('schema'), HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert response['ETag'] != plain['ETag']
+        assert gzip.decompress(response.content) == plain.content
+
+
+@pytest.mark.django_db
+class TestRateLimiting:
+    """Tests for cost-based throttles and the concurrency limiter."""
+
+    @pytest.fixture(autouse=True)
+    def clear_buckets(self):
+        cache.clear()
+        yield
+        cache.clear()
+
+    def test_consume(self):
+        """Test that a bucket refuses spend over its limit and refills over time."""
+        assert consume('test', 6, limit=10, period=60, now=0) == 0
+        assert consume('test', 6, limit=10, period=60, now=1) == 59
+        assert consume('test', 4, limit=10, period=60, now=2) == 0
+        # Half of the previous window's spend has drained.
+        assert consume('test', 5, limit=10, period=60, now=90) == 0
+        assert consume('test', 1, limit=10, period=60, now=90) > 0
+
+    def test_search_costs_more(self, authenticated_client, settings):
+        """Test that searches exhaust the budget faster than plain lists."""
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'user': '10/min'}}
+        assert authenticated_client.get(reverse('bank-list'), {'search': 'a'}).status_code == 200
+        assert authenticated_client.get(reverse('bank-list'), {'search': 'a'}).status_code == 200
+        response = authenticated_client.get(reverse('bank-list'), {'search': 'a'})
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response['Retry-After']) > 0
+        assert authenticated_client.get(reverse('bank-list'), {'search': 'a'}).status_code == 429
+
+    def test_scoped_budgets(self, authenticated_client, settings):
+        """Test that each endpoint scope has its own budget."""
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'banks': '2/min'}}
+        assert authenticated_client.get(reverse('bank-list')).status_code == 200
+        assert authenticated_client.get(reverse('bank-list')).status_code == 429
+        assert authenticated_client.get(reverse('client-list')).status_code == 200
+
+    def test_export_cost(self, authenticated_client, settings):
+        """Test that an export is charged its own cost."""
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'credits': '25/min'}}
+        assert authenticated_client.post(reverse('credit-export')).status_code == 202
+        assert authenticated_client.post(reverse('credit-export')).status_code == 429
+        assert authenticated_client.get(reverse('credit-list')).status_code == 200
+
+    def test_concurrency_per_client(self, authenticated_client, settings):
+        """Test that a client over its in-flight limit gets a 429."""
+        settings.CONCURRENCY_LIMIT_PER_CLIENT = 1
+        key = ConcurrencyLimitMiddleware(lambda request: None).client_key(
+            authenticated_client.get(reverse('bank-list')).wsgi_request
+        )
+        cache.set(f'{key}:0', 'other request')
+        response = authenticated_client.get(reverse('bank-list'))
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response['Retry-After'] == '1'
+        cache.delete(f'{key}:0')
+        assert authenticated_client.get(reverse('bank-list')).status_code == 200
+        assert cache.get(f'{key}:0') is None
+
+    def test_concurrency_global(self, authenticated_client, settings):
+        """Test that requests beyond the global in-flight limit are shed with a 503."""
+        settings.CONCURRENCY_LIMIT = 2
+        cache.set_many({'concurrency:all:0': 'a', 'concurrency:all:1': 'b'})
+        assert authenticated_client.get(reverse('bank-list')).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert authenticated_client.get('/').status_code == 200
+
+    def test_streamed_response_holds_its_slot(self, rf, settings):
+        """Test that a streamed response keeps its slot until the server closes it."""
+        settings.CONCURRENCY_LIMIT = 1
+        settings.CONCURRENCY_LIMIT_PER_CLIENT = 0
+        middleware = ConcurrencyLimitMiddleware(lambda request: StreamingHttpResponse(iter([b'a', b'b'])))
+        response = middleware(rf.get('/api/bancos/'))
+        assert cache.get('concurrency:all:0') is not None
+        assert middleware(rf.get('/api/bancos/')).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert b''.join(response.streaming_content) == b'ab'
+        assert cache.get('concurrency:all:0') is not None
+        response.close()
+        assert cache.get('concurrency:all:0') is None
+
+    def test_leaked_slot_expires(self, rf, settings):
+        """Test that a slot never released, as by a killed worker, comes back once its lease expires."""
+        settings.CONCURRENCY_LIMIT = 1
+        settings.CONCURRENCY_LIMIT_PER_CLIENT = 0
+        settings.CONCURRENCY_SLOT_TIMEOUT = 1
+        middleware = ConcurrencyLimitMiddleware(lambda request: HttpResponse())
+        leaked = middleware(rf.get('/api/bancos/'))
+        assert middleware(rf.get('/api/bancos/')).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        time.sleep(1.1)
+        response = middleware(rf.get('/api/bancos/'))
+        assert response.status_code == status.HTTP_200_OK
+        # The leaked request's late release leaves the new lease alone.
+        leaked.close()
+        assert middleware(rf.get('/api/bancos/')).status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        response.close()
+        assert cache.get('concurrency:all:0') is None
+
+    def test_throttle_cache_must_be_shared(self, settings):
+        """Test that a per-process THROTTLE_CACHE fails the deployment checks."""
+        assert [error.id for error in check_throttle_cache(None)] == ['core.E001']
+        settings.CACHES = {**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}
+        settings.THROTTLE_CACHE = 'shared'
+        assert check_throttle_cache(None) == []
+
+
+class TestGroupCommitWriter:
+    """Tests for batching concurrent writes into shared flushes."""
+
+    @pytest.fixture
+    def writer(self, settings):
+        settings.TEST_WRITER_MAX_ROWS = 5
+        settings.TEST_WRITER_MAX_DELAY_MS = 200
+        batches = []
+
+        def flush(objects):
+            batches.append([obj.value for obj in objects])
+            if any(obj.value == 'bad' for obj in objects):
+                raise ValueError('bad row')
+
+        writer = GroupCommitWriter(flush, 'TEST_WRITER')
+        writer.batches = batches
+        yield writer
+        assert writer.stop(timeout=5)
+
+    def item(self, value):
+        return SimpleNamespace(pk=None, _state=SimpleNamespace(adding=True), value=value)
+
+    def test_batches(self, writer):
+        """Test that queued objects are flushed together up to MAX_ROWS."""
+        futures = [writer.submit(self.item(number)) for number in range(10)]
+        assert [future.result(timeout=5).value for future in futures] == list(range(10))
+        assert writer.batches == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+
+    def test_failed_row_isolated(self, writer):
+        """Test that a failing object only fails its own submitter."""
+        futures = [writer.submit(self.item(value)) for value in ('a', 'bad', 'c')]
+        assert futures[0].result(timeout=5).value == 'a'
+        with pytest.raises(ValueError):
+            futures[1].result(timeout=5)
+        assert futures[2].result(timeout=5).value == 'c'
+        assert writer.batches == [['a', 'bad', 'c'], ['a'], ['bad'], ['c']]
+
+    def test_withdraw_before_flush(self, settings):
+        """Test that an object can be withdrawn while queued, but not once its batch started."""
+        settings.TEST_WRITER_MAX_ROWS = 5
+        settings.TEST_WRITER_MAX_DELAY_MS = 0
+        started, release, batches = threading.Event(), threading.Event(), []
+
+        def flush(objects):
+            batches.append([obj.value for obj in objects])
+            started.set()
+            release.wait(timeout=5)
+
+        writer = GroupCommitWriter(flush, 'TEST_WRITER')
+        running = writer.submit(self.item('running'))
+        assert started.wait(timeout=5)
+        withdrawn, kept = writer.submit(self.item('withdrawn')), writer.submit(self.item('kept'))
+        assert not running.cancel() and withdrawn.cancel()
+        release.set()
+        assert kept.result(timeout=5).value == 'kept' and running.result(timeout=5).value == 'running'
+        assert batches == [['running'], ['kept']]
+        assert writer.stop(timeout=5)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_connection_kept_between_batches(self, settings):
+        """Test that the writer thread writes every batch on one connection and closes it when stopped."""
+        settings.TEST_WRITER_MAX_ROWS = 1
+        settings.TEST_WRITER_MAX_DELAY_MS = 0
+        connections_used = []
+
+        def flush(objects):
+            connection.ensure_connection()
+            connections_used.append(connection.connection)
+
+        writer = GroupCommitWriter(flush, 'TEST_WRITER')
+        for number in range(3):
+            writer.submit(self.item(number)).result(timeout=5)
+        assert len(connections_used) == 3 and len(set(map(id, connections_used))) == 1
+        assert writer.stop(timeout=5)
+        assert connections_used[0].closed
+
+    def test_stop_writes_queued_objects(self, writer):
+        """Test that stop() writes what is queued before ending the thread, and submit() starts a new one."""
+        futures = [writer.submit(self.item(number)) for number in range(3)]
+        assert writer.stop(timeout=5)
+        assert all(future.done() for future in futures)
+        assert writer.submit(self.item('again')).result(timeout=5).value == 'again'
+
+    def test_drain(self, writer):
+        """Test that drain waits for everything submitted so far."""
+        assert writer.drain(timeout=0)
+        futures = [writer.submit(self.item(number)) for number in range(3)]
+        assert writer.drain(timeout=5)
+        assert all(future.done() for future in futures)
+
+
+@pytest.mark.django_db
+class TestSoftDeleteAdmin:
+    """Tests for the soft-delete aware, keyset-paged admin changelists."""
+
+    @pytest.fixture
+    def admin_client(self, client, django_user_model, settings):
+        # Admin pages link static files; tests run without a collectstatic manifest.
+        settings.STORAGES = {
+            **settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        client.force_login(django_user_model.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        return client
+
+    @pytest.fixture
+    def credits(self, credit_instance):
+        Credit.objects.bulk_create(
+            Credit(
+                client=credit_instance.client, bank=credit_instance.bank, description=f'Credit {number}',
+                minimum_payment=Decimal('100.00'), maximum_payment=Decimal('200.00'), term_months=12,
+                credit_type='AUTOMOTIVE',
+            )
+            for number in range(4)
+        )
+        return list(Credit.objects.order_by('-pk'))
+
+    def changelist(self, client, params=None):
+        response = client.get(reverse('admin:credits_credit_changelist'), params or {})
+        assert response.status_code == 200
+        return response
+
+    def test_hides_soft_deleted_rows(self, admin_client, credits):
+        """Test that soft-deleted rows only show up through the deleted filter."""
+        Credit.objects.filter(pk=credits[0].pk).soft_delete()
+        assert credits[0] not in self.changelist(admin_client).context['cl'].result_list
+        assert list(self.changelist(admin_client, {'deleted': 'yes'}).context['cl'].result_list) == [credits[0]]
+        assert len(self.changelist(admin_client, {'deleted': 'all'}).context['cl'].result_list) == len(credits)
+
+    def test_queries_do_not_grow_with_rows(self, admin_client, credits):
+        """Test that clients and banks are joined instead of queried per row."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as few:
+            self.changelist(admin_client)
+        Credit.objects.bulk_create(
+            Credit(
+                client=credits[0].client, bank=credits[0].bank, description='More', minimum_payment=Decimal('1.00'),
+                maximum_payment=Decimal('2.00'), term_months=6, credit_type='COMMERCIAL',
+            )
+            for _ in range(10)
+        )
+        cache.clear()
+        with CaptureQueriesContext(connection) as many:
+            self.changelist(admin_client)
+        assert len(many) == len(few)
+
+    def test_keyset_pages(self, admin_client, credits, monkeypatch):
+        """Test that pages follow ?after=<pk> cursors under the default ordering."""
+        from apps.credits.admin import CreditAdmin
+        monkeypatch.setattr(CreditAdmin, 'list_per_page', 2)
+        seen, params = [], {}
+        while True:
+            cl = self.changelist(admin_client, params).context['cl']
+            seen.extend(cl.result_list)
+            if cl.next_cursor is None:
+                break
+            params = {'after': cl.next_cursor}
+        assert seen == credits
+
+        # Other orderings keep page numbers.
+        cl = self.changelist(admin_client, {'o': '5', 'p': '2'}).context['cl']
+        assert not cl.keyset and len(cl.result_list) == 2
+
+    def test_invalid_cursor(self, admin_client, credits):
+        """Test that a malformed cursor resets the changelist like other bad parameters."""
+        response = admin_client.get(reverse('admin:credits_credit_changelist'), {'after': 'x'})
+        assert response.status_code == 302 and 'e=1' in response.url
+
+    def test_search(self, admin_client, credits):
+        """Test that search matches word prefixes of credits and of their clients."""
+        assert list(self.changelist(admin_client, {'q': 'credit 3'}).context['cl'].result_list) == [credits[0]]
+        assert len(self.changelist(admin_client, {'q': 'test cli'}).context['cl'].result_list) == len(credits)
+        assert list(self.changelist(admin_client, {'q': 'nobody'}).context['cl'].result_list) == []
+
+    @pytest.mark.parametrize('model, index', [
+        (Client, 'clients_client_search_idx'),
+        (Credit, 'credits_credit_search_idx'),
+    ])
+    def test_search_uses_index(self, rf, model, index):
+        """Test that admin searches are answered from the full-text indexes."""
+        from django.contrib import admin
+        queryset, _ = admin.site._registry[model].get_search_results(rf.get('/'), model.objects.all(), 'john')
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                plan = queryset.explain()
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        assert index in plan
+
+    def test_bulk_actions_are_single_updates(self, admin_client, credits):
+        """Test that soft delete and restore update the selected rows with one statement each."""
+        url = reverse('admin:credits_credit_changelist')
+        selected = [credit.pk for credit in credits[:3]]
+        with CaptureQueriesContext(connection) as queries:
+            response = admin_client.post(url, {'action': 'soft_delete_selected', '_selected_action': selected})
+        assert response.status_code == 302
+        assert len([q for q in queries if q['sql'].startswith('UPDATE "credits_credit"')]) == 1
+        assert set(Credit.objects.filter(deleted_at__isnull=False).values_list('pk', flat=True)) == set(selected)
+        assert credits[0].client.credit_summary.credit_count == len(credits) - 3
+
+        response = admin_client.post(
+            f'{url}?deleted=yes', {'action': 'restore_selected', '_selected_action': selected},
+        )
+        assert response.status_code == 302
+        assert not Credit.objects.filter(deleted_at__isnull=False).exists()
+
+    def test_no_hard_delete_action(self, admin_client, credits):
+        """Test that the stock delete action is not offered."""
+        actions = self.changelist(admin_client).context['action_form'].fields['action'].choices
+        assert 'delete_selected' not in dict(actions)
+
+    def test_client_bank_lookup(self, admin_client, credit_instance):
+        """Test that clients can still be narrowed to one bank without the bank filter."""
+        response = admin_client.get(
+            reverse('admin:clients_client_changelist'), {'bank__id__exact': credit_instance.bank_id},
+        )
+        assert response.status_code == 200
+        assert list(response.context['cl'].result_list) == [credit_instance.client]
+
+
+@pytest.mark.django_db
+class TestSnapshots:
+    """Tests for the columnar snapshot command and job."""
+
+    @pytest.fixture(autouse=True)
+    def snapshot_settings(self, settings, media_root):
+        settings.SNAPSHOT_CHUNK_SIZE = 2
+        settings.CHANGE_FEED_SAFETY_LAG = 0
+
+    @pytest.fixture
+    def credits(self, credit_instance):
+        extra = [
+            Credit.objects.create(
+                client=credit_instance.client, description=f'Car {number}', minimum_payment=Decimal('100.10'),
+                maximum_payment=Decimal('900.99'), term_months=12, bank=credit_instance.bank, credit_type='AUTOMOTIVE',
+            )
+            for number in range(2)
+        ]
+        return [credit_instance, *extra]
+
+    def run(self, *args):
+        out = io.StringIO()
+        call_command('snapshot', *args, stdout=out)
+        return out.getvalue()
+
+    def read(self, media_root, table):
+        path, = (media_root / 'snapshots').glob(f'{table}-*.parquet')
+        return pq.ParquetFile(path)
+
+    def test_full_snapshot(self, media_root, credits):
+        """Test that every table is written with typed columns, one row group per chunk."""
+        credits[2].soft_delete()
+        output = self.run()
+        assert 'credits: 2 rows in 1 row groups' in output
+
+        snapshot = self.read(media_root, 'credits')
+        assert snapshot.schema_arrow.field('maximum_payment').type == pa.decimal128(12, 2)
+        rows = snapshot.read().to_pylist()
+        assert [row['id'] for row in rows] == [credits[0].pk, credits[1].pk]
+        assert rows[0]['maximum_payment'] == Decimal('2000.00')
+        assert rows[0]['registration_date'] == credits[0].registration_date
+        assert rows[1]['client_id'] == credits[0].client_id
+        assert self.read(media_root, 'clients').read().column('full_name').to_pylist() == ['Test Client']
+        assert self.read(media_root, 'banks').metadata.num_rows == 1
+
+    def test_row_groups(self, media_root, credits):
+        """Test that rows are written in row groups of SNAPSHOT_CHUNK_SIZE."""
+        self.run('credits')
+        snapshot = self.read(media_root, 'credits')
+        assert [snapshot.metadata.row_group(index).num_rows for index in range(snapshot.num_row_groups)] == [2, 1]
+
+    def test_incremental_and_filters(self, media_root, credits):
+        """Test that --since returns changed rows, soft-deleted included, and that filters apply."""
+        since = credits[2].updated_at
+        credits[1].soft_delete()
+        self.run('credits', '--since', since.isoformat(), '--filter', 'credit_type=AUTOMOTIVE')
+        rows = self.read(media_root, 'credits').read().to_pylist()
+        assert [(row['id'], row['deleted_at'] is not None) for row in rows] == [(credits[1].pk, True), (credits[2].pk, False)]
+
+        with pytest.raises(CommandError, match='Unknown filters'):
+            self.run('credits', '--filter', 'colour=red')
+        with pytest.raises(CommandError):
+            self.run('credits', '--filter', 'term_months=many')
+
+    def test_job(self, authenticated_client, media_root, credits):
+        """Test that the API queues a snapshot job whose result is an Arrow file."""
+        url = reverse('credit-snapshot') + f'?credit_type=MORTGAGE&bank={credits[0].bank_id}'
+        response = authenticated_client.post(url, {'format': 'arrow'}, format='json')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert jobs.run_job(response.data['id']) == 'SUCCEEDED'
+
+        job = Job.objects.get(pk=response.data['id'])
+        assert job.result['rows'] == 1 and job.result['since'] is None
+        with job.result_file.open('rb') as handle:
+            table = pa.ipc.open_file(handle).read_all()
+        assert table.column('id').to_pylist() == [credits[0].pk]
+
+        invalid = authenticated_client.post(reverse('client-snapshot') + '?age=old', {}, format='json')
+        assert invalid.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestBinaryFormats:
+    """Tests for MessagePack and CBOR request and response bodies."""
+
+    def credit_body(self, credit_instance):
+        return {
+            'client': credit_instance.client_id, 'description': 'Binary loan', 'minimum_payment': Decimal('123.45'),
+            'maximum_payment': Decimal('6789.10'), 'term_months': 24, 'bank': credit_instance.bank_id,
+            'credit_type': 'COMMERCIAL',
+        }
+
+    def test_msgpack_list(self, authenticated_client, credit_instance):
+        """Test that list pages are packed with native timestamps and exact decimal strings."""
+        response = authenticated_client.get(reverse('credit-list'), HTTP_ACCEPT='application/msgpack')
+        assert response['Content-Type'] == 'application/msgpack'
+        row = msgpack.unpackb(response.content, timestamp=3)['results'][0]
+        assert row['minimum_payment'] == '500.00'
+        assert row['registration_date'] == credit_instance.registration_date
+        assert row['created_at'] == credit_instance.created_at
+
+        as_json = authenticated_client.get(reverse('credit-list')).json()['results'][0]
+        assert as_json['minimum_payment'] == '500.00'
+
+    def test_cbor_detail(self, authenticated_client, credit_instance):
+        """Test that detail bodies carry decimal fractions, timestamps and dates."""
+        url = reverse('client-detail', kwargs={'pk': credit_instance.client_id})
+        response = authenticated_client.get(url, {'format': 'cbor'})
+        assert response['Content-Type'] == 'application/cbor'
+        body = cbor2.loads(response.content)
+        assert body['birth_date'] == credit_instance.client.birth_date
+        assert body['maximum_payment_total'] == Decimal('2000.00')
+        credit = body['credits'][0]
+        assert credit['maximum_payment'] == Decimal('2000.00')
+        assert credit['updated_at'] == credit_instance.updated_at
+        assert credit['bank']['created_at'] == credit_instance.bank.created_at
+
+    @pytest.mark.parametrize('content_type, encode', [
+        ('application/cbor', cbor2.dumps), ('application/msgpack', msgpack.packb),
+    ])
+    def test_create(self, authenticated_client, credit_instance, content_type, encode):
+        """Test that binary request bodies are parsed, decimals included, and replayed with their key."""
+        body = self.credit_body(credit_instance)
+        if content_type == 'application/msgpack':
+            body.update(minimum_payment='123.45', maximum_payment='6789.10')
+        responses = [
+            authenticated_client.post(
+                reverse('credit-list'), encode(body), content_type=content_type,
+                HTTP_ACCEPT=content_type, HTTP_IDEMPOTENCY_KEY='binary',
+            )
+            for _ in range(2)
+        ]
+        assert [response.status_code for response in responses] == [201, 201]
+        assert responses[1]['Idempotent-Replayed'] == 'true'
+        created = Credit.objects.get(description='Binary loan')
+        assert (created.minimum_payment, created.maximum_payment) == (Decimal('123.45'), Decimal('6789.10'))
+
+    def test_batch(self, authenticated_client, credit_instance):
+        """Test that composite requests accept and return binary bodies."""
+        payload = cbor2.dumps({'requests': [
+            {'method': 'POST', 'path': reverse('credit-list'), 'body': self.credit_body(credit_instance)},
+            {'path': reverse('credit-detail', kwargs={'pk': credit_instance.pk})},
+        ]})
+        response = authenticated_client.post(
+            reverse('batch'), payload, content_type='application/cbor', HTTP_ACCEPT='application/cbor',
+        )
+        created, detail = cbor2.loads(response.content)['responses']
+        assert created['status'] == 201
+        assert created['body']['minimum_payment'] == Decimal('123.45')
+        assert detail['body']['registration_date'] == credit_instance.registration_date
+
+    def test_malformed_body(self, authenticated_client):
+        """Test that undecodable bodies are rejected with 400."""
+        for content_type in ('application/msgpack', 'application/cbor'):
+            response = authenticated_client.post(reverse('bank-list'), b'\xc1\xff', content_type=content_type)
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestGraphQL:
+    """Tests for the /api/graphql/ endpoint."""
+
+    GRAPH = '''
+        query {
+          banks(first: 10) {
+            name credit_count
+            clients(first: 5) {
+              full_name
+              credits(first: 5) { description minimum_payment bank { name } client { full_name } }
+            }
+          }
+        }
+    '''
+
+    def query(self, client, query, variables=None):
+        return client.post(reverse('graphql'), {'query': query, 'variables': variables}, format='json')
+
+    def add_bank(self, number, clients=2, credits=2):
+        bank = Bank.objects.create(name=f'Bank {number}', type_bank='PRIVATE', address='Street')
+        today = date.today()
+        for client_number in range(clients):
+            client = Client.objects.create(
+                full_name=f'Client {number}.{client_number}', birth_date=today.replace(year=today.year - 30), age=30,
+                nationality='USA', address='Avenue', email='client@example.com', phone='+1234567890',
+                person_type='INDIVIDUAL', bank=bank,
+            )
+            Credit.objects.bulk_create(
+                Credit(
+                    client=client, bank=bank, description=f'Loan {number}.{client_number}.{credit_number}',
+                    minimum_payment=Decimal('100.00'), maximum_payment=Decimal('200.00'), term_months=12,
+                    credit_type='AUTOMOTIVE',
+                )
+                for credit_number in range(credits)
+            )
+        return bank
+
+    def test_nested_query(self, authenticated_client):
+        """Test that a client -> credits -> bank graph resolves in one request."""
+        self.add_bank(1)
+        response = self.query(authenticated_client, self.GRAPH)
+        assert response.status_code == status.HTTP_200_OK and 'errors' not in response.data
+        bank = response.data['data']['banks'][0]
+        assert bank['name'] == 'Bank 1' and bank['credit_count'] == 4
+        assert len(bank['clients']) == 2
+        credit = bank['clients'][0]['credits'][0]
+        assert credit['minimum_payment'] == '100.00'
+        assert credit['bank'] == {'name': 'Bank 1'}
+        assert credit['client'] == {'full_name': bank['clients'][0]['full_name']}
+
+    def test_one_query_per_level(self, authenticated_client):
+        """Test that the number of queries does not grow with the rows returned."""
+        self.add_bank(1, clients=1, credits=1)
+        with CaptureQueriesContext(connection) as few:
+            self.query(authenticated_client, self.GRAPH)
+        for number in range(2, 5):
+            self.add_bank(number, clients=3, credits=3)
+        with CaptureQueriesContext(connection) as many:
+            response = self.query(authenticated_client, self.GRAPH)
+        assert len(response.data['data']['banks']) == 4
+        # Banks, their clients and the clients' credits; credit banks and clients come from the cache.
+        assert len(many) == len(few) == 3
+
+    def test_nested_pages_per_parent(self, authenticated_client):
+        """Test that first/offset on a nested list page each parent's rows."""
+        self.add_bank(1, clients=1, credits=3)
+        self.add_bank(2, clients=1, credits=3)
+        response = self.query(authenticated_client, '''
+            { clients { full_name credits(first: 2, offset: 1) { description } } }
+        ''')
+        for client in response.data['data']['clients']:
+            number = client['full_name'].split()[-1]
+            assert [credit['description'] for credit in client['credits']] == [f'Loan {number}.1', f'Loan {number}.0']
+
+    def test_lookup_and_filters(self, authenticated_client, credit_instance):
+        """Test single lookups, root filters and soft-deleted rows."""
+        response = self.query(authenticated_client, '''
+            query ($id: ID!, $bank: ID) {
+              credit(id: $id) { description term_months }
+              missing: client(id: "999999") { id }
+              credits(bank: $bank, credit_type: "MORTGAGE") { id }
+            }
+        ''', {'id': credit_instance.pk, 'bank': credit_instance.bank_id})
+        data = response.data['data']
+        assert data['credit'] == {'description': 'Home Loan', 'term_months': 36}
+        assert data['missing'] is None
+        assert data['credits'] == [{'id': str(credit_instance.pk)}]
+
+        credit_instance.soft_delete()
+        response = self.query(authenticated_client, '{ credits { id } clients { credits { id } } }')
+        assert response.data['data'] == {'credits': [], 'clients': [{'credits': []}]}
+
+    def test_expensive_queries_are_rejected_before_running(self, authenticated_client, settings):
+        """Test that queries above the cost or depth limits never reach the database."""
+        settings.GRAPHQL_MAX_COST = 1000
+        with CaptureQueriesContext(connection) as queries:
+            response = self.query(authenticated_client, '''
+                { banks(first: 100) { clients(first: 100) { full_name } } }
+            ''')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'exceeds the maximum of 1000' in response.data['errors'][0]['message']
+        assert len(queries) == 0
+
+        # A variable page size is priced at the largest page it could ask for.
+        response = self.query(authenticated_client, 'query ($n: Int!) { banks(first: $n) { name } }', {'n': 1})
+        assert response.status_code == status.HTTP_200_OK
+
+        settings.GRAPHQL_MAX_DEPTH = 3
+        response = self.query(authenticated_client, '''
+            fragment deep on Credit { client { bank { name } } }
+            { credits(first: 1) { ...deep } }
+        ''')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'depth 4' in response.data['errors'][0]['message']
+
+    def test_invalid_requests(self, authenticated_client):
+        """Test syntax errors, unknown fields, bad page sizes and missing authentication."""
+        assert self.query(authenticated_client, '{ banks {').status_code == status.HTTP_400_BAD_REQUEST
+        response = self.query(authenticated_client, '{ banks { secret } }')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = self.query(authenticated_client, '{ banks(first: -1) { name } }')
+        assert response.data['data'] is None and 'first must be' in response.data['errors'][0]['message']
+        assert self.query(APIClient(), '{ banks { name } }').status_code == status.HTTP_401_UNAUTHORIZED
+
+
+SHARDS = ['shard1', 'shard2']
+
+
+@pytest.fixture(scope='session')
+def shard_databases(django_db_setup, django_db_blocker):
+    """Two extra PostgreSQL test databases next to the default one, created once per session."""
+    default = connections.settings['default']
+    old_names = {}
+    with django_db_blocker.unblock():
+        for alias in SHARDS:
+            connections.settings[alias] = {
+                **copy.deepcopy(default), 'TEST': {**default['TEST'], 'NAME': f"{default['NAME']}_{alias}"},
+            }
+            old_names[alias] = default['NAME']
+            connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    yield SHARDS
+    with django_db_blocker.unblock():
+        for alias in SHARDS:
+            connections[alias].close()
+            connections[alias].creation.destroy_test_db(old_names[alias], verbosity=0)
+            del connections.settings[alias]
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', *SHARDS])
+class TestSharding:
+    """Tests for sharding clients and credits by bank across databases."""
+
+    @pytest.fixture
+    def shards(self, shard_databases, settings):
+        settings.SHARD_DATABASES = SHARDS
+        settings.AUDIT_HISTORY_ASYNC = False
+        cache.clear()
+        call_command('init_shards', skip_migrate=True, stdout=io.StringIO())
+        return ['default', *SHARDS]
+
+    @pytest.fixture
+    def banks(self, shards):
+        # Each new bank goes to the shard holding the fewest banks.
+        return [
+            Bank.objects.create(name=f'Bank {number}', type_bank='PRIVATE', address='Street')
+            for number in range(len(shards))
+        ]
+
+    def add_credit(self, bank, name='Client'):
+        today = date.today()
+        client = Client.objects.create(
+            full_name=f'{name} {bank.pk}', birth_date=today.replace(year=today.year - 40), age=40,
+            nationality='USA', address='Avenue', email='client@example.com', phone='+1234567890',
+            person_type='INDIVIDUAL', bank=bank,
+        )
+        return Credit.objects.create(
+            client=client, description=f'Loan of {bank.name}', minimum_payment=Decimal('100.00'),
+            maximum_payment=Decimal('500.00'), term_months=12, bank=bank, credit_type='AUTOMOTIVE',
+        )
+
+    @pytest.fixture
+    def credits(self, banks):
+        return [self.add_credit(bank) for bank in banks]
+
+    def test_banks_are_placed_and_replicated(self, shards, banks):
+        """Test that banks spread over the shards and every shard holds every bank."""
+        assert [bank.shard for bank in banks] == shards
+        for alias in shards:
+            assert set(Bank.objects.using(alias).values_list('pk', 'shard')) == {(bank.pk, bank.shard) for bank in banks}
+
+        banks[0].name = 'Renamed'
+        banks[0].save()
+        assert Bank.objects.using('shard2').get(pk=banks[0].pk).name == 'Renamed'
+
+    def test_rows_live_on_their_bank_shard(self, shards, credits):
+        """Test that clients, credits and client summaries are written to their bank's shard."""
+        for index, (alias, credit) in enumerate(zip(shards, credits)):
+            assert credit._state.db == alias
+            assert credit.pk // SHARD_ID_SPAN == index and credit.client_id // SHARD_ID_SPAN == index
+            for other in set(shards) - {alias}:
+                assert not Credit.objects.using(other).filter(pk=credit.pk).exists()
+            summary = ClientCreditSummary.objects.using(alias).get(pk=credit.client_id)
+            assert summary.credit_count == 1
+            assert BankCreditSummary.objects.get(pk=credit.bank_id).credit_count == 1
+
+    def test_list_gathers_every_shard(self, authenticated_client, credits):
+        """Test that unfiltered lists merge the shards in the list ordering, page by page."""
+        seen = []
+        url, params = reverse('credit-list'), {'page_size': 2}
+        while url:
+            response = authenticated_client.get(url, params)
+            assert response.status_code == 200 and response.data['count'] == len(credits)
+            seen.extend(credit['id'] for credit in response.data['results'])
+            url, params = response.data['next'], None
+        # Newest registration first.
+        assert seen == [credit.pk for credit in reversed(credits)]
+
+        response = authenticated_client.get(reverse('client-list'), {'ordering': 'full_name'})
+        assert [client['id'] for client in response.data['results']] == [credit.client_id for credit in credits]
+
+    def test_estimated_count_sums_the_shards(self, authenticated_client, credits, settings):
+        """Test that ?count=estimate over every shard counts, or estimates, shard by shard."""
+        params = {'count': 'estimate', 'page_size': 2}
+        response = authenticated_client.get(reverse('credit-list'), params)
+        assert response.status_code == 200
+        assert response.data['count'] == len(credits) and response.data['count_is_estimate'] is False
+        assert response.data['next'] is not None
+
+        settings.PAGINATION_ESTIMATE_THRESHOLD = 0
+        response = authenticated_client.get(reverse('credit-list'), params)
+        assert response.status_code == 200 and response.data['count_is_estimate'] is True
+        assert response.data['count'] >= len(SHARDS) + 1
+
+    def test_bank_filter_reads_one_shard(self, authenticated_client, credits):
+        """Test that bank-filtered lists and detail routes query only the bank's shard."""
+        credit = credits[1]
+        with CaptureQueriesContext(connections['shard1']) as used, \
+                CaptureQueriesContext(connections['shard2']) as unused:
+            response = authenticated_client.get(reverse('credit-list'), {'bank': credit.bank_id})
+            assert [row['id'] for row in response.data['results']] == [credit.pk]
+            response = authenticated_client.get(reverse('client-detail', kwargs={'pk': credit.client_id}))
+            assert response.status_code == 200 and response.data['credits'][0]['id'] == credit.pk
+        assert len(used) and not len(unused)
+
+    def test_updates_stay_on_the_shard(self, authenticated_client, credits):
+        """Test that updates, soft deletes and history work on rows of any shard."""
+        credit = credits[2]
+        url = reverse('credit-detail', kwargs={'pk': credit.pk})
+        response = authenticated_client.patch(url, {'maximum_payment': '900.00'}, format='json')
+        assert response.status_code == 200
+        assert Credit.objects.using('shard2').get(pk=credit.pk).maximum_payment == Decimal('900.00')
+        assert ClientCreditSummary.objects.using('shard2').get(pk=credit.client_id).maximum_payment_total == Decimal('900.00')
+
+        history = authenticated_client.get(reverse('credit-history', kwargs={'pk': credit.pk}))
+        assert [entry['action'] for entry in history.data['results']] == ['update', 'insert']
+
+        assert authenticated_client.delete(url).status_code == 204
+        assert authenticated_client.get(url).status_code == 404
+
+    def test_create_through_api(self, authenticated_client, credits):
+        """Test that credits created through the API land with their bank and client."""
+        bank, client_id = credits[1].bank, credits[1].client_id
+        response = authenticated_client.post(reverse('credit-list'), {
+            'client': client_id, 'bank': bank.pk, 'description': 'New', 'minimum_payment': '1.00',
+            'maximum_payment': '2.00', 'term_months': 6, 'credit_type': 'MORTGAGE',
+        }, format='json')
+        assert response.status_code == 201
+        assert Credit.objects.using('shard1').filter(pk=response.data['id']).exists()
+
+    def test_bank_summary_rolls_back_with_the_shard(self, credits):
+        """Test that a credit write failing on its shard leaves the bank summary on the default database as it was."""
+        credit = credits[2]
+        # The client summary going negative fails the delete on shard2, after the bank summary was updated.
+        ClientCreditSummary.objects.using('shard2').filter(pk=credit.client_id).update(credit_count=0)
+        with pytest.raises(IntegrityError):
+            credit.delete()
+        assert Credit.objects.using('shard2').filter(pk=credit.pk).exists()
+        assert BankCreditSummary.objects.get(pk=credit.bank_id).credit_count == 1
+
+    def test_idempotency_key_covers_the_shard_write(self, authenticated_client, credits, monkeypatch):
+        """Test that a keyed request failing after its shard write keeps neither the row nor the key."""
+        def fail(self, data):
+            raise APIException()
+
+        monkeypatch.setattr(CreditViewSet, 'get_success_headers', fail)
+        response = authenticated_client.post(reverse('credit-list'), {
+            'client': credits[1].client_id, 'bank': credits[1].bank_id, 'description': 'Keyed',
+            'minimum_payment': '1.00', 'maximum_payment': '2.00', 'term_months': 6, 'credit_type': 'MORTGAGE',
+        }, format='json', HTTP_IDEMPOTENCY_KEY='shard-key')
+        assert response.status_code == 500
+        assert not Credit.objects.using('shard1').filter(description='Keyed').exists()
+        assert not IdempotencyKey.objects.exists()
+        assert BankCreditSummary.objects.get(pk=credits[1].bank_id).credit_count == 1
+
+    def test_cross_shard_credit_is_rejected(self, authenticated_client, credits):
+        """Test that a credit cannot join a bank and a client living on different shards."""
+        response = authenticated_client.post(reverse('credit-list'), {
+            'client': credits[2].client_id, 'bank': credits[1].bank_id, 'description': 'Split',
+            'minimum_payment': '1.00', 'maximum_payment': '2.00', 'term_months': 6, 'credit_type': 'MORTGAGE',
+        }, format='json')
+        assert response.status_code == 400 and 'bank' in response.data
+
+    def test_change_feed_and_batch_cover_every_shard(self, authenticated_client, credits, settings):
+        """Test that the change feed and ?ids= batches read rows from every shard."""
+        settings.CHANGE_FEED_SAFETY_LAG = 0
+        response = authenticated_client.get(reverse('changes'), {'resources': 'credits'})
+        assert {change['id'] for change in response.data['results']} == {credit.pk for credit in credits}
+
+        ids = ','.join(str(credit.pk) for credit in reversed(credits))
+        response = authenticated_client.get(reverse('credit-list'), {'ids': ids, 'expand': 'client'})
+        assert [credit['id'] for credit in response.data['results']] == [credit.pk for credit in reversed(credits)]
+        assert len(response.data['included']['clients']) == len(credits)
+
+    def test_rebalance_moves_a_bank(self, authenticated_client, credits):
+        """Test that rebalance_banks moves a bank's rows to another shard, keeping ids and timestamps."""
+        credit = credits[1]
+        out = io.StringIO()
+        call_command('rebalance_banks', credit.bank_id, to='shard2', grace=0, stdout=out)
+        assert '1 clients, 1 credits' in out.getvalue()
+
+        assert Bank.objects.get(pk=credit.bank_id).shard == 'shard2'
+        assert not Credit.objects.using('shard1').exists() and not Client.objects.using('shard1').exists()
+        moved = Credit.objects.using('shard2').get(pk=credit.pk)
+        assert moved.registration_date == credit.registration_date and moved.client_id == credit.client_id
+        assert ClientCreditSummary.objects.using('shard2').get(pk=credit.client_id).credit_count == 1
+
+        response = authenticated_client.get(reverse('credit-list'), {'bank': credit.bank_id})
+        assert [row['id'] for row in response.data['results']] == [credit.pk]
+        assert authenticated_client.get(reverse('credit-detail', kwargs={'pk': credit.pk})).status_code == 200
+        self.add_credit(Bank.objects.get(pk=credit.bank_id), name='Later')
+        assert Credit.objects.using('shard2').filter(bank_id=credit.bank_id).count() == 2
+
+    def test_rebalance_catches_up_with_writes(self, credits, monkeypatch):
+        """Test that rows written to the source while a bank is copied are moved too, and only copies are deleted."""
+        credit = credits[1]
+        bank = Bank.objects.get(pk=credit.bank_id)
+        copy = rebalance_banks.Command.copy
+
+        def copy_then_write(command, model, queryset, target, batch_size, copied):
+            copy(command, model, queryset, target, batch_size, copied)
+            if model is Credit:
+                # Lands on shard1: the bank has not been switched over yet.
+                self.add_credit(bank, name='During')
+                changed = Credit.objects.using('shard1').get(pk=credit.pk)
+                changed.description = 'Changed'
+                changed.save()
+
+        monkeypatch.setattr(rebalance_banks.Command, 'copy', copy_then_write)
+        call_command('rebalance_banks', bank.pk, to='shard2', grace=0, stdout=io.StringIO())
+        moved = Credit.objects.using('shard2').filter(bank_id=bank.pk)
+        assert moved.count() == 2 and moved.get(pk=credit.pk).description == 'Changed'
+        assert not Credit.objects.using('shard1').exists() and not Client.objects.using('shard1').exists()
+        for summary in ClientCreditSummary.objects.using('shard2').filter(client__bank_id=bank.pk):
+            assert summary.credit_count == 1 and summary.maximum_payment_total == Decimal('500.00')
+
+    def test_stale_shard_map_is_fenced(self, credits):
+        """Test that a process still placing a moved bank on its old shard writes to the new one."""
+        credit = credits[1]
+        stale = Credit.objects.using('shard1').get(pk=credit.pk)
+        call_command('rebalance_banks', credit.bank_id, to='shard2', grace=0, stdout=io.StringIO())
+        # As a process that has not reloaded its bank map yet sees it.
+        bank_shard_map()._current()[credit.bank_id] = 'shard1'
+        later = self.add_credit(Bank.objects.get(pk=credit.bank_id), name='Later')
+        assert later._state.db == 'shard2' and later.client._state.db == 'shard2'
+
+        bank_shard_map()._current()[credit.bank_id] = 'shard1'
+        stale.description = 'Stale'
+        stale.save()
+        assert Credit.objects.using('shard2').get(pk=credit.pk).description == 'Stale'
+        assert not Credit.objects.using('shard1').exists() and not Client.objects.using('shard1').exists()
+        assert ClientCreditSummary.objects.using('shard2').get(pk=credit.client_id).credit_count == 1
+
+    def test_rebalance_keeps_credits_with_their_clients(self, shards, banks):
+        """Test that banks whose credits and clients are linked have to move together."""
+        other = Bank.objects.create(name='Partner', type_bank='PRIVATE', address='Street', shard=banks[1].shard)
+        credit = self.add_credit(banks[1])
+        Credit.objects.create(
+            client=credit.client, description='Partner loan', minimum_payment=Decimal('1.00'),
+            maximum_payment=Decimal('2.00'), term_months=6, bank=other, credit_type='COMMERCIAL',
+        )
+        with pytest.raises(CommandError, match=str(other.pk)):
+            call_command('rebalance_banks', banks[1].pk, to='shard2', grace=0, stdout=io.StringIO())
+
+        call_command('rebalance_banks', banks[1].pk, other.pk, to='shard2', grace=0, stdout=io.StringIO())
+        assert Credit.objects.using('shard2').count() == 2
+
+    def test_graphql_reads_every_shard(self, authenticated_client, credits):
+        """Test that GraphQL relations are batch-loaded from the shard of each row."""
+        with CaptureQueriesContext(connections['shard1']) as queries:
+            response = authenticated_client.post(reverse('graphql'), {
+                'query': '{ banks(first: 5) { name clients(first: 5) { full_name credits(first: 5) { description bank { name } } } } }',
+            }, format='json')
+        banks = response.data['data']['banks']
+        assert sorted(bank['clients'][0]['credits'][0]['description'] for bank in banks) == sorted(
+            credit.description for credit in credits
+        )
+        # Clients, then credits.
+        assert len(queries) == 2
+
+    def test_snapshot_gathers_every_shard(self, settings, media_root, credits):
+        """Test that snapshots stream the rows of every shard in id order."""
+        settings.SNAPSHOT_CHUNK_SIZE = 2
+        call_command('snapshot', 'credits', stdout=io.StringIO())
+        path, = (media_root / 'snapshots').glob('credits-*.parquet')
+        snapshot = pq.ParquetFile(path)
+        assert snapshot.read().column('id').to_pylist() == sorted(credit.pk for credit in credits)
+        assert snapshot.num_row_groups == 2
+
+    def test_rebuild_summaries_per_shard(self, credits):
+        """Test that summaries rebuilt from scratch match the incrementally maintained ones."""
+        from apps.credits.summaries import rebuild_summaries
+        counts = rebuild_summaries()
+        assert counts == {ClientCreditSummary: len(credits), BankCreditSummary: len(credits)}
+        for credit in credits:
+            assert ClientCreditSummary.objects.using(credit._state.db).get(pk=credit.client_id).credit_count == 1
+            assert BankCreditSummary.objects.get(pk=credit.bank_id).credit_count == 1
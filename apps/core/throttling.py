@@ -0,0 +1,184 @@
+"""
+Rate limiting and load shedding.
+
+Throttles charge every request a cost (THROTTLE_COSTS: searches, exports and
+simulations cost more than a retrieve) against buckets kept in the cache with
+atomic increments, one per identity overall (``user``/``anon`` rates) and one
+per identity and endpoint (``throttle_scope`` on the view). A bucket is a
+sliding-window counter: the previous window's spend decays linearly, which
+behaves like a token bucket refilled continuously at ``limit`` per period
+while costing three cache operations per check.
+
+ConcurrencyLimitMiddleware caps the API requests in flight, per client (429)
+and overall (503), so excess load is refused immediately instead of queueing
+in front of busy workers. A limit of N is N slot keys; a request leases a free
+one (``cache.add`` with a random token) and holds it until its response is
+closed, after the last byte of a streamed body. Leases expire after
+CONCURRENCY_SLOT_TIMEOUT seconds, so the slots of a worker killed mid-request
+come back on their own, and a release only deletes the slot while it still
+holds the request's own token.
+
+Both share state through the THROTTLE_CACHE cache, which must be shared by all
+worker processes (``check --deploy`` fails otherwise, core.E001).
+"""
+from functools import partial
+import hashlib
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'600/min' -> (600, 60)."""
+    limit, period = rate.split('/')
+    return int(limit), PERIODS[period[0]]
+
+
+def consume(key, cost, limit, period, now=None):
+    """
+    Charge ``cost`` to the bucket ``key``; returns 0 when allowed, otherwise the
+    seconds until the bucket can afford it (nothing is charged then).
+    """
+    cache = caches[settings.THROTTLE_CACHE]
+    now = time.time() if now is None else now
+    window, offset = divmod(now, period)
+    current, previous = f'{key}:{int(window)}', f'{key}:{int(window) - 1}'
+
+    cache.add(current, 0, timeout=2 * period)
+    try:
+        spent = cache.incr(current, cost)
+    except ValueError:  # Expired between add() and incr().
+        cache.add(current, cost, timeout=2 * period)
+        spent = cost
+    carried = cache.get(previous, 0) * (1 - offset / period)
+    if spent + carried <= limit:
+        return 0
+
+    cache.decr(current, cost)
+    excess = spent + carried - limit
+    if carried and excess <= carried:
+        # The previous window's spend drains at previous/period per second.
+        return excess * period / cache.get(previous, 1)
+    return period - offset
+
+
+def request_cost(request, view):
+    """Cost of ``request``: per action, overridable per view with ``throttle_costs``."""
+    costs = {**settings.THROTTLE_COSTS, **getattr(view, 'throttle_costs', {})}
+    action = getattr(view, 'action', None)
+    if action == 'list' and request.query_params.get(api_settings.SEARCH_PARAM):
+        action = 'search'
+    return costs.get(action, costs['default'])
+
+
+class CostRateThrottle(BaseThrottle):
+    """Base for throttles charging request_cost() against a DEFAULT_THROTTLE_RATES bucket."""
+
+    def get_scope(self, request, view):
+        raise NotImplementedError
+
+    def get_identity(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        limit, period = parse_rate(rate)
+        self.delay = consume(
+            f'throttle:{scope}:{self.get_identity(request)}', request_cost(request, view), limit, period
+        )
+        return not self.delay
+
+    def wait(self):
+        return self.delay
+
+
+class IdentityRateThrottle(CostRateThrottle):
+    """Overall budget of each user (``user`` rate) or anonymous client address (``anon`` rate)."""
+
+    def get_scope(self, request, view):
+        return 'user' if request.user and request.user.is_authenticated else 'anon'
+
+
+class ScopedCostRateThrottle(CostRateThrottle):
+    """Budget of each identity on one endpoint, named by the view's ``throttle_scope``."""
+
+    def get_scope(self, request, view):
+        return getattr(view, 'throttle_scope', None)
+
+
+def _acquire(cache, key, limit, token):
+    """Lease one of the ``limit`` slots of ``key`` to ``token``; returns the slot's key, None when all are held."""
+    # A random starting slot keeps concurrent requests from racing for the same free one.
+    start = random.randrange(limit)
+    slots = [f'{key}:{(start + n) % limit}' for n in range(limit)]
+    held = cache.get_many(slots)
+    for slot in slots:
+        if slot not in held and cache.add(slot, token, timeout=settings.CONCURRENCY_SLOT_TIMEOUT):
+            return slot
+    return None
+
+
+def _release(cache, slot, token):
+    # Once the lease expired, the slot may be leased to another request.
+    if cache.get(slot) == token:
+        cache.delete(slot)
+
+
+class ConcurrencyLimitMiddleware(MiddlewareMixin):
+    """Refuse API requests beyond CONCURRENCY_LIMIT_PER_CLIENT (429) or CONCURRENCY_LIMIT (503) in flight."""
+
+    def client_key(self, request):
+        # Users are not authenticated yet: the credentials themselves identify the client.
+        credentials = request.headers.get('Authorization') or request.META.get('REMOTE_ADDR', '')
+        return 'concurrency:' + hashlib.sha256(credentials.encode()).hexdigest()[:32]
+
+    def reject(self, status, detail):
+        response = JsonResponse({'detail': detail}, status=status)
+        response['Retry-After'] = str(settings.CONCURRENCY_RETRY_AFTER)
+        return response
+
+    def process_request(self, request):
+        if not request.path.startswith('/api/') or request.path.startswith(settings.CONCURRENCY_EXEMPT_PATHS):
+            return None
+        cache = caches[settings.THROTTLE_CACHE]
+        token = uuid.uuid4().hex
+        slots = []
+        if settings.CONCURRENCY_LIMIT_PER_CLIENT:
+            slot = _acquire(cache, self.client_key(request), settings.CONCURRENCY_LIMIT_PER_CLIENT, token)
+            if slot is None:
+                return self.reject(429, 'Too many concurrent requests from this client.')
+            slots.append(slot)
+        if settings.CONCURRENCY_LIMIT:
+            slot = _acquire(cache, 'concurrency:all', settings.CONCURRENCY_LIMIT, token)
+            if slot is None:
+                self.release(slots, token)
+                return self.reject(503, 'Server is at capacity, retry shortly.')
+            slots.append(slot)
+        request._concurrency_slots = (slots, token)
+        return None
+
+    def release(self, slots, token):
+        cache = caches[settings.THROTTLE_CACHE]
+        for slot in slots:
+            _release(cache, slot, token)
+
+    def process_response(self, request, response):
+        slots, token = getattr(request, '_concurrency_slots', ((), None))
+        if slots:
+            # A streamed body is still being sent when this runs; the server closes the response after it.
+            response._resource_closers.append(partial(self.release, slots, token))
+        return response
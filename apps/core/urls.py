@@ -0,0 +1,7 @@
+from rest_framework import routers
+from apps.core.views import JobViewSet
+
+router = routers.DefaultRouter()
+router.register(r'', JobViewSet, basename='job')
+
+urlpatterns = router.urls
@@ -1,3 +1,131 @@
-from django.shortcuts import render
+from django.http import FileResponse, Http404
+from drf_spectacular.utils import extend_schema
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+from apps.core.changes import InvalidCursor, get_changes
+from apps.core.composite import execute_batch
+from apps.core.models import Job
+from apps.core.serializers import (
+    BatchRequestSerializer, BatchResponseSerializer, ChangeFeedQuerySerializer, ChangeFeedSerializer,
+    GraphQLRequestSerializer, GraphQLResponseSerializer, JobProgressSerializer, JobSerializer,
+)
 
-# Create your views here.
+
+def job_accepted_response(job, request):
+    """202 response returned by endpoints that hand their work to a background job."""
+    return Response(
+        JobSerializer(job, context={'request': request}).data,
+        status=status.HTTP_202_ACCEPTED,
+        headers={'Location': reverse('job-detail', kwargs={'pk': job.pk}, request=request)},
+    )
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for background jobs.
+    Provides: list, retrieve, progress, result
+    """
+    queryset = Job.objects.filter(deleted_at__isnull=True)
+    serializer_class = JobSerializer
+
+    # Filtering
+    filterset_fields = ['name', 'status']
+
+    # Ordering
+    ordering_fields = ['created_at', 'finished_at']
+    ordering = ['-created_at']
+
+    def get_queryset(self):
+        """Users only see the jobs they started; staff see every job."""
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def progress(self, request, pk=None):
+        job = self.get_object()
+        return Response(JobProgressSerializer(job).data)
+
+    @action(detail=True, methods=['get'])
+    def result(self, request, pk=None):
+        """Download the result file, or return the JSON result when the job produced no file."""
+        job = self.get_object()
+        if job.status != 'SUCCEEDED':
+            return Response(
+                {'detail': f'Job is {job.status.lower()}.', 'status': job.status},
+                status=status.HTTP_409_CONFLICT,
+            )
+        if not job.result_file:
+            return Response(job.result)
+        try:
+            handle = job.result_file.open('rb')
+        except FileNotFoundError:
+            raise Http404('Result file is no longer available.')
+        return FileResponse(handle, as_attachment=True, filename=job.result_file.name.rsplit('/', 1)[-1])
+
+
+class ChangeFeedView(APIView):
+    """
+    Inserts, updates and soft-deletes across banks, clients and credits in updated_at order.
+    Pass the returned next_cursor as ?since= on the next poll.
+    """
+    throttle_scope = 'changes'
+
+    @extend_schema(parameters=[ChangeFeedQuerySerializer], responses=ChangeFeedSerializer)
+    def get(self, request):
+        params = ChangeFeedQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        try:
+            changes, next_cursor, has_more = get_changes(
+                cursor=params.validated_data.get('since'),
+                limit=params.validated_data['limit'],
+                resources=params.validated_data.get('resources'),
+                context={'request': request},
+            )
+        except InvalidCursor as exc:
+            return Response({'since': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': changes, 'next_cursor': next_cursor, 'has_more': has_more})
+
+
+class BatchView(APIView):
+    """
+    Run several API calls in one request: authenticated once, executed in order on
+    one database connection. With "consistent": true the (GET-only) calls read
+    from a single snapshot. Each sub-request gets its own status and body.
+    """
+
+    @extend_schema(request=BatchRequestSerializer, responses=BatchResponseSerializer)
+    def post(self, request):
+        serializer = BatchRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses = execute_batch(
+            request, serializer.validated_data['requests'], consistent=serializer.validated_data['consistent']
+        )
+        return Response({'responses': responses})
+
+
+class GraphQLView(APIView):
+    """
+    GraphQL over banks, clients and credits. Relations are loaded one query per
+    level, and queries priced above GRAPHQL_MAX_COST are refused before they run.
+    """
+    throttle_scope = 'graphql'
+
+    @extend_schema(request=GraphQLRequestSerializer, responses=GraphQLResponseSerializer)
+    def post(self, request):
+        # Imported here: graphql-core is the slowest import of the API and only this view needs it.
+        from apps.core.graph import execute_query
+
+        serializer = GraphQLRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        body, status_code = execute_query(
+            serializer.validated_data['query'],
+            variables=serializer.validated_data.get('variables'),
+            operation_name=serializer.validated_data.get('operationName'),
+            request=request,
+        )
+        return Response(body, status=status_code)
@@ -0,0 +1,23 @@
+"""
+Entry points for process-pool workers.
+
+Spawned workers unpickle these functions before Django is configured, so this
+module must stay importable without touching models or settings.
+"""
+import multiprocessing
+
+
+def get_context():
+    """Spawn instead of fork so children never share the parent's DB sockets."""
+    return multiprocessing.get_context('spawn')
+
+
+def setup():
+    """Pool initializer: configure Django in a freshly spawned interpreter."""
+    import django
+    django.setup()
+
+
+def run_job(job_id):
+    from apps.core.jobs import run_job
+    return run_job(job_id)
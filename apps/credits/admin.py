@@ -1,10 +1,15 @@
 from django.contrib import admin
+from apps.core.admin import SoftDeleteAdmin
 from apps.credits.models import Credit
 
 # Register your models here.
 @admin.register(Credit)
-class CreditAdmin(admin.ModelAdmin):
+class CreditAdmin(SoftDeleteAdmin):
     list_display = ('credit_type', 'client', 'bank', 'term_months', 'registration_date')
+    # Credit.__str__ and the client/bank columns would otherwise query once per row.
+    list_select_related = ('client', 'bank')
+    # Matched through the full-text indexes of credits and their clients.
     search_fields = ('client__full_name', 'description')
-    list_filter = ('credit_type', 'bank', 'registration_date')
-    autocomplete_fields = ['client', 'bank']
\ No newline at end of file
+    search_relations = ('client',)
+    list_filter = ('credit_type', 'registration_date')
+    autocomplete_fields = ['client', 'bank']
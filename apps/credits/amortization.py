@@ -0,0 +1,68 @@
+"""
+Vectorized amortization engine.
+
+Credits store a monthly payment range and a term, not a principal, so schedules
+are derived from a level monthly payment (the credit's minimum or maximum
+payment) over ``term_months`` at a nominal annual rate: the financed principal
+is the present value of those payments. Every function works on arrays of
+payments and terms at once; this module only depends on NumPy.
+"""
+import numpy as np
+
+
+def monthly_rate(annual_rate):
+    """Nominal annual rate in percent -> monthly rate as a fraction."""
+    return float(annual_rate) / 100 / 12
+
+
+def annuity_factor(periods, rate):
+    """Present value of 1 paid at the end of each of ``periods`` months."""
+    periods = np.asarray(periods, dtype=np.float64)
+    if rate == 0:
+        return periods
+    # -expm1(-n*log1p(r)) == 1 - (1+r)^-n, without cancellation for small rates.
+    return -np.expm1(-periods * np.log1p(rate)) / rate
+
+
+def amortization_totals(payments, terms, annual_rate):
+    """
+    Closed-form totals for many credits.
+    Returns a dict of float64 arrays: principal, total_paid, total_interest.
+    """
+    payments = np.asarray(payments, dtype=np.float64)
+    terms = np.asarray(terms, dtype=np.int64)
+    principal = payments * annuity_factor(terms, monthly_rate(annual_rate))
+    total_paid = payments * terms
+    return {
+        'principal': principal,
+        'total_paid': total_paid,
+        'total_interest': total_paid - principal,
+    }
+
+
+def amortization_schedules(payments, terms, annual_rate):
+    """
+    Month-by-month schedules for many credits as (credits x max term) arrays.
+    Months past a credit's term are zero; ``mask`` marks the valid cells.
+    """
+    payments = np.asarray(payments, dtype=np.float64)
+    terms = np.asarray(terms, dtype=np.int64)
+    rate = monthly_rate(annual_rate)
+    months = np.arange(1, int(terms.max(initial=0)) + 1)
+
+    remaining = terms[:, None] - months[None, :]
+    mask = remaining >= 0
+    remaining = np.clip(remaining, 0, None)
+
+    opening_balance = payments[:, None] * annuity_factor(remaining + 1, rate)
+    interest = np.where(mask, opening_balance * rate, 0.0)
+    principal = np.where(mask, payments[:, None] - interest, 0.0)
+    balance = np.where(mask, payments[:, None] * annuity_factor(remaining, rate), 0.0)
+    return {
+        'months': months,
+        'mask': mask,
+        'payment': np.where(mask, payments[:, None], 0.0),
+        'interest': interest,
+        'principal': principal,
+        'balance': balance,
+    }
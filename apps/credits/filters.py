@@ -0,0 +1,21 @@
+import django_filters
+from apps.credits.models import Credit
+
+
+class CreditFilter(django_filters.FilterSet):
+    """
+    Filters for Credit list and exports: exact matches plus ranges on amounts,
+    terms and registration date (``?maximum_payment__gte=``, ``?term_months__range=12,60``).
+    """
+
+    class Meta:
+        model = Credit
+        fields = {
+            'credit_type': ['exact'],
+            'bank': ['exact'],
+            'client': ['exact'],
+            'minimum_payment': ['gte', 'lte', 'range'],
+            'maximum_payment': ['gte', 'lte', 'range'],
+            'term_months': ['exact', 'gte', 'lte', 'range'],
+            'registration_date': ['gte', 'lte', 'range'],
+        }
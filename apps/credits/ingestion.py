@@ -0,0 +1,38 @@
+"""
+Group-commit ingestion of single credit creations (CREDIT_GROUP_COMMIT).
+
+POST /api/creditos/ validates each credit in its request thread, then queues
+it on ``credit_writer``; the credits queued within a few milliseconds are
+inserted with one multi-row INSERT (summaries updated once per batch) and
+committed together, and each request answers with its own row. With shards,
+a batch holds one INSERT per shard, all inside transactions committed together.
+"""
+from collections import defaultdict
+
+from rest_framework.exceptions import APIException
+
+from apps.core.batching import GroupCommitWriter
+from apps.core.sharding import atomic_on, instance_shard
+from apps.credits.models import Credit
+
+
+class IngestionTimeout(APIException):
+    status_code = 503
+    default_detail = 'The credit could not be written in time and was not created; retry the request.'
+    default_code = 'ingestion_timeout'
+
+
+def insert_credits(credits):
+    by_shard = defaultdict(list)
+    for credit in credits:
+        by_shard[instance_shard(credit)].append(credit)
+    # A failing shard rolls the whole batch back, so the one-by-one retries never insert twice.
+    with atomic_on(*by_shard):
+        for alias, shard_credits in by_shard.items():
+            Credit.objects.using(alias).bulk_create(shard_credits)
+        for credit in credits:
+            credit._publish_event(adding=True, was_deleted=False)
+            credit._record_history(adding=True, was_deleted=False)
+
+
+credit_writer = GroupCommitWriter(insert_credits, 'CREDIT_GROUP_COMMIT')
@@ -0,0 +1,61 @@
+import csv
+import io
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+
+from apps.core.jobs import job
+from apps.core.sharding import scatter
+from apps.credits.filters import CreditFilter
+from apps.credits.models import Credit
+
+EXPORT_COLUMNS = [
+    'id', 'client_id', 'bank_id', 'description', 'minimum_payment', 'maximum_payment',
+    'term_months', 'credit_type', 'registration_date', 'created_at', 'updated_at',
+]
+# Query params accepted as credit filters by the export and simulation jobs.
+CREDIT_FILTERS = list(CreditFilter.base_filters)
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _filtered_credits(filters):
+    # Gathered from every shard.
+    return scatter(CreditFilter(filters or {}, queryset=Credit.objects.filter(deleted_at__isnull=True)).qs)
+
+
+@job('credits.export_csv')
+def export_csv(job_obj, **filters):
+    """Write the (optionally filtered) active credits to a CSV result file."""
+    queryset = _filtered_credits(filters).order_by('id')
+    total = queryset.count()
+
+    with tempfile.TemporaryFile() as tmp:
+        text = io.TextIOWrapper(tmp, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+        for written, row in enumerate(queryset.values_list(*EXPORT_COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE), 1):
+            writer.writerow(row)
+            if written % EXPORT_CHUNK_SIZE == 0:
+                job_obj.set_progress(written * 100 // total)
+        text.flush()
+        tmp.seek(0)
+        job_obj.store_result_file('credits.csv', File(tmp))
+        text.detach()
+
+    return {'rows': total}
+
+
+@job('credits.simulate_portfolio')
+def simulate_portfolio(job_obj, scenarios, paths, seed, payment='maximum', filters=None):
+    """Monte Carlo loss distributions of the credit book for each scenario."""
+    # Imported here: jobs modules load with every process, NumPy is only needed by this job.
+    from apps.credits.simulation import load_portfolio, run_simulation
+
+    portfolio = load_portfolio(_filtered_credits(filters))
+    results = run_simulation(
+        portfolio, scenarios, paths=paths, seed=seed, payment=payment,
+        workers=settings.CREDIT_SIMULATION_WORKERS,
+        on_result=lambda done, total: job_obj.set_progress(done * 100 // total),
+    )
+    return {'seed': seed, 'payment': payment, 'scenarios': results}
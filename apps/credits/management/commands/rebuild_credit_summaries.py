@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.credits.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-client and per-bank credit summaries from the credits table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT batch.')
+
+    def handle(self, *args, **options):
+        counts = rebuild_summaries(batch_size=options['batch_size'])
+        for model, created in counts.items():
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {created} rows')
@@ -0,0 +1,67 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_summaries(apps, schema_editor):
+    """Backfill the summaries from credits that existed before this migration."""
+    Credit = apps.get_model('credits', 'Credit')
+    active = Credit.objects.filter(deleted_at__isnull=True).order_by()
+    for model_name, owner_field in (('ClientCreditSummary', 'client_id'), ('BankCreditSummary', 'bank_id')):
+        model = apps.get_model('credits', model_name)
+        rows = active.values(owner_field).annotate(
+            credit_count=Count('id'),
+            minimum_payment_total=Sum('minimum_payment'),
+            maximum_payment_total=Sum('maximum_payment'),
+            automotive_count=Count('id', filter=Q(credit_type='AUTOMOTIVE')),
+            mortgage_count=Count('id', filter=Q(credit_type='MORTGAGE')),
+            commercial_count=Count('id', filter=Q(credit_type='COMMERCIAL')),
+        )
+        model.objects.bulk_create(
+            [model(pk=row.pop(owner_field), **row) for row in rows.iterator()], batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banks', '0001_initial'),
+        ('clients', '0001_initial'),
+        ('credits', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankCreditSummary',
+            fields=[
+                ('credit_count', models.PositiveIntegerField(default=0)),
+                ('minimum_payment_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('maximum_payment_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('automotive_count', models.PositiveIntegerField(default=0)),
+                ('mortgage_count', models.PositiveIntegerField(default=0)),
+                ('commercial_count', models.PositiveIntegerField(default=0)),
+                ('bank', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_summary', serialize=False, to='banks.bank')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ClientCreditSummary',
+            fields=[
+                ('credit_count', models.PositiveIntegerField(default=0)),
+                ('minimum_payment_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('maximum_payment_total', models.DecimalField(decimal_places=2, default=0, max_digits=18)),
+                ('automotive_count', models.PositiveIntegerField(default=0)),
+                ('mortgage_count', models.PositiveIntegerField(default=0)),
+                ('commercial_count', models.PositiveIntegerField(default=0)),
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_summary', serialize=False, to='clients.client')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:16
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('banks', '0002_bank_banks_bank_updated_idx'),
+        ('clients', '0003_client_age_birth_date_idx'),
+        ('credits', '0003_credit_credits_credit_updated_idx'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='credit',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['registration_date'], name='credits_credit_regdate_brin', pages_per_range=32),
+        ),
+        AddIndexConcurrently(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['credit_type', 'registration_date'], name='credits_credit_type_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['maximum_payment'], name='credits_credit_max_pay_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['minimum_payment'], name='credits_credit_min_pay_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('banks', '0002_bank_banks_bank_updated_idx'),
+        ('clients', '0003_client_age_birth_date_idx'),
+        ('credits', '0004_credit_range_filter_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='credit',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('description', config='simple'), name='credits_credit_search_idx'),
+        ),
+    ]
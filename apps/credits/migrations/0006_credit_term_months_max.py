@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:09
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('credits', '0005_credit_search_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='credit',
+            name='term_months',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(600)]),
+        ),
+    ]
@@ -1,7 +1,106 @@
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.contrib.postgres.search import SearchVector
 from django.db import models
-from django.core.validators import MinValueValidator
+from django.db.models import Count, F, Q, Sum
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.core.exceptions import ValidationError
-from apps.core.models import BaseModel
+from apps.core.models import BaseModel, SoftDeleteQuerySet
+from apps.core.sharding import atomic_on, fence, follow_moved_banks, instance_shard, using_shard
+
+# Credit columns that feed the per-client and per-bank summaries.
+SUMMARY_SOURCE_FIELDS = ['client_id', 'bank_id', 'credit_type', 'minimum_payment', 'maximum_payment', 'deleted_at']
+
+# Full-text document searched by the admin.
+SEARCH_DOCUMENT = SearchVector('description', config='simple')
+
+
+def _summary_deltas(rows, sign):
+    """
+    Turn credit contributions into summary increments keyed by (summary model, pk).
+    Each row is (client_id, bank_id, credit_type, count, minimum_total, maximum_total).
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for client_id, bank_id, credit_type, count, minimum_total, maximum_total in rows:
+        for model, pk in ((ClientCreditSummary, client_id), (BankCreditSummary, bank_id)):
+            delta = deltas[(model, pk)]
+            delta['credit_count'] += sign * count
+            delta[f'{credit_type.lower()}_count'] += sign * count
+            delta['minimum_payment_total'] += sign * (minimum_total or 0)
+            delta['maximum_payment_total'] += sign * (maximum_total or 0)
+    return deltas
+
+
+def _apply_summary_deltas(*delta_maps):
+    """Apply increments with UPDATE ... SET x = x + delta, creating missing summary rows."""
+    merged = defaultdict(lambda: defaultdict(int))
+    for deltas in delta_maps:
+        for key, delta in deltas.items():
+            for field, value in delta.items():
+                merged[key][field] += value
+
+    # Deterministic order keeps concurrent writers from deadlocking on summary rows.
+    for (model, pk), delta in sorted(merged.items(), key=lambda item: (item[0][0].__name__, item[0][1])):
+        changes = {field: F(field) + value for field, value in delta.items() if value}
+        if not changes:
+            continue
+        if not model.objects.filter(pk=pk).update(**changes):
+            model.objects.bulk_create([model(pk=pk)], ignore_conflicts=True)
+            model.objects.filter(pk=pk).update(**changes)
+
+
+def _grouped_contributions(queryset):
+    """Aggregate the active credits of a queryset into summary contribution rows."""
+    return (
+        queryset.filter(deleted_at__isnull=True)
+        .order_by()
+        .values_list('client_id', 'bank_id', 'credit_type')
+        .annotate(count=Count('id'), minimum_total=Sum('minimum_payment'), maximum_total=Sum('maximum_payment'))
+    )
+
+
+class CreditQuerySet(SoftDeleteQuerySet):
+    """Keeps the credit summaries current for bulk writes that bypass Credit.save()."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with using_shard(self.db), atomic_on(self.db):
+            fence(self.db, {obj.bank_id for obj in objs})
+            objs = super().bulk_create(objs, *args, **kwargs)
+            _apply_summary_deltas(_summary_deltas(
+                [(obj.client_id, obj.bank_id, obj.credit_type, 1, obj.minimum_payment, obj.maximum_payment)
+                 for obj in objs if obj.deleted_at is None],
+                1,
+            ))
+        return objs
+
+    def update(self, **kwargs):
+        summary_sources = {field.split('__')[0] for field in kwargs} & {'client', 'bank', *SUMMARY_SOURCE_FIELDS}
+        if not summary_sources and not settings.SHARD_DATABASES:
+            return super().update(**kwargs)
+        with using_shard(self.db), atomic_on(self.db):
+            fence(self.db, self.order_by().values_list('bank_id', flat=True).distinct())
+            if not summary_sources:
+                return super().update(**kwargs)
+            pks = list(self.select_for_update(of=('self',)).values_list('pk', flat=True))
+            affected = self.model.objects.filter(pk__in=pks)
+            before = _summary_deltas(_grouped_contributions(affected), -1)
+            rows = super().update(**kwargs)
+            _apply_summary_deltas(before, _summary_deltas(_grouped_contributions(affected), 1))
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        with using_shard(self.db), atomic_on(self.db):
+            fence(self.db, self.order_by().values_list('bank_id', flat=True).distinct())
+            _apply_summary_deltas(_summary_deltas(_grouped_contributions(self), -1))
+            return super().delete()
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 # Create your models here.
 class Credit(BaseModel):
@@ -15,19 +114,131 @@ class Credit(BaseModel):
     description = models.CharField(max_length=255)
     minimum_payment = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
     maximum_payment = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
-    term_months = models.PositiveIntegerField()
+    # 50 years; schedules allocate a row per month of the longest term on the page.
+    term_months = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(600)])
     registration_date = models.DateTimeField(auto_now_add=True)
     bank = models.ForeignKey('banks.Bank', on_delete=models.CASCADE, related_name='credits')
     credit_type = models.CharField(max_length=20, choices=CREDIT_TYPE_CHOICES)
 
+    objects = CreditQuerySet.as_manager()
+
+    event_resource = 'credits'
+    # Credit terms kept in the audit history.
+    history_fields = ('minimum_payment', 'maximum_payment', 'term_months', 'credit_type')
+    search_document = SEARCH_DOCUMENT
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            *BaseModel.Meta.indexes,
+            # registration_date only grows with inserts, so a tiny BRIN index serves date ranges.
+            BrinIndex(fields=['registration_date'], pages_per_range=32, name='credits_credit_regdate_brin'),
+            # Lists filtered by type and a date range, newest first, on active credits.
+            models.Index(
+                fields=['credit_type', 'registration_date'], name='credits_credit_type_date_idx',
+                condition=Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=['maximum_payment'], name='credits_credit_max_pay_idx', condition=Q(deleted_at__isnull=True),
+            ),
+            models.Index(
+                fields=['minimum_payment'], name='credits_credit_min_pay_idx', condition=Q(deleted_at__isnull=True),
+            ),
+            GinIndex(SEARCH_DOCUMENT, name='credits_credit_search_idx'),
+        ]
+
+    def event_payload(self):
+        return {'bank': self.bank_id, 'client': self.client_id, 'credit_type': self.credit_type}
+
     def clean(self):
         if self.minimum_payment is not None and self.maximum_payment is not None:
             if self.minimum_payment > self.maximum_payment:
                 raise ValidationError({'minimum_payment': 'Minimum payment cannot be greater than maximum payment.'})
 
+    def _summary_contribution(self, values):
+        """Summary contribution rows for the given column values (none for soft-deleted credits)."""
+        if values is None or values['deleted_at'] is not None:
+            return []
+        return [(values['client_id'], values['bank_id'], values['credit_type'], 1,
+                 values['minimum_payment'], values['maximum_payment'])]
+
+    def _stored_summary_values(self, alias):
+        """
+        The summary columns as stored, read with a row lock inside the write's transaction: the
+        values the instance was loaded with may be stale, and two writers subtracting the same
+        stale contribution would leave the summaries off for good.
+        """
+        if self._state.adding:
+            return None
+        return Credit.objects.using(alias).select_for_update().filter(pk=self.pk).values(*SUMMARY_SOURCE_FIELDS).first()
+
+    def _written_summary_values(self, stored, update_fields):
+        """
+        The summary columns once the save is written: the stored row with the fields the save
+        wrote. With ``update_fields`` the row keeps its other columns, whatever the instance holds.
+        """
+        written = {field: getattr(self, field) for field in SUMMARY_SOURCE_FIELDS}
+        if stored is None or update_fields is None:
+            return written
+        updated = {self._meta.get_field(name).attname for name in update_fields}
+        return {field: written[field] if field in updated else value for field, value in stored.items()}
+
+    @follow_moved_banks
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        # The client summary is updated on the credit's own shard and the bank summary on the default
+        # database, both in the transaction writing the credit.
+        alias = kwargs.get('using') or instance_shard(self)
+        with using_shard(alias), atomic_on(alias):
+            fence(alias, {self.bank_id, (self.loaded_values or {}).get('bank_id')})
+            stored = self._stored_summary_values(alias)
+            super().save(*args, **kwargs)
+            after = self._written_summary_values(stored, kwargs.get('update_fields'))
+            _apply_summary_deltas(
+                _summary_deltas(self._summary_contribution(stored), -1),
+                _summary_deltas(self._summary_contribution(after), 1),
+            )
+
+    @follow_moved_banks
+    def delete(self, *args, **kwargs):
+        alias = kwargs.get('using') or instance_shard(self)
+        with using_shard(alias), atomic_on(alias):
+            fence(alias, [self.bank_id])
+            _apply_summary_deltas(_summary_deltas(self._summary_contribution(self._stored_summary_values(alias)), -1))
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.credit_type} - {self.client}"
+
+
+class CreditSummary(models.Model):
+    """
+    Denormalized credit aggregates, maintained incrementally by Credit writes.
+    Rebuild from scratch with `manage.py rebuild_credit_summaries`.
+    """
+    credit_count = models.PositiveIntegerField(default=0)
+    minimum_payment_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    maximum_payment_total = models.DecimalField(max_digits=18, decimal_places=2, default=0)
+    automotive_count = models.PositiveIntegerField(default=0)
+    mortgage_count = models.PositiveIntegerField(default=0)
+    commercial_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ClientCreditSummary(CreditSummary):
+    client = models.OneToOneField(
+        'clients.Client', on_delete=models.CASCADE, primary_key=True, related_name='credit_summary'
+    )
+
+    def __str__(self):
+        return f"Summary - {self.client_id}"
+
+
+class BankCreditSummary(CreditSummary):
+    bank = models.OneToOneField(
+        'banks.Bank', on_delete=models.CASCADE, primary_key=True, related_name='credit_summary'
+    )
+
+    def __str__(self):
+        return f"Summary - {self.bank_id}"
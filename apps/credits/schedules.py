@@ -0,0 +1,83 @@
+"""
+Amortization schedules for Credit instances, cached per credit version.
+
+The cache key includes ``updated_at``, so editing a credit naturally retires
+its cached schedules without explicit invalidation.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _cache_key(credit, annual_rate, basis, include_schedule):
+    version = credit.updated_at.timestamp() if credit.updated_at else 0
+    kind = 'full' if include_schedule else 'totals'
+    return f'credit-schedule:{credit.pk}:{version}:{annual_rate:.2f}:{basis}:{kind}'
+
+
+def _money(values):
+    import numpy as np
+
+    return np.char.mod('%.2f', np.round(values, 2)).tolist()
+
+
+def _compute(credits, annual_rate, basis, include_schedule):
+    # Imported here: the credit views load with every web process, NumPy is only needed on a cache miss.
+    import numpy as np
+
+    from apps.credits.amortization import amortization_schedules, amortization_totals
+
+    payments = np.array([getattr(credit, f'{basis}_payment') for credit in credits], dtype=np.float64)
+    terms = np.array([credit.term_months for credit in credits], dtype=np.int64)
+    totals = amortization_totals(payments, terms, annual_rate)
+    principal, total_paid, total_interest = (
+        _money(totals['principal']), _money(totals['total_paid']), _money(totals['total_interest'])
+    )
+    monthly = _money(payments)
+
+    results = []
+    for i, credit in enumerate(credits):
+        results.append({
+            'credit': credit.pk,
+            'payment_basis': basis,
+            'annual_rate': f'{annual_rate:.2f}',
+            'monthly_payment': monthly[i],
+            'term_months': credit.term_months,
+            'principal': principal[i],
+            'total_paid': total_paid[i],
+            'total_interest': total_interest[i],
+        })
+
+    if include_schedule and credits:
+        schedules = amortization_schedules(payments, terms, annual_rate)
+        columns = {
+            name: np.char.mod('%.2f', np.round(schedules[name], 2))
+            for name in ('payment', 'interest', 'principal', 'balance')
+        }
+        months = schedules['months'].tolist()
+        for i, credit in enumerate(credits):
+            term = credit.term_months
+            rows = zip(months[:term], *(columns[name][i, :term].tolist() for name in columns))
+            results[i]['schedule'] = [
+                {'month': month, 'payment': payment, 'interest': interest, 'principal': principal, 'balance': balance}
+                for month, payment, interest, principal, balance in rows
+            ]
+    return results
+
+
+def credit_schedules(credits, annual_rate, basis='minimum', include_schedule=False):
+    """
+    Schedules (or just totals) for a list of credits, in the same order.
+    Cache misses are computed together in one vectorized pass.
+    """
+    credits = list(credits)
+    keys = [_cache_key(credit, annual_rate, basis, include_schedule) for credit in credits]
+    cached = cache.get_many(keys)
+
+    missing = [credit for credit, key in zip(credits, keys) if key not in cached]
+    if missing:
+        computed = _compute(missing, annual_rate, basis, include_schedule)
+        fresh = {_cache_key(credit, annual_rate, basis, include_schedule): result
+                 for credit, result in zip(missing, computed)}
+        cache.set_many(fresh, timeout=settings.CREDIT_SCHEDULE_CACHE_TIMEOUT)
+        cached.update(fresh)
+    return [cached[key] for key in keys]
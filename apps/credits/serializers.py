@@ -1,11 +1,24 @@
+import secrets
+from django.conf import settings
 from rest_framework import serializers
 from apps.credits.models import Credit
+from apps.banks.models import Bank
 from apps.banks.serializers import BankSerializer
+from apps.clients.models import Client
+from apps.core.fieldsets import SparseFieldsetSerializerMixin
+from apps.core.renderers import NativeValuesSerializerMixin
+from apps.core.relations import CachedRelatedField, CachedRelatedListSerializer
+from apps.core.sharding import check_same_shard
 
 
-class CreditSerializer(serializers.ModelSerializer):
+class CreditSerializer(SparseFieldsetSerializerMixin, NativeValuesSerializerMixin, serializers.ModelSerializer):
+    # Resolved from caches instead of one query each per write.
+    client = CachedRelatedField(Client, cache='ttl')
+    bank = CachedRelatedField(Bank, cache='versioned')
+
     class Meta:
         model = Credit
+        list_serializer_class = CachedRelatedListSerializer
         fields = [
             'id', 'client', 'description', 'minimum_payment', 'maximum_payment',
             'term_months', 'registration_date', 'bank', 'credit_type',
@@ -34,10 +47,14 @@ class CreditSerializer(serializers.ModelSerializer):
                     'minimum_payment': 'Minimum payment cannot be greater than maximum payment.'
                 })
 
+        # A credit, its client and its bank's other rows share one shard.
+        bank = attrs['bank'] if 'bank' in attrs else getattr(self.instance, 'bank', None)
+        check_same_shard(bank, attrs.get('client'), self.instance)
+
         return attrs
 
 
-class CreditWithBankSerializer(serializers.ModelSerializer):
+class CreditWithBankSerializer(SparseFieldsetSerializerMixin, NativeValuesSerializerMixin, serializers.ModelSerializer):
     """Credit serializer with nested bank details for read operations."""
     bank = BankSerializer(read_only=True)
 
@@ -48,3 +65,52 @@ class CreditWithBankSerializer(serializers.ModelSerializer):
             'term_months', 'registration_date', 'bank', 'credit_type',
             'created_at', 'updated_at'
         ]
+
+
+class ScheduleQuerySerializer(serializers.Serializer):
+    """Query parameters of the amortization schedule endpoints."""
+    annual_rate = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=0, max_value=100, required=False,
+        default=lambda: settings.CREDIT_SCHEDULE_DEFAULT_ANNUAL_RATE,
+    )
+    payment = serializers.ChoiceField(choices=['minimum', 'maximum'], default='minimum')
+    include_schedule = serializers.BooleanField(default=False)
+
+
+class ScenarioSerializer(serializers.Serializer):
+    """A stress scenario: default rates per credit type, optionally split by bank type."""
+    name = serializers.CharField(max_length=100)
+    default_rates = serializers.DictField()
+    loss_given_default = serializers.FloatField(min_value=0, max_value=1, default=0.45)
+
+    def _validate_rate(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1:
+            raise serializers.ValidationError("Default rates must be numbers between 0 and 1.")
+        return float(value)
+
+    def validate_default_rates(self, value):
+        rates = {}
+        for credit_type, rate in value.items():
+            if credit_type not in dict(Credit.CREDIT_TYPE_CHOICES):
+                raise serializers.ValidationError(f'Unknown credit type "{credit_type}".')
+            if isinstance(rate, dict):
+                unknown = set(rate) - set(dict(Bank.TYPE_CHOICES))
+                if unknown:
+                    raise serializers.ValidationError(f'Unknown bank type "{sorted(unknown)[0]}".')
+                rates[credit_type] = {bank_type: self._validate_rate(r) for bank_type, r in rate.items()}
+            else:
+                rates[credit_type] = self._validate_rate(rate)
+        return rates
+
+
+class SimulationSerializer(serializers.Serializer):
+    """Body of a portfolio risk simulation request."""
+    scenarios = ScenarioSerializer(many=True, allow_empty=False)
+    paths = serializers.IntegerField(min_value=100, max_value=100_000, default=10_000)
+    seed = serializers.IntegerField(min_value=0, required=False)
+    payment = serializers.ChoiceField(choices=['minimum', 'maximum'], default='maximum')
+
+    def validate(self, attrs):
+        # Record the seed actually used so every run can be reproduced.
+        attrs.setdefault('seed', secrets.randbits(32))
+        return attrs
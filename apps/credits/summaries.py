@@ -0,0 +1,121 @@
+"""
+Read and rebuild helpers for the denormalized credit summaries.
+
+Incremental maintenance lives on Credit and CreditQuerySet; this module exposes
+the summaries to querysets and serializers and recomputes them from scratch.
+"""
+from decimal import Decimal
+import django_filters
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from rest_framework import serializers
+from apps.core.sharding import atomic_on, shard_aliases
+from apps.credits.models import BankCreditSummary, ClientCreditSummary, Credit
+
+SUMMARY_FIELDS = [
+    'credit_count', 'minimum_payment_total', 'maximum_payment_total',
+    'automotive_count', 'mortgage_count', 'commercial_count',
+]
+AMOUNT_FIELDS = ['minimum_payment_total', 'maximum_payment_total']
+
+
+def summary_annotations(relation='credit_summary'):
+    """
+    Annotations reading the one-to-one summary row, so lists can sort and filter
+    on totals without aggregating the credits table. Missing rows read as zero.
+    """
+    annotations = {}
+    for field in SUMMARY_FIELDS:
+        if field in AMOUNT_FIELDS:
+            default = Value(Decimal('0.00'), output_field=models.DecimalField(max_digits=18, decimal_places=2))
+        else:
+            default = Value(0, output_field=models.PositiveIntegerField())
+        annotations[field] = Coalesce(F(f'{relation}__{field}'), default)
+    return annotations
+
+
+class CreditSummarySerializerMixin(serializers.Serializer):
+    """Read-only summary fields; list SUMMARY_FIELDS in Meta.fields of the concrete serializer."""
+    credit_count = serializers.IntegerField(read_only=True, default=0)
+    minimum_payment_total = serializers.DecimalField(
+        max_digits=18, decimal_places=2, read_only=True, default=Decimal('0.00')
+    )
+    maximum_payment_total = serializers.DecimalField(
+        max_digits=18, decimal_places=2, read_only=True, default=Decimal('0.00')
+    )
+    automotive_count = serializers.IntegerField(read_only=True, default=0)
+    mortgage_count = serializers.IntegerField(read_only=True, default=0)
+    commercial_count = serializers.IntegerField(read_only=True, default=0)
+
+
+class CreditSummaryFilterSet(django_filters.FilterSet):
+    """Filters on the annotated summary fields; subclass with a Meta for the owner model."""
+    credit_count = django_filters.NumberFilter()
+    credit_count__gte = django_filters.NumberFilter(field_name='credit_count', lookup_expr='gte')
+    credit_count__lte = django_filters.NumberFilter(field_name='credit_count', lookup_expr='lte')
+    minimum_payment_total__gte = django_filters.NumberFilter(field_name='minimum_payment_total', lookup_expr='gte')
+    minimum_payment_total__lte = django_filters.NumberFilter(field_name='minimum_payment_total', lookup_expr='lte')
+    maximum_payment_total__gte = django_filters.NumberFilter(field_name='maximum_payment_total', lookup_expr='gte')
+    maximum_payment_total__lte = django_filters.NumberFilter(field_name='maximum_payment_total', lookup_expr='lte')
+
+
+def _aggregate_by(owner_field, using=DEFAULT_DB_ALIAS):
+    active = Credit.objects.using(using).filter(deleted_at__isnull=True).order_by()
+    return active.values(owner_field).annotate(
+        credit_count=Count('id'),
+        minimum_payment_total=Sum('minimum_payment'),
+        maximum_payment_total=Sum('maximum_payment'),
+        automotive_count=Count('id', filter=Q(credit_type='AUTOMOTIVE')),
+        mortgage_count=Count('id', filter=Q(credit_type='MORTGAGE')),
+        commercial_count=Count('id', filter=Q(credit_type='COMMERCIAL')),
+    )
+
+
+def rebuild_summaries(batch_size=1000):
+    """
+    Recompute every summary row with two set-based aggregate queries per shard.
+    Client summaries are rebuilt on each shard; a bank's credits all live on one
+    shard, so the bank summaries (on the default database) are the per-shard
+    aggregates put together.
+    """
+    counts = {}
+    aliases = shard_aliases()
+    with atomic_on(*aliases):
+        for model, owner_field in ((ClientCreditSummary, 'client_id'), (BankCreditSummary, 'bank_id')):
+            targets = aliases if model is ClientCreditSummary else [DEFAULT_DB_ALIAS]
+            for target in targets:
+                model.objects.using(target).all().delete()
+            created = 0
+            for alias in aliases:
+                target = alias if model is ClientCreditSummary else DEFAULT_DB_ALIAS
+                rows = (
+                    model(pk=row.pop(owner_field), **row)
+                    for row in _aggregate_by(owner_field, alias).iterator()
+                )
+                while batch := [row for _, row in zip(range(batch_size), rows)]:
+                    model.objects.using(target).bulk_create(batch)
+                    created += len(batch)
+            counts[model] = created
+    return counts
+
+
+def refresh_client_summaries(client_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Recompute the summaries of ``client_ids`` on ``using`` while credits keep being
+    written: the summary rows are locked before the credits are aggregated, so a
+    concurrent write applies its delta on top of the recomputed values.
+    """
+    client_ids = list(client_ids)
+    with transaction.atomic(using=using):
+        summaries = ClientCreditSummary.objects.using(using)
+        summaries.bulk_create([ClientCreditSummary(pk=pk) for pk in client_ids], ignore_conflicts=True)
+        rows = {row.pk: row for row in summaries.select_for_update().filter(pk__in=client_ids).order_by('pk')}
+        for row in rows.values():
+            for field in SUMMARY_FIELDS:
+                setattr(row, field, 0)
+        for values in _aggregate_by('client_id', using).filter(client_id__in=client_ids):
+            row = rows[values.pop('client_id')]
+            for field, value in values.items():
+                setattr(row, field, value or 0)
+        summaries.bulk_update(rows.values(), SUMMARY_FIELDS)
@@ -1,14 +1,39 @@
+import io
+import threading
+import numpy as np
 import pytest
 from datetime import date
 from decimal import Decimal
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
-from apps.credits.models import Credit
+from apps.core.jobs import run_job
+from apps.core.models import IdempotencyKey, Job
+from apps.core.relations import model_cache
+from apps.credits.amortization import amortization_schedules, amortization_totals
+from apps.credits.filters import CreditFilter
+from apps.credits.ingestion import credit_writer, insert_credits
+from apps.credits.models import BankCreditSummary, ClientCreditSummary, Credit
+from apps.credits.serializers import CreditSerializer
+from apps.credits.simulation import BANK_TYPES, CREDIT_TYPES, load_portfolio, run_simulation
 from apps.clients.models import Client
 from apps.banks.models import Bank
 
 
+def explain_without_seqscan(queryset):
+    """EXPLAIN output for ``queryset`` with sequential scans disabled, as on a large table."""
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+        try:
+            return queryset.explain()
+        finally:
+            cursor.execute('RESET enable_seqscan')
+
+
 @pytest.fixture
 def api_client():
     return APIClient()
@@ -138,6 +163,16 @@ class TestCreditSerializer:
         response = authenticated_client.post(url, credit_data)
         assert response.status_code == status.HTTP_400_BAD_REQUEST
 
+    def test_term_months_limit(self, authenticated_client, credit_data):
+        """Test that terms beyond 600 months, which schedules would allocate per month, are rejected."""
+        url = reverse('credit-list')
+        credit_data['term_months'] = 2_000_000_000
+        response = authenticated_client.post(url, credit_data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'term_months' in response.data
+        credit_data['term_months'] = 600
+        assert authenticated_client.post(url, credit_data).status_code == status.HTTP_201_CREATED
+
 
 @pytest.mark.django_db
 class TestCreditAPI:
@@ -192,3 +227,724 @@ class TestCreditAPI:
         url = reverse('credit-list') + '?search=Home'
         response = authenticated_client.get(url)
         assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestCreditSummaries:
+    """Tests for the incrementally maintained per-client and per-bank summaries."""
+
+    def summaries(self, credit):
+        client_summary = ClientCreditSummary.objects.get(pk=credit.client_id)
+        bank_summary = BankCreditSummary.objects.get(pk=credit.bank_id)
+        return client_summary, bank_summary
+
+    def test_create_updates_summaries(self, credit_instance):
+        """Test that saving a new credit increments both summaries."""
+        for summary in self.summaries(credit_instance):
+            assert summary.credit_count == 1
+            assert summary.mortgage_count == 1
+            assert summary.minimum_payment_total == Decimal('500.00')
+            assert summary.maximum_payment_total == Decimal('2000.00')
+
+    def test_update_moves_contribution(self, credit_instance):
+        """Test that changing type and amounts replaces the old contribution."""
+        credit = Credit.objects.get(pk=credit_instance.pk)
+        credit.credit_type = 'AUTOMOTIVE'
+        credit.maximum_payment = Decimal('2500.00')
+        credit.save()
+        client_summary, _ = self.summaries(credit)
+        assert client_summary.credit_count == 1
+        assert client_summary.mortgage_count == 0
+        assert client_summary.automotive_count == 1
+        assert client_summary.maximum_payment_total == Decimal('2500.00')
+
+    def test_stale_instances(self, credit_instance):
+        """Test that writers holding outdated copies of a credit subtract what is stored, not what they loaded."""
+        first, second = Credit.objects.get(pk=credit_instance.pk), Credit.objects.get(pk=credit_instance.pk)
+        first.maximum_payment = Decimal('3000.00')
+        first.save()
+        second.credit_type = 'COMMERCIAL'
+        second.save()
+        client_summary, bank_summary = self.summaries(credit_instance)
+        for summary in (client_summary, bank_summary):
+            # second wrote its own, older maximum_payment back.
+            assert (summary.credit_count, summary.mortgage_count, summary.commercial_count) == (1, 0, 1)
+            assert summary.maximum_payment_total == Decimal('2000.00')
+
+        Credit.objects.get(pk=credit_instance.pk).soft_delete()
+        credit_instance.delete()
+        assert self.summaries(credit_instance)[0].credit_count == 0
+
+    def test_stale_restore(self, credit_instance):
+        """Test that restoring a stale instance counts the stored payments, which update_fields leaves in place."""
+        stale = Credit.objects.get(pk=credit_instance.pk)
+        stale.soft_delete()
+        edited = Credit.objects.get(pk=credit_instance.pk)
+        edited.maximum_payment = Decimal('3000.00')
+        edited.credit_type = 'COMMERCIAL'
+        edited.save()
+        stale.restore()
+        for summary in self.summaries(credit_instance):
+            assert (summary.credit_count, summary.mortgage_count, summary.commercial_count) == (1, 0, 1)
+            assert summary.maximum_payment_total == Decimal('3000.00')
+
+    def test_soft_delete_and_restore(self, credit_instance):
+        """Test that soft-deleted credits drop out of the summaries and come back on restore."""
+        credit_instance.soft_delete()
+        assert self.summaries(credit_instance)[0].credit_count == 0
+        credit_instance.restore()
+        assert self.summaries(credit_instance)[0].credit_count == 1
+
+    def test_bulk_paths(self, client_instance, bank, credit_instance):
+        """Test bulk_create, queryset update and queryset soft delete."""
+        Credit.objects.bulk_create([
+            Credit(client=client_instance, bank=bank, description=f'Loan {i}', minimum_payment=Decimal('10.00'),
+                   maximum_payment=Decimal('20.00'), term_months=12, credit_type='COMMERCIAL')
+            for i in range(3)
+        ])
+        _, bank_summary = self.summaries(credit_instance)
+        assert bank_summary.credit_count == 4
+        assert bank_summary.commercial_count == 3
+
+        Credit.objects.filter(credit_type='COMMERCIAL').update(maximum_payment=Decimal('30.00'))
+        _, bank_summary = self.summaries(credit_instance)
+        assert bank_summary.maximum_payment_total == Decimal('2090.00')
+
+        Credit.objects.filter(credit_type='COMMERCIAL').soft_delete()
+        _, bank_summary = self.summaries(credit_instance)
+        assert bank_summary.credit_count == 1
+        assert bank_summary.commercial_count == 0
+
+    def test_rebuild_command(self, credit_instance):
+        """Test that the rebuild command recomputes drifted summaries."""
+        ClientCreditSummary.objects.update(credit_count=99)
+        call_command('rebuild_credit_summaries')
+        assert self.summaries(credit_instance)[0].credit_count == 1
+
+    def test_summary_fields_in_api(self, authenticated_client, credit_instance):
+        """Test that client and bank endpoints expose, filter and sort by summary fields."""
+        url = reverse('client-list') + '?credit_count__gte=1&ordering=-maximum_payment_total'
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'][0]['credit_count'] == 1
+        assert response.data['results'][0]['maximum_payment_total'] == '2000.00'
+
+        url = reverse('bank-list') + '?credit_count__gte=2'
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 0
+
+
+class TestAmortizationEngine:
+    """Tests for the vectorized amortization math."""
+
+    def test_schedule_matches_totals(self):
+        """Test that schedules amortize to zero and agree with the closed-form totals."""
+        payments = np.array([500.0, 1200.0])
+        terms = np.array([36, 12])
+        totals = amortization_totals(payments, terms, 12)
+        schedules = amortization_schedules(payments, terms, 12)
+        assert schedules['mask'].sum(axis=1).tolist() == [36, 12]
+        assert np.allclose(schedules['balance'][:, -1], 0)
+        assert np.allclose(schedules['principal'].sum(axis=1), totals['principal'])
+        assert np.allclose(schedules['interest'].sum(axis=1), totals['total_interest'])
+        # 500/month for 36 months at 1% monthly finances about 15,053.75
+        assert round(totals['principal'][0], 2) == 15053.75
+
+    def test_zero_rate(self):
+        """Test that a zero rate has no interest."""
+        totals = amortization_totals([100.0], [10], 0)
+        assert totals['principal'][0] == 1000.0
+        assert totals['total_interest'][0] == 0.0
+
+
+@pytest.mark.django_db
+class TestCreditScheduleAPI:
+    """Tests for the amortization schedule endpoints."""
+
+    def test_schedule(self, authenticated_client, credit_instance):
+        """Test the per-credit schedule."""
+        url = reverse('credit-schedule', kwargs={'pk': credit_instance.pk}) + '?annual_rate=12'
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['monthly_payment'] == '500.00'
+        assert response.data['principal'] == '15053.75'
+        assert len(response.data['schedule']) == 36
+        assert response.data['schedule'][-1]['balance'] == '0.00'
+
+    def test_schedule_cached_per_version(self, authenticated_client, credit_instance):
+        """Test that updating a credit invalidates its cached schedule."""
+        url = reverse('credit-schedule', kwargs={'pk': credit_instance.pk}) + '?payment=maximum'
+        assert authenticated_client.get(url).data['monthly_payment'] == '2000.00'
+        credit_instance.maximum_payment = Decimal('2100.00')
+        credit_instance.save()
+        assert authenticated_client.get(url).data['monthly_payment'] == '2100.00'
+
+    def test_batch_schedules(self, authenticated_client, credit_instance):
+        """Test batch totals for a filtered list."""
+        url = reverse('credit-schedules') + '?credit_type=MORTGAGE&annual_rate=0'
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        result = response.data['results'][0]
+        assert result['credit'] == credit_instance.pk
+        assert result['total_interest'] == '0.00'
+        assert 'schedule' not in result
+
+    def test_invalid_rate(self, authenticated_client, credit_instance):
+        """Test that out-of-range rates are rejected."""
+        url = reverse('credit-schedule', kwargs={'pk': credit_instance.pk}) + '?annual_rate=-1'
+        response = authenticated_client.get(url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestPortfolioSimulation:
+    """Tests for the Monte Carlo portfolio risk engine."""
+
+    scenarios = [
+        {'name': 'baseline', 'default_rates': {'MORTGAGE': 0.05}},
+        {'name': 'stress', 'default_rates': {'MORTGAGE': {'PRIVATE': 0.5}}, 'loss_given_default': 1.0},
+    ]
+
+    def test_load_portfolio(self, credit_instance):
+        """Test that credits load into typed columnar arrays."""
+        portfolio = load_portfolio()
+        assert portfolio['maximum_payment'].tolist() == [2000.0]
+        assert portfolio['term_months'].dtype == np.int32
+        assert portfolio['credit_type'].tolist() == [CREDIT_TYPES.index('MORTGAGE')]
+        assert portfolio['bank_type'].tolist() == [BANK_TYPES.index('PRIVATE')]
+
+    def test_results_independent_of_workers(self, credit_instance):
+        """Test that per-scenario seeds make results reproducible across pool sizes."""
+        portfolio = load_portfolio()
+        inline = run_simulation(portfolio, self.scenarios, paths=2000, seed=7, workers=1)
+        pooled = run_simulation(portfolio, self.scenarios, paths=2000, seed=7, workers=2)
+        assert inline == pooled
+        stress = inline[1]
+        assert stress['exposure'] == 72000.0
+        assert stress['expected_loss'] == 36000.0
+        assert sum(stress['histogram']['counts']) == 2000
+
+    def test_simulate_endpoint(self, authenticated_client, credit_instance):
+        """Test that the API queues a job that produces loss distributions."""
+        url = reverse('credit-simulate') + '?credit_type=MORTGAGE'
+        response = authenticated_client.post(url, {'scenarios': self.scenarios, 'paths': 500}, format='json')
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert run_job(response.data['id']) == 'SUCCEEDED'
+        result = Job.objects.get(pk=response.data['id']).result
+        assert [scenario['name'] for scenario in result['scenarios']] == ['baseline', 'stress']
+        assert result['seed'] == response.data['params']['seed']
+
+    def test_invalid_scenario(self, authenticated_client):
+        """Test that unknown credit types and out-of-range rates are rejected."""
+        url = reverse('credit-simulate')
+        data = {'scenarios': [{'name': 'bad', 'default_rates': {'PERSONAL': 1.5}}]}
+        response = authenticated_client.post(url, data, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestBatchRetrieve:
+    """Tests for ?ids= batch retrieval and ?expand= side-loading."""
+
+    @pytest.fixture
+    def credits(self, credit_instance, client_instance, bank):
+        second = Credit.objects.create(
+            client=client_instance, description='Car Loan', minimum_payment=Decimal('300.00'),
+            maximum_payment=Decimal('1500.00'), term_months=24, bank=bank, credit_type='AUTOMOTIVE'
+        )
+        return [credit_instance, second]
+
+    def test_ids_in_requested_order(self, authenticated_client, credits):
+        """Test that ids are fetched with one query and returned in request order."""
+        ids = f'{credits[1].pk},999999,{credits[0].pk}'
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.get(reverse('credit-list'), {'ids': ids})
+        assert response.status_code == status.HTTP_200_OK
+        assert [credit['id'] for credit in response.data['results']] == [credits[1].pk, credits[0].pk]
+        assert 'count' not in response.data
+        assert len([query for query in queries if 'FROM "credits_credit"' in query['sql']]) == 1
+
+    def test_ids_respect_filters(self, authenticated_client, credits):
+        """Test that ids are combined with the regular filters."""
+        ids = ','.join(str(credit.pk) for credit in credits)
+        response = authenticated_client.get(reverse('credit-list'), {'ids': ids, 'credit_type': 'MORTGAGE'})
+        assert [credit['id'] for credit in response.data['results']] == [credits[0].pk]
+
+    def test_ids_validation(self, authenticated_client, settings):
+        """Test that malformed and oversized id lists are rejected."""
+        settings.BATCH_RETRIEVE_MAX_IDS = 2
+        assert authenticated_client.get(reverse('credit-list'), {'ids': '1,x'}).status_code == 400
+        assert authenticated_client.get(reverse('credit-list'), {'ids': '1,2,3'}).status_code == 400
+
+    def test_expand_side_loads_once(self, authenticated_client, credits, client_instance, bank):
+        """Test that referenced clients and banks are included once each."""
+        ids = ','.join(str(credit.pk) for credit in credits)
+        response = authenticated_client.get(reverse('credit-list'), {'ids': ids, 'expand': 'client,bank'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [client['id'] for client in response.data['included']['clients']] == [client_instance.pk]
+        assert [item['id'] for item in response.data['included']['banks']] == [bank.pk]
+        assert response.data['included']['clients'][0]['credit_count'] == 2
+
+    def test_expand_on_paginated_list(self, authenticated_client, credits, bank):
+        """Test side-loading on a regular list page."""
+        response = authenticated_client.get(reverse('credit-list'), {'expand': 'bank'})
+        assert response.data['count'] == 2
+        assert [item['id'] for item in response.data['included']['banks']] == [bank.pk]
+        assert 'clients' not in response.data['included']
+
+    def test_unknown_expand(self, authenticated_client):
+        """Test that only declared relations can be expanded."""
+        response = authenticated_client.get(reverse('credit-list'), {'expand': 'owner'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_clients_by_ids(self, authenticated_client, client_instance):
+        """Test batch retrieval on another resource."""
+        response = authenticated_client.get(reverse('client-list'), {'ids': str(client_instance.pk)})
+        assert [client['id'] for client in response.data['results']] == [client_instance.pk]
+
+
+@pytest.mark.django_db
+class TestIdempotency:
+    """Tests for Idempotency-Key on credit writes."""
+
+    def post(self, client, data, key):
+        return client.post(reverse('credit-list'), data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_create(self, authenticated_client, credit_data):
+        """Test that a retried create returns the first response without inserting again."""
+        first = self.post(authenticated_client, credit_data, 'create-1')
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.post(authenticated_client, credit_data, 'create-1')
+        assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+        assert retry.data == first.data
+        assert retry['Idempotent-Replayed'] == 'true'
+        assert not any('INSERT INTO "credits_credit"' in query['sql'] for query in queries.captured_queries)
+        assert Credit.objects.filter(description='Car Loan').count() == 1
+
+    def test_keys_are_independent(self, authenticated_client, credit_data):
+        """Test that different keys and requests without a key create separate rows."""
+        self.post(authenticated_client, credit_data, 'create-1')
+        self.post(authenticated_client, credit_data, 'create-2')
+        authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        assert Credit.objects.filter(description='Car Loan').count() == 3
+
+    def test_key_reused_for_other_request(self, authenticated_client, credit_data):
+        """Test that a key cannot be replayed for a different body."""
+        self.post(authenticated_client, credit_data, 'create-1')
+        response = self.post(authenticated_client, {**credit_data, 'term_months': 36}, 'create-1')
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_failures_are_not_stored(self, authenticated_client, credit_data):
+        """Test that a rejected request leaves the key free for a corrected retry."""
+        response = self.post(authenticated_client, {**credit_data, 'description': ''}, 'create-1')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not IdempotencyKey.objects.exists()
+        assert self.post(authenticated_client, credit_data, 'create-1').status_code == status.HTTP_201_CREATED
+
+    def test_retry_replays_update(self, authenticated_client, credit_instance, credit_data):
+        """Test that updates are replayed too."""
+        url = reverse('credit-detail', kwargs={'pk': credit_instance.pk})
+        first = authenticated_client.patch(url, {'term_months': 48}, format='json', HTTP_IDEMPOTENCY_KEY='update-1')
+        Credit.objects.filter(pk=credit_instance.pk).update(term_months=12)
+        retry = authenticated_client.patch(url, {'term_months': 48}, format='json', HTTP_IDEMPOTENCY_KEY='update-1')
+        assert retry.data == first.data
+        assert Credit.objects.get(pk=credit_instance.pk).term_months == 12
+
+    def test_expired_keys(self, authenticated_client, credit_data, settings):
+        """Test that expired keys run again and are purged."""
+        settings.IDEMPOTENCY_KEY_TTL = 0
+        self.post(authenticated_client, credit_data, 'create-1')
+        assert self.post(authenticated_client, credit_data, 'create-1').status_code == status.HTTP_201_CREATED
+        assert Credit.objects.filter(description='Car Loan').count() == 2
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        assert not IdempotencyKey.objects.exists()
+
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_duplicates(self, credit_data, django_user_model):
+        """Test that concurrent requests with one key insert a single credit."""
+        user = django_user_model.objects.create_user(username='racer', password='testpass123')
+        barrier = threading.Barrier(4)
+        responses = []
+
+        def create():
+            client = APIClient()
+            client.force_authenticate(user=user)
+            barrier.wait()
+            try:
+                responses.append(client.post(reverse('credit-list'), credit_data, format='json', HTTP_IDEMPOTENCY_KEY='race'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [response.status_code for response in responses] == [201] * 4
+        assert len({response.data['id'] for response in responses}) == 1
+        assert Credit.objects.filter(description='Car Loan').count() == 1
+
+
+@pytest.mark.django_db
+class TestCreditRangeFilters:
+    """Tests for range filters on credits and the indexes behind them."""
+
+    @pytest.fixture
+    def credits(self, client_instance, bank):
+        rows = [('AUTOMOTIVE', '300.00', '900.00', 12), ('MORTGAGE', '800.00', '2500.00', 240),
+                ('COMMERCIAL', '500.00', '1500.00', 60)]
+        return [
+            Credit.objects.create(
+                client=client_instance, bank=bank, description=f'{credit_type} loan', credit_type=credit_type,
+                minimum_payment=Decimal(minimum), maximum_payment=Decimal(maximum), term_months=term,
+            )
+            for credit_type, minimum, maximum, term in rows
+        ]
+
+    def descriptions(self, client, params):
+        response = client.get(reverse('credit-list'), params)
+        assert response.status_code == status.HTTP_200_OK
+        return sorted(credit['description'] for credit in response.data['results'])
+
+    def test_amount_and_term_ranges(self, authenticated_client, credits):
+        """Test gte/lte/range filters on payments and term."""
+        assert self.descriptions(authenticated_client, {'maximum_payment__range': '1000,2000'}) == ['COMMERCIAL loan']
+        assert self.descriptions(authenticated_client, {'term_months__gte': 60, 'minimum_payment__lte': '600'}) == [
+            'COMMERCIAL loan'
+        ]
+
+    def test_registration_date_range(self, authenticated_client, credits):
+        """Test date ranges on registration_date."""
+        Credit.objects.filter(pk=credits[0].pk).update(registration_date='2025-01-15T00:00:00Z')
+        params = {'registration_date__gte': '2025-01-01', 'registration_date__lte': '2025-03-31T23:59:59Z'}
+        assert self.descriptions(authenticated_client, params) == ['AUTOMOTIVE loan']
+
+    def test_invalid_range(self, authenticated_client):
+        """Test that malformed bounds are rejected."""
+        response = authenticated_client.get(reverse('credit-list'), {'term_months__gte': 'many'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_export_uses_ranges(self, authenticated_client, credits, settings, tmp_path):
+        """Test that export jobs apply (and validate) the same range filters."""
+        settings.MEDIA_ROOT = tmp_path
+        response = authenticated_client.post(reverse('credit-list') + 'export/?term_months__gte=60')
+        job = Job.objects.get(pk=response.data['id'])
+        run_job(job.pk)
+        job.refresh_from_db()
+        assert job.result['rows'] == 2
+        assert authenticated_client.post(reverse('credit-list') + 'export/?term_months__gte=x').status_code == 400
+
+    @pytest.fixture
+    def credit_table(self, client_instance, bank):
+        """5000 analyzed credits registered an hour apart, in insertion order."""
+        Credit.objects.bulk_create(
+            Credit(
+                client=client_instance, bank=bank, description=f'Loan {number}',
+                credit_type=Credit.CREDIT_TYPE_CHOICES[number % 3][0], term_months=12 + number % 348,
+                minimum_payment=Decimal(number % 1000), maximum_payment=Decimal(1000 + number % 9000),
+            )
+            for number in range(5000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE credits_credit SET registration_date = TIMESTAMPTZ '2020-01-01' + id * INTERVAL '1 hour'"
+            )
+            cursor.execute('ANALYZE credits_credit')
+
+    @pytest.mark.parametrize('params, index', [
+        ({'registration_date__gte': '2030-01-01'}, 'credits_credit_regdate_brin'),
+        ({'credit_type': 'MORTGAGE', 'registration_date__gte': '2030-01-01'}, 'credits_credit_type_date_idx'),
+        ({'maximum_payment__range': '1000,1010'}, 'credits_credit_max_pay_idx'),
+        ({'minimum_payment__gte': '990'}, 'credits_credit_min_pay_idx'),
+    ])
+    def test_explain_uses_index(self, credit_table, params, index):
+        """Test that each range filter can be answered from its index."""
+        queryset = CreditFilter(params, queryset=Credit.objects.filter(deleted_at__isnull=True)).qs
+        assert index in explain_without_seqscan(queryset)
+
+
+@pytest.mark.django_db
+class TestCachedRelations:
+    """Tests for cached client and bank resolution on credit writes."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        cache.clear()
+
+    def related_queries(self, queries):
+        tables = ('FROM "banks_bank"', 'FROM "clients_client"')
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and any(table in query['sql'] for table in tables)
+        ]
+
+    def test_writes_skip_lookups_once_cached(self, authenticated_client, credit_data):
+        """Test that repeated creates resolve client and bank without queries."""
+        authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert self.related_queries(queries) == []
+
+    def test_missing_and_soft_deleted_targets(self, authenticated_client, credit_data, bank):
+        """Test that missing and soft-deleted targets fail with the usual error."""
+        response = authenticated_client.post(reverse('credit-list'), {**credit_data, 'client': 999999}, format='json')
+        assert response.data['client'] == ['Invalid pk "999999" - object does not exist.']
+        authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        bank.soft_delete()
+        response = authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        assert response.data['bank'] == [f'Invalid pk "{bank.pk}" - object does not exist.']
+        response = authenticated_client.post(reverse('credit-list'), {**credit_data, 'bank': 'abc'}, format='json')
+        assert response.data['bank'] == ['Incorrect type. Expected pk value, received str.']
+
+    def test_new_bank_visible(self, authenticated_client, credit_data):
+        """Test that a bank created after the cache was loaded can be referenced."""
+        authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        other = Bank.objects.create(name='Other Bank', type_bank='PRIVATE', address='1 Other St')
+        response = authenticated_client.post(reverse('credit-list'), {**credit_data, 'bank': other.pk}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_bank_from_another_process(self, authenticated_client, credit_data):
+        """Test that a bank the process-local cache has not heard of is looked up in the database."""
+        authenticated_client.post(reverse('credit-list'), credit_data, format='json')
+        # As another worker would create it: the version key of this process is not bumped.
+        other = Bank.objects.create(name='Other Bank', type_bank='PRIVATE', address='1 Other St')
+        cache.clear()
+        bank_cache = model_cache(Bank, 'versioned')
+        bank_cache._version = cache.get_or_set(bank_cache.version_key, 'unchanged', timeout=None)
+        assert other.pk not in bank_cache._current()
+
+        response = authenticated_client.post(reverse('credit-list'), {**credit_data, 'bank': other.pk}, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        assert other.pk in bank_cache._current()
+
+    def test_list_payload_batches_lookups(self, client_instance, bank, credit_data):
+        """Test that a many=True payload resolves all of its clients with one query."""
+        clients = [client_instance] + [
+            Client.objects.create(
+                full_name=f'Client {number}', birth_date=client_instance.birth_date, age=client_instance.age,
+                nationality='USA', address='1 Main St', email=f'c{number}@example.com', phone='+100',
+                person_type='INDIVIDUAL', bank=bank,
+            )
+            for number in range(3)
+        ]
+        cache.clear()
+        serializer = CreditSerializer(data=[{**credit_data, 'client': client.pk} for client in clients], many=True)
+        with CaptureQueriesContext(connection) as queries:
+            assert serializer.is_valid(), serializer.errors
+        assert len([sql for sql in self.related_queries(queries) if 'clients_client' in sql]) == 1
+        assert [credit['client'] for credit in serializer.validated_data] == clients
+
+
+@pytest.mark.django_db(transaction=True)
+class TestGroupCommit:
+    """Tests for group-commit credit ingestion."""
+
+    @pytest.fixture(autouse=True)
+    def stop_writer(self):
+        # The writer thread's connection must be closed before the test database is dropped.
+        yield
+        assert credit_writer.stop(timeout=5)
+
+    def test_timeout_withdraws_the_credit(self, credit_data, django_user_model, settings, monkeypatch):
+        """Test that a credit still queued at the timeout answers 503 and is never written."""
+        settings.CREDIT_GROUP_COMMIT = True
+        settings.CREDIT_GROUP_COMMIT_MAX_DELAY_MS = 0
+        settings.CREDIT_GROUP_COMMIT_TIMEOUT = 0.2
+        busy, release = threading.Event(), threading.Event()
+
+        def slow_insert(credits):
+            if credits == ['blocker']:
+                busy.set()
+                release.wait(timeout=5)
+                return
+            insert_credits(credits)
+
+        monkeypatch.setattr(credit_writer, 'flush', slow_insert)
+        blocker = credit_writer.submit('blocker')
+        assert busy.wait(timeout=5)
+        client = APIClient()
+        client.force_authenticate(user=django_user_model.objects.create_user(username='ingest', password='testpass123'))
+        response = client.post(reverse('credit-list'), credit_data, format='json')
+        release.set()
+        blocker.result(timeout=5)
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert credit_writer.drain(timeout=5)
+        assert not Credit.objects.exists()
+
+    def test_concurrent_creates_share_batches(self, credit_data, django_user_model, settings, monkeypatch):
+        """Test that concurrent POSTs are inserted in shared batches and each gets its own row."""
+        settings.CREDIT_GROUP_COMMIT = True
+        settings.CREDIT_GROUP_COMMIT_MAX_DELAY_MS = 200
+        batch_sizes = []
+
+        def recording_insert(credits):
+            batch_sizes.append(len(credits))
+            insert_credits(credits)
+
+        monkeypatch.setattr(credit_writer, 'flush', recording_insert)
+        user = django_user_model.objects.create_user(username='ingest', password='testpass123')
+        barrier = threading.Barrier(6)
+        responses = []
+
+        def create(number):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            barrier.wait()
+            try:
+                responses.append(
+                    client.post(reverse('credit-list'), {**credit_data, 'description': f'Loan {number}'}, format='json')
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create, args=(number,)) for number in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert [response.status_code for response in responses] == [201] * 6
+        ids = {response.data['id'] for response in responses}
+        assert ids == set(Credit.objects.values_list('id', flat=True))
+        assert Credit.objects.get(pk=responses[0].data['id']).description == responses[0].data['description']
+        assert sum(batch_sizes) == 6 and len(batch_sizes) < 6
+        assert ClientCreditSummary.objects.get(pk=credit_data['client']).credit_count == 6
+
+
+@pytest.mark.django_db
+class TestCreditHistory:
+    """Tests for the audit history of credit terms."""
+
+    @pytest.fixture(autouse=True)
+    def sync_history(self, settings):
+        # Entries are written by the saving transaction, which the test rolls back.
+        settings.AUDIT_HISTORY_ASYNC = False
+
+    def history(self, client, credit_id, params=None):
+        response = client.get(reverse('credit-history', kwargs={'pk': credit_id}), params or {})
+        assert response.status_code == status.HTTP_200_OK
+        return response.data['results']
+
+    def test_records_field_diffs(self, authenticated_client, credit_data):
+        """Test that creates and term changes are recorded as field-level diffs, newest first."""
+        credit_id = authenticated_client.post(reverse('credit-list'), credit_data, format='json').data['id']
+        url = reverse('credit-detail', kwargs={'pk': credit_id})
+        authenticated_client.patch(url, {'minimum_payment': '600.00', 'term_months': 48}, format='json')
+
+        update, insert = self.history(authenticated_client, credit_id)
+        assert update['action'] == 'update'
+        assert update['changes'] == {'minimum_payment': ['300.00', '600.00'], 'term_months': [24, 48]}
+        assert insert['action'] == 'insert'
+        assert insert['changes']['credit_type'] == [None, 'AUTOMOTIVE']
+
+    def test_untracked_changes_not_recorded(self, authenticated_client, credit_instance):
+        """Test that saves changing no tracked field add no entry."""
+        url = reverse('credit-detail', kwargs={'pk': credit_instance.pk})
+        authenticated_client.patch(url, {'description': 'Renamed'}, format='json')
+        assert [entry['action'] for entry in self.history(authenticated_client, credit_instance.pk)] == ['insert']
+
+    def test_deleted_credit_history(self, authenticated_client, credit_instance):
+        """Test that soft deletes are recorded and the history outlives the credit."""
+        authenticated_client.delete(reverse('credit-detail', kwargs={'pk': credit_instance.pk}))
+        assert self.history(authenticated_client, credit_instance.pk)[0]['action'] == 'delete'
+        response = authenticated_client.get(reverse('credit-history', kwargs={'pk': 999999}))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_cursor_pagination(self, authenticated_client, credit_instance):
+        """Test that history pages follow an opaque cursor through every entry."""
+        for term in range(37, 42):
+            credit_instance.term_months = term
+            credit_instance.save()
+        url = reverse('credit-history', kwargs={'pk': credit_instance.pk})
+        response = authenticated_client.get(url, {'page_size': 2})
+        terms = []
+        while True:
+            terms.extend(entry['changes']['term_months'][1] for entry in response.data['results'])
+            if not response.data['next']:
+                break
+            assert 'cursor=' in response.data['next']
+            response = authenticated_client.get(response.data['next'])
+        assert terms == [41, 40, 39, 38, 37, 36]
+
+    def test_transaction_inserts_its_entries_once(self, credit_instance):
+        """Test that a transaction's entries are inserted together before it commits, and dropped with a rollback."""
+        from apps.core.models import HistoryEntry
+        from apps.core.sharding import atomic_on
+        with CaptureQueriesContext(connection) as queries, atomic_on():
+            for term in (40, 44, 48):
+                credit_instance.term_months = term
+                credit_instance.save()
+            assert HistoryEntry.objects.filter(resource='credits', object_id=credit_instance.pk).count() == 1
+        inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "core_historyentry"')]
+        assert len(inserts) == 1
+        assert HistoryEntry.objects.filter(resource='credits', object_id=credit_instance.pk).count() == 4
+
+        with pytest.raises(RuntimeError), atomic_on():
+            credit_instance.term_months = 99
+            credit_instance.save()
+            raise RuntimeError
+        assert not HistoryEntry.objects.filter(resource='credits', object_id=credit_instance.pk, changes__term_months__1=99).exists()
+
+    def test_history_query_uses_index(self, credit_instance):
+        """Test that one object's history is read from its index."""
+        from apps.core.models import HistoryEntry
+        # Other objects' entries, and fresh statistics: on a near-empty table the primary key looks as good.
+        HistoryEntry.objects.bulk_create(
+            HistoryEntry(resource='credits', object_id=credit_instance.pk + number, action='update',
+                         changed_at=credit_instance.updated_at)
+            for number in range(1, 2001)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_historyentry')
+        plan = explain_without_seqscan(
+            HistoryEntry.objects.filter(resource='credits', object_id=credit_instance.pk).order_by('-id')[:10]
+        )
+        assert 'core_history_object_idx' in plan
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncHistory:
+    """Tests for history entries written off the request path."""
+
+    @pytest.fixture(autouse=True)
+    def stop_writer(self):
+        from apps.core.history import history_writer
+        yield
+        assert history_writer.stop(timeout=5)
+
+    def test_entries_written_after_commit(self, credit_data, settings, monkeypatch):
+        """Test that committed saves reach the history in batches and rolled-back ones never do."""
+        from django.db import transaction
+        from apps.core.history import history_writer, insert_entries
+        from apps.core.models import HistoryEntry
+        settings.AUDIT_HISTORY_ASYNC = True
+        settings.AUDIT_HISTORY_MAX_DELAY_MS = 200
+        batch_sizes = []
+
+        def recording_insert(entries):
+            batch_sizes.append(len(entries))
+            insert_entries(entries)
+
+        monkeypatch.setattr(history_writer, 'flush', recording_insert)
+        credit = Credit.objects.create(
+            client_id=credit_data['client'], bank_id=credit_data['bank'], description='Car Loan',
+            minimum_payment=Decimal('300.00'), maximum_payment=Decimal('1500.00'), term_months=24,
+            credit_type='AUTOMOTIVE',
+        )
+        with transaction.atomic():
+            for term in (40, 44):
+                credit.term_months = term
+                credit.save()
+        with pytest.raises(RuntimeError), transaction.atomic():
+            credit.term_months = 99
+            credit.save()
+            raise RuntimeError
+
+        assert history_writer.drain(timeout=5)
+        entries = HistoryEntry.objects.filter(resource='credits', object_id=credit.pk).order_by('id')
+        assert [entry.changes.get('term_months') for entry in entries] == [[None, 24], [24, 40], [40, 44]]
+        # The client fixture's insert was written by its own transaction, before the switch to async.
+        assert sum(batch_sizes) == 3 and len(batch_sizes) < 3
@@ -1,20 +1,43 @@
+from django.conf import settings
+from django.db import connection
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
+from apps.banks.models import Bank
+from apps.banks.serializers import BankWithSummarySerializer
+from apps.clients.models import Client
+from apps.clients.serializers import ClientSerializer
+from apps.core.batch import BatchRetrieveMixin
+from apps.core.fieldsets import SparseFieldsetMixin
+from apps.core.history import HistoryMixin
+from apps.core.idempotency import IdempotentMixin
+from apps.core.pagination import StreamingListMixin
+from apps.core.sharding import ShardedViewSetMixin
+from apps.core.snapshots import SnapshotMixin
+from apps.core.jobs import enqueue
+from apps.core.views import job_accepted_response
+from apps.credits.filters import CreditFilter
+from apps.credits.ingestion import IngestionTimeout, credit_writer
+from apps.credits.jobs import CREDIT_FILTERS
 from apps.credits.models import Credit
-from apps.credits.serializers import CreditSerializer
+from apps.credits.schedules import credit_schedules
+from apps.credits.serializers import CreditSerializer, ScheduleQuerySerializer, SimulationSerializer
+from apps.credits.summaries import summary_annotations
 
 
-class CreditViewSet(viewsets.ModelViewSet):
+class CreditViewSet(IdempotentMixin, ShardedViewSetMixin, HistoryMixin, SnapshotMixin, BatchRetrieveMixin, StreamingListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Credit model.
-    Provides: list, create, retrieve, update, partial_update, destroy
+    Provides: list, create, retrieve, update, partial_update, destroy, export, simulate, schedule, schedules, history, snapshot
     """
     queryset = Credit.objects.filter(deleted_at__isnull=True).select_related('client', 'bank')
     serializer_class = CreditSerializer
     
-    # Filtering by credit type and bank
-    filterset_fields = ['credit_type', 'bank', 'client']
+    # Filtering by credit type, bank and client, and ranges on amounts, term and registration date
+    filterset_class = CreditFilter
     
     # Search by description and client name
     search_fields = ['description', 'client__full_name']
@@ -23,6 +46,89 @@ class CreditViewSet(viewsets.ModelViewSet):
     ordering_fields = ['registration_date', 'minimum_payment', 'maximum_payment', 'term_months']
     ordering = ['-registration_date']
 
+    # Rate limiting (DEFAULT_THROTTLE_RATES)
+    throttle_scope = 'credits'
+
+    # Side-loading (?expand=client,bank)
+    expandable_fields = {
+        'client': (
+            'clients',
+            Client.objects.filter(deleted_at__isnull=True).annotate(**summary_annotations()),
+            ClientSerializer,
+        ),
+        'bank': (
+            'banks',
+            Bank.objects.filter(deleted_at__isnull=True).annotate(**summary_annotations()),
+            BankWithSummarySerializer,
+        ),
+    }
+
+    def perform_create(self, serializer):
+        """With CREDIT_GROUP_COMMIT, insert through the group-commit writer and wait for the commit."""
+        if not settings.CREDIT_GROUP_COMMIT or connection.in_atomic_block:
+            # Inside a transaction (e.g. an Idempotency-Key request) the row must be written by it.
+            serializer.save()
+            return
+        future = credit_writer.submit(Credit(**serializer.validated_data))
+        try:
+            serializer.instance = future.result(timeout=settings.CREDIT_GROUP_COMMIT_TIMEOUT)
+        except TimeoutError:
+            if future.cancel():
+                # Withdrawn before any write: a retry cannot duplicate it.
+                raise IngestionTimeout()
+            # Its batch is being written; answering before it settles would invite a duplicate retry.
+            serializer.instance = future.result()
+
     def perform_destroy(self, instance):
         """Soft delete instead of hard delete."""
         instance.soft_delete()
+
+    def _job_filters(self, request):
+        """Credit filters from the query params, validated now rather than ignored by the job."""
+        filters = {key: request.query_params[key] for key in CREDIT_FILTERS if key in request.query_params}
+        filterset = CreditFilter(filters, queryset=self.get_queryset())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return filters
+
+    @action(detail=False, methods=['post'])
+    def export(self, request):
+        """Queue a CSV export of the credits matching the filter query params."""
+        job = enqueue('credits.export_csv', self._job_filters(request), user=request.user)
+        return job_accepted_response(job, request)
+
+    @action(detail=False, methods=['post'])
+    def simulate(self, request):
+        """Queue a Monte Carlo stress test of the credits matching the filter query params."""
+        serializer = SimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = dict(serializer.validated_data)
+        params['scenarios'] = [dict(scenario) for scenario in params['scenarios']]
+        params['filters'] = self._job_filters(request)
+        job = enqueue('credits.simulate_portfolio', params, user=request.user)
+        return job_accepted_response(job, request)
+
+    def _schedule_params(self, request):
+        params = ScheduleQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return params.validated_data
+
+    @action(detail=True, methods=['get'])
+    def schedule(self, request, pk=None):
+        """Month-by-month amortization schedule and totals for one credit."""
+        params = self._schedule_params(request)
+        credit = self.get_object()
+        result = credit_schedules([credit], params['annual_rate'], params['payment'], include_schedule=True)
+        return Response(result[0])
+
+    @action(detail=False, methods=['get'])
+    def schedules(self, request):
+        """Amortization totals (and optionally schedules) for a filtered page of credits."""
+        params = self._schedule_params(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        credits = page if page is not None else list(queryset)
+        data = credit_schedules(credits, params['annual_rate'], params['payment'], params['include_schedule'])
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
@@ -0,0 +1,62 @@
+"""
+Throughput of the vectorized amortization engine.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_amortization [--credits 100000] [--rate 12]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from apps.credits.amortization import amortization_schedules, amortization_totals
+
+
+def timed(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scalar_totals(payments, terms, annual_rate):
+    """Per-credit Python loop, the way the frontends compute it today."""
+    rate = annual_rate / 100 / 12
+    for payment, term in zip(payments.tolist(), terms.tolist()):
+        principal = payment * (1 - (1 + rate) ** -term) / rate
+        payment * term - principal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--credits', type=int, default=100_000)
+    parser.add_argument('--rate', type=float, default=12.0)
+    parser.add_argument('--schedule-chunk', type=int, default=2_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    payments = rng.uniform(100, 5_000, args.credits).round(2)
+    terms = rng.choice([12, 24, 36, 48, 60, 120, 240, 360], args.credits)
+
+    elapsed = timed(scalar_totals, payments, terms, args.rate, repeat=1)
+    print(f'python loop totals : {elapsed * 1000:9.1f} ms  {args.credits / elapsed:14,.0f} credits/s')
+
+    elapsed = timed(amortization_totals, payments, terms, args.rate)
+    print(f'vectorized totals  : {elapsed * 1000:9.1f} ms  {args.credits / elapsed:14,.0f} credits/s')
+
+    def schedules_in_chunks():
+        # Chunking bounds the (credits x max term) matrices to a few MB each.
+        for start in range(0, args.credits, args.schedule_chunk):
+            stop = start + args.schedule_chunk
+            amortization_schedules(payments[start:stop], terms[start:stop], args.rate)
+
+    elapsed = timed(schedules_in_chunks, repeat=1)
+    months = int(terms.sum())
+    print(f'full schedules     : {elapsed * 1000:9.1f} ms  {args.credits / elapsed:14,.0f} credits/s'
+          f'  ({months / elapsed:,.0f} schedule rows/s)')
+
+
+if __name__ == '__main__':
+    main()
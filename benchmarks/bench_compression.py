@@ -0,0 +1,95 @@
+"""
+Bytes on the wire and CPU cost of API response compression.
+
+Compresses a synthetic /api/creditos/ list page with every available encoding
+and level, both in one shot and streamed row by row as StreamingListMixin
+produces it.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_compression [--rows 500] [--levels gzip:1,6,9 br:1,4,9 zstd:1,3,9]
+"""
+import argparse
+import json
+import random
+import time
+
+from apps.core.compression import COMPRESSORS
+
+DEFAULT_LEVELS = {'gzip': [1, 6, 9], 'br': [1, 4, 9], 'zstd': [1, 3, 9]}
+
+
+def credit_rows(count):
+    rng = random.Random(0)
+    descriptions = ['Home mortgage', 'Car financing', 'Working capital line', 'Equipment lease', 'Student loan']
+    return [
+        {
+            'id': pk,
+            'client': rng.randint(1, 5_000),
+            'description': f'{rng.choice(descriptions)} #{rng.randint(1, 99_999)}',
+            'minimum_payment': f'{rng.uniform(100, 2_000):.2f}',
+            'maximum_payment': f'{rng.uniform(2_000, 9_000):.2f}',
+            'term_months': rng.choice([12, 24, 36, 48, 60, 120, 240, 360]),
+            'registration_date': f'2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:{pk % 60:02d}:00Z',
+            'bank': rng.randint(1, 40),
+            'credit_type': rng.choice(['AUTOMOTIVE', 'MORTGAGE', 'COMMERCIAL']),
+            'created_at': '2025-06-01T10:00:00.000000Z',
+            'updated_at': '2025-06-02T11:30:00.000000Z',
+        }
+        for pk in range(1, count + 1)
+    ]
+
+
+def chunks(rows):
+    """The byte chunks of a streamed list page."""
+    yield b'{"count":%d,"next":null,"previous":null,"results":[' % len(rows)
+    for index, row in enumerate(rows):
+        yield (b',' if index else b'') + json.dumps(row, separators=(',', ':')).encode()
+    yield b']}'
+
+
+def measure(encoding, level, parts, repeat):
+    best_cpu, size = float('inf'), 0
+    for _ in range(repeat):
+        start = time.process_time()
+        push, finish = COMPRESSORS[encoding](level)
+        size = sum(len(push(part)) for part in parts) + len(finish())
+        best_cpu = min(best_cpu, time.process_time() - start)
+    return size, best_cpu
+
+
+def parse_levels(values):
+    levels = {}
+    for value in values:
+        encoding, _, numbers = value.partition(':')
+        levels[encoding] = [int(number) for number in numbers.split(',')]
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--levels', nargs='*', help='encoding:level,level ...')
+    args = parser.parse_args()
+
+    levels = parse_levels(args.levels) if args.levels else DEFAULT_LEVELS
+    streamed = list(chunks(credit_rows(args.rows)))
+    body = b''.join(streamed)
+    print(f'payload: {args.rows} rows, {len(body):,} bytes uncompressed')
+    print(f'{"encoding":<8} {"level":>5} {"bytes":>10} {"ratio":>6} {"cpu ms":>8} {"MB/s":>8}'
+          f' {"stream bytes":>13} {"stream cpu ms":>14}')
+
+    for encoding, encoding_levels in levels.items():
+        if encoding not in COMPRESSORS:
+            print(f'{encoding:<8} not installed')
+            continue
+        for level in encoding_levels:
+            size, cpu = measure(encoding, level, [body], args.repeat)
+            stream_size, stream_cpu = measure(encoding, level, streamed, args.repeat)
+            throughput = len(body) / cpu / 1e6 if cpu else float('inf')
+            print(f'{encoding:<8} {level:>5} {size:>10,} {len(body) / size:>6.1f} {cpu * 1000:>8.2f} {throughput:>8.1f}'
+                  f' {stream_size:>13,} {stream_cpu * 1000:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
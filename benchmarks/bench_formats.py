@@ -0,0 +1,121 @@
+"""
+Size and CPU cost of JSON, MessagePack and CBOR credit list pages.
+
+Serializes a synthetic /api/creditos/ page through CreditWithBankSerializer and
+the real renderers, then decodes it the way a consumer needs it: with decimals
+as Decimal and timestamps as datetime (JSON and MessagePack decimal strings are
+converted after parsing).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_formats [--rows 1000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_credit.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import cbor2  # noqa: E402
+import msgpack  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from apps.banks.models import Bank  # noqa: E402
+from apps.core.renderers import CBORRenderer, MessagePackRenderer  # noqa: E402
+from apps.credits.models import Credit  # noqa: E402
+from apps.credits.serializers import CreditWithBankSerializer  # noqa: E402
+
+DECIMALS = ('minimum_payment', 'maximum_payment')
+TIMESTAMPS = ('registration_date', 'created_at', 'updated_at')
+
+
+def credits(count):
+    rng = random.Random(0)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    descriptions = ['Home mortgage', 'Car financing', 'Working capital line', 'Equipment lease', 'Student loan']
+    banks = [
+        Bank(pk=pk, name=f'Bank {pk}', type_bank=rng.choice(['PRIVATE', 'GOVERNMENT']), address='Main Street',
+             created_at=start, updated_at=start)
+        for pk in range(1, 41)
+    ]
+    rows = []
+    for pk in range(1, count + 1):
+        stamp = start + timedelta(seconds=rng.randint(0, 30_000_000), microseconds=rng.randint(0, 999_999))
+        rows.append(Credit(
+            pk=pk, client_id=rng.randint(1, 5_000), description=f'{rng.choice(descriptions)} #{pk}',
+            minimum_payment=Decimal(f'{rng.uniform(100, 2_000):.2f}'),
+            maximum_payment=Decimal(f'{rng.uniform(2_000, 9_000):.2f}'),
+            term_months=rng.choice([12, 24, 36, 48, 60, 120, 240, 360]), bank=rng.choice(banks),
+            credit_type=rng.choice(['AUTOMOTIVE', 'MORTGAGE', 'COMMERCIAL']),
+            registration_date=stamp, created_at=stamp, updated_at=stamp + timedelta(days=1),
+        ))
+    return rows
+
+
+def typed(rows, decimals=True, timestamps=True):
+    """Convert the string decimals and timestamps a format left behind, as a consumer would."""
+    for row in rows:
+        for name in DECIMALS if decimals else ():
+            row[name] = Decimal(row[name])
+        for name in TIMESTAMPS if timestamps else ():
+            row[name] = datetime.fromisoformat(row[name])
+    return rows
+
+
+FORMATS = {
+    'json': (JSONRenderer, lambda body: typed(json.loads(body)['results'])),
+    'msgpack': (
+        MessagePackRenderer,
+        lambda body: typed(msgpack.unpackb(body, timestamp=3)['results'], timestamps=False),
+    ),
+    'cbor': (CBORRenderer, lambda body: cbor2.loads(body)['results']),
+}
+
+
+def best(func, repeat):
+    fastest, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.process_time()
+        result = func()
+        fastest = min(fastest, time.process_time() - start)
+    return fastest, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = credits(args.rows)
+    print(f'payload: {args.rows} credits with nested banks')
+    print(f'{"format":<8} {"bytes":>10} {"size":>6} {"serialize ms":>13} {"render ms":>10} {"decode ms":>10}')
+    baseline = None
+    for name, (renderer_class, decode) in FORMATS.items():
+        renderer = renderer_class()
+        context = {'request': SimpleNamespace(method='GET', query_params={}, GET={}, accepted_renderer=renderer)}
+
+        def serialize():
+            return {'count': len(rows), 'next': None, 'previous': None,
+                    'results': CreditWithBankSerializer(rows, many=True, context=context).data}
+
+        serialize_cpu, data = best(serialize, args.repeat)
+        render_cpu, body = best(lambda: renderer.render(data), args.repeat)
+        decode_cpu, decoded = best(lambda: decode(body), args.repeat)
+        assert decoded[0]['maximum_payment'] == rows[0].maximum_payment
+        assert decoded[0]['updated_at'] == rows[0].updated_at
+        baseline = baseline or len(body)
+        print(f'{name:<8} {len(body):>10,} {len(body) / baseline:>6.2f} {serialize_cpu * 1000:>13.2f}'
+              f' {render_cpu * 1000:>10.2f} {decode_cpu * 1000:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
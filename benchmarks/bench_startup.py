@@ -0,0 +1,73 @@
+"""
+Process startup profile: wall time and the slowest imports.
+
+Each scenario runs in a fresh interpreter with ``python -X importtime`` and
+reports its wall time, the top-level packages that cost the most import time
+and the slowest individual modules.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup [--top 15] [--defer]
+
+``--defer`` sets DEFER_ADMIN_AND_DOCS=True to compare the production startup mode.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+SCENARIOS = {
+    # What every manage.py command pays.
+    'setup': 'import django; django.setup()',
+    # What a web worker pays before serving its first request.
+    'wsgi': (
+        'from your_credit.wsgi import application; '
+        'from django.urls import get_resolver; get_resolver().url_patterns'
+    ),
+}
+
+
+def run(code, env):
+    timed = f'import time; _start = time.perf_counter(); {code}; print(time.perf_counter() - _start)'
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', timed], env=env, capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        modules.append((name, int(self_us), int(cumulative_us)))
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def report(name, wall, modules, top):
+    packages = defaultdict(int)
+    for module, self_us, _ in modules:
+        packages[module.strip().split('.')[0]] += self_us
+    total = sum(packages.values())
+    print(f'== {name}: {wall * 1000:.0f} ms wall, {total / 1000:.0f} ms importing {len(modules)} modules')
+    print('  slowest packages (self time):')
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f'    {self_us / 1000:8.1f} ms  {package}')
+    print('  slowest modules (cumulative):')
+    for module, _, cumulative_us in sorted(modules, key=lambda item: -item[2])[:top]:
+        print(f'    {cumulative_us / 1000:8.1f} ms  {module.strip()}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--defer', action='store_true', help='profile with DEFER_ADMIN_AND_DOCS=True')
+    args = parser.parse_args()
+
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'your_credit.settings'}
+    if args.defer:
+        env['DEFER_ADMIN_AND_DOCS'] = 'True'
+    for name, code in SCENARIOS.items():
+        wall, modules = run(code, env)
+        report(name, wall, modules, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Gunicorn configuration for the production API (Dockerfile.prod).
+
+The application is imported once in the master (``preload_app``) and the
+workers are forked from it, so each worker starts ready to serve and shares the
+master's memory pages copy-on-write. Freezing the garbage collector before
+forking keeps the first collections in each worker from touching (and copying)
+those shared pages.
+"""
+import gc
+
+from decouple import config
+
+bind = config('GUNICORN_BIND', default='0.0.0.0:8000')
+workers = config('GUNICORN_WORKERS', default=3, cast=int)
+# Threads per worker; more than one lets CREDIT_GROUP_COMMIT batch concurrent requests.
+threads = config('GUNICORN_THREADS', default=1, cast=int)
+preload_app = True
+
+
+def on_starting(server):
+    # Per-process rate limits and in-flight counters would let each worker admit the full limit.
+    from django.core.checks import Tags, run_checks
+    from django.core.exceptions import ImproperlyConfigured
+
+    errors = [error for error in run_checks(tags=[Tags.caches], include_deployment_checks=True) if error.is_serious()]
+    if errors and workers > 1:
+        raise ImproperlyConfigured('\n'.join(str(error) for error in errors))
+
+
+def when_ready(server):
+    # Everything imported so far lives for the whole process: move it out of the collector's reach.
+    gc.collect()
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    # Database connections opened while loading the app must not be shared by the workers.
+    from django.db import connections
+    connections.close_all()
+
+
+def worker_exit(server, worker):
+    # Queued writes are flushed and the writer threads' connections closed before the worker goes away.
+    from django.conf import settings
+
+    from apps.core.history import drain
+    from apps.credits.ingestion import credit_writer
+    drain()
+    credit_writer.stop(timeout=settings.CREDIT_GROUP_COMMIT_TIMEOUT)
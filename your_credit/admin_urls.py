@@ -0,0 +1,14 @@
+"""
+Admin URLs, included lazily when DEFER_ADMIN_AND_DOCS is enabled.
+
+The admin then runs with SimpleAdminConfig, so the ModelAdmin modules are
+discovered here, on first use, instead of during django.setup().
+"""
+from django.contrib import admin
+from django.urls import path
+
+admin.autodiscover()
+
+urlpatterns = [
+    path('', admin.site.urls),
+]
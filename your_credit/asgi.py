@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'your_credit.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after get_asgi_application() so the app registry is ready.
+from apps.core.streaming import websocket_stream  # noqa: E402
+
+WEBSOCKET_ROUTES = {
+    '/ws/stream/': websocket_stream,
+}
+
+
+async def application(scope, receive, send):
+    """Route WebSocket connections to their handlers and everything else to Django."""
+    if scope['type'] == 'websocket':
+        handler = WEBSOCKET_ROUTES.get(scope['path'])
+        if handler is None:
+            await receive()
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        await handler(scope, receive, send)
+        return
+    await django_application(scope, receive, send)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+from decimal import Decimal
 from pathlib import Path
 from decouple import config, Csv
 
@@ -32,10 +33,14 @@ ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='localhost,127.0.0.1', cast=Csv(
 CSRF_TRUSTED_ORIGINS = config('CSRF_TRUSTED_ORIGINS', default='', cast=Csv())
 
 
+# Production startup mode: admin and API docs modules are imported on their first request
+# instead of during process startup.
+DEFER_ADMIN_AND_DOCS = config('DEFER_ADMIN_AND_DOCS', default=False, cast=bool)
+
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'django.contrib.admin.apps.SimpleAdminConfig' if DEFER_ADMIN_AND_DOCS else 'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -57,6 +62,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'apps.core.throttling.ConcurrencyLimitMiddleware',
+    'apps.core.compression.CompressionMiddleware',
     'csp.middleware.CSPMiddleware',
     'django_permissions_policy.PermissionsPolicyMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -101,6 +108,38 @@ DATABASES = {
     }
 }
 
+# Extra shards for clients and credits (apps.core.sharding), as database names with an optional
+# host: "shard1,shard2@db2:5432". Credentials are the default database's; empty keeps one database.
+SHARD_DATABASES = []
+for _shard in config('SHARD_DATABASES', default='', cast=Csv()):
+    _name, _, _address = _shard.partition('@')
+    _host, _, _port = _address.partition(':')
+    DATABASES[_name] = {
+        **DATABASES['default'],
+        'NAME': _name,
+        'HOST': _host or DATABASES['default']['HOST'],
+        'PORT': _port or DATABASES['default']['PORT'],
+    }
+    SHARD_DATABASES.append(_name)
+
+DATABASE_ROUTERS = ['apps.core.sharding.ShardRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/ref/settings/#caches
+
+# Shared by every worker process: the version keys of the in-process bank table and shard map,
+# cached client rows and rate limits. A redis:// URL in production; empty keeps a cache per process.
+CACHE_URL = config('CACHE_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -138,6 +177,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -161,7 +203,21 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Binary bodies for bulk consumers, chosen with Accept / Content-Type (or ?format=msgpack|cbor)
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'apps.core.renderers.MessagePackRenderer',
+        'apps.core.renderers.CBORRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'apps.core.renderers.MessagePackParser',
+        'apps.core.renderers.CBORParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'apps.core.pagination.StandardPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -169,8 +225,132 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': [
+        'apps.core.throttling.IdentityRateThrottle',
+        'apps.core.throttling.ScopedCostRateThrottle',
+    ],
+    # Cost units (THROTTLE_COSTS) per period: overall per user / anonymous address,
+    # and per user on each endpoint (the views' throttle_scope)
+    'DEFAULT_THROTTLE_RATES': {
+        'user': config('THROTTLE_RATE_USER', default='1200/min'),
+        'anon': config('THROTTLE_RATE_ANON', default='60/min'),
+        'banks': config('THROTTLE_RATE_BANKS', default='600/min'),
+        'clients': config('THROTTLE_RATE_CLIENTS', default='600/min'),
+        'credits': config('THROTTLE_RATE_CREDITS', default='600/min'),
+        'changes': config('THROTTLE_RATE_CHANGES', default='120/min'),
+        'graphql': config('THROTTLE_RATE_GRAPHQL', default='300/min'),
+    },
 }
 
+# Rate limiting: cost charged per request, by viewset action ("search" is a list with ?search=)
+THROTTLE_COSTS = {
+    'default': 1,
+    'list': 2,
+    'search': 5,
+    'schedules': 5,
+    'export': 20,
+    'snapshot': 20,
+    'simulate': 50,
+}
+# Cache holding the rate limit buckets and concurrency counters; it must be shared by all
+# worker processes (check --deploy fails and gunicorn refuses to start otherwise).
+THROTTLE_CACHE = config('THROTTLE_CACHE', default='default')
+
+# Load shedding: API requests in flight per client (429 beyond) and overall (503 beyond); 0 disables
+CONCURRENCY_LIMIT = config('CONCURRENCY_LIMIT', default=64, cast=int)
+CONCURRENCY_LIMIT_PER_CLIENT = config('CONCURRENCY_LIMIT_PER_CLIENT', default=8, cast=int)
+CONCURRENCY_RETRY_AFTER = config('CONCURRENCY_RETRY_AFTER', default=1, cast=int)
+# Slots are leased for this many seconds, so those held by a killed worker come back
+CONCURRENCY_SLOT_TIMEOUT = config('CONCURRENCY_SLOT_TIMEOUT', default=120, cast=int)
+# Long-lived streams are not counted
+CONCURRENCY_EXEMPT_PATHS = ('/api/stream/',)
+
+# Amortization schedules (/api/creditos/{id}/schedule/)
+# Nominal annual rate in percent used when the request does not pass ?annual_rate=
+CREDIT_SCHEDULE_DEFAULT_ANNUAL_RATE = config('CREDIT_SCHEDULE_DEFAULT_ANNUAL_RATE', default='12.00', cast=Decimal)
+CREDIT_SCHEDULE_CACHE_TIMEOUT = config('CREDIT_SCHEDULE_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Group-commit ingestion for POST /api/creditos/: requests queue their validated credit and wait
+# while up to MAX_ROWS credits, or whatever arrived within MAX_DELAY_MS, are inserted in one
+# transaction. Needs concurrent requests per process (gunicorn threads or ASGI).
+CREDIT_GROUP_COMMIT = config('CREDIT_GROUP_COMMIT', default=False, cast=bool)
+CREDIT_GROUP_COMMIT_MAX_ROWS = config('CREDIT_GROUP_COMMIT_MAX_ROWS', default=200, cast=int)
+CREDIT_GROUP_COMMIT_MAX_DELAY_MS = config('CREDIT_GROUP_COMMIT_MAX_DELAY_MS', default=5, cast=int)
+CREDIT_GROUP_COMMIT_TIMEOUT = config('CREDIT_GROUP_COMMIT_TIMEOUT', default=10, cast=int)
+
+# Background jobs (runjobs): a RUNNING job whose worker stopped renewing its lease for LEASE_TIMEOUT
+# seconds goes back to the queue, up to MAX_ATTEMPTS runs in all, then fails
+JOB_LEASE_TIMEOUT = config('JOB_LEASE_TIMEOUT', default=300, cast=int)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Portfolio risk simulation: worker processes per simulation job (0 = one per CPU)
+CREDIT_SIMULATION_WORKERS = config('CREDIT_SIMULATION_WORKERS', default=0, cast=int)
+
+# Pagination: ?page_size= is capped at PAGINATION_MAX_PAGE_SIZE. With ?count=estimate, results the
+# planner estimates above PAGINATION_ESTIMATE_THRESHOLD rows report the estimate; smaller ones are
+# counted exactly and cached for PAGINATION_COUNT_CACHE_TIMEOUT seconds.
+PAGINATION_MAX_PAGE_SIZE = config('PAGINATION_MAX_PAGE_SIZE', default=500, cast=int)
+PAGINATION_ESTIMATE_THRESHOLD = config('PAGINATION_ESTIMATE_THRESHOLD', default=10000, cast=int)
+PAGINATION_COUNT_CACHE_TIMEOUT = config('PAGINATION_COUNT_CACHE_TIMEOUT', default=30, cast=int)
+
+# Response compression of API payloads: encodings in server preference order (brotli and zstd
+# need their packages) and their levels. Bodies under COMPRESSION_MIN_SIZE bytes are sent as is.
+COMPRESSION_ENCODINGS = config('COMPRESSION_ENCODINGS', default='zstd,br,gzip', cast=Csv())
+COMPRESSION_LEVELS = {
+    'gzip': config('COMPRESSION_GZIP_LEVEL', default=6, cast=int),
+    'br': config('COMPRESSION_BROTLI_LEVEL', default=4, cast=int),
+    'zstd': config('COMPRESSION_ZSTD_LEVEL', default=3, cast=int),
+}
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_CONTENT_TYPES = [
+    'application/json', 'application/msgpack', 'application/cbor',
+    'application/vnd.oai.openapi', 'application/vnd.oai.openapi+json',
+]
+# List pages with at least this many rows are streamed row by row instead of rendered in one piece.
+LIST_STREAMING_MIN_ROWS = config('LIST_STREAMING_MIN_ROWS', default=100, cast=int)
+
+# Foreign keys validated on credit and client writes: seconds an in-process bank snapshot is
+# trusted without a version change, and seconds a client row stays cached
+RELATED_CACHE_TIMEOUT = config('RELATED_CACHE_TIMEOUT', default=300, cast=int)
+RELATED_CACHE_ROW_TIMEOUT = config('RELATED_CACHE_ROW_TIMEOUT', default=30, cast=int)
+
+# Idempotency-Key on credit and client writes: seconds a stored response is replayed
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+
+# Audit history of credit terms and client data: inserted by the saving transaction, one INSERT per
+# transaction. With ASYNC, entries are queued on commit instead and inserted in batches of up to
+# MAX_ROWS (or whatever arrived within MAX_DELAY_MS) by a background thread, which gets up to
+# DRAIN_TIMEOUT seconds at process exit; a worker killed outright loses the queued ones.
+AUDIT_HISTORY_ASYNC = config('AUDIT_HISTORY_ASYNC', default=False, cast=bool)
+AUDIT_HISTORY_MAX_ROWS = config('AUDIT_HISTORY_MAX_ROWS', default=500, cast=int)
+AUDIT_HISTORY_MAX_DELAY_MS = config('AUDIT_HISTORY_MAX_DELAY_MS', default=50, cast=int)
+AUDIT_HISTORY_DRAIN_TIMEOUT = config('AUDIT_HISTORY_DRAIN_TIMEOUT', default=10, cast=int)
+
+# GraphQL (/api/graphql/): queries priced above MAX_COST (fields, multiplied by the page size of
+# every list they sit under) or nested deeper than MAX_DEPTH are rejected before they run
+GRAPHQL_MAX_COST = config('GRAPHQL_MAX_COST', default=5000, cast=int)
+GRAPHQL_MAX_DEPTH = config('GRAPHQL_MAX_DEPTH', default=8, cast=int)
+
+# Batch retrieval (?ids=1,2,3 on list endpoints)
+BATCH_RETRIEVE_MAX_IDS = config('BATCH_RETRIEVE_MAX_IDS', default=100, cast=int)
+
+# Composite requests (/api/batch/): maximum sub-requests per batch
+BATCH_MAX_REQUESTS = config('BATCH_MAX_REQUESTS', default=20, cast=int)
+
+# Change feed (/api/changes/): rows updated in the last N seconds are held back so
+# transactions that commit late with an earlier updated_at are never skipped.
+CHANGE_FEED_SAFETY_LAG = config('CHANGE_FEED_SAFETY_LAG', default=2, cast=float)
+
+# Columnar snapshots (snapshot command, POST .../snapshot/): rows per server-side cursor fetch and
+# per row group, which bounds the memory a snapshot uses, and the Parquet compression codec
+SNAPSHOT_CHUNK_SIZE = config('SNAPSHOT_CHUNK_SIZE', default=50000, cast=int)
+SNAPSHOT_PARQUET_COMPRESSION = config('SNAPSHOT_PARQUET_COMPRESSION', default='zstd')
+
+# Change event stream (/api/stream/ and ws://.../ws/stream/): "postgres" relays events
+# between processes with NOTIFY/LISTEN, "local" only sees writes from the same process.
+EVENTS_BACKEND = config('EVENTS_BACKEND', default='postgres')
+STREAM_KEEPALIVE_SECONDS = config('STREAM_KEEPALIVE_SECONDS', default=15, cast=float)
+
 # Simple JWT settings
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -181,6 +361,12 @@ SIMPLE_JWT = {
 }
 
 # API Documentation (drf-spectacular)
+# Directory of the OpenAPI schema precomputed at build time (manage.py generate_schema) and
+# served by /api/schema/. Unset, the schema is generated once per process and kept in memory.
+OPENAPI_SCHEMA_DIR = config('OPENAPI_SCHEMA_DIR', default='')
+# Seconds clients and proxies may reuse the schema before revalidating its ETag.
+OPENAPI_SCHEMA_MAX_AGE = config('OPENAPI_SCHEMA_MAX_AGE', default=300, cast=int)
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Your Credit API',
     'DESCRIPTION': 'REST API for managing credits, clients, and banks',
@@ -14,23 +14,41 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from apps.core.lazy import lazy_include, lazy_view
+from apps.core.schema import schema_view
+from apps.core.streaming import event_stream
+from apps.core.views import BatchView, ChangeFeedView, GraphQLView
 from . import views
 
+if settings.DEFER_ADMIN_AND_DOCS:
+    # Production startup mode: admin and docs modules load on their first request.
+    admin_urls = lazy_include('admin/', 'your_credit.admin_urls')
+    swagger_view = lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema')
+else:
+    from django.contrib import admin
+    from drf_spectacular.views import SpectacularSwaggerView
+    admin_urls = path('admin/', admin.site.urls)
+    swagger_view = SpectacularSwaggerView.as_view(url_name='schema')
+
 urlpatterns = [
     path('', views.index),
-    path('admin/', admin.site.urls),
+    admin_urls,
     # Authentication
     path('api/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/login/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # API Documentation
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
+    path('api/schema/', schema_view, name='schema'),
+    path('api/docs/', swagger_view, name='swagger-ui'),
     # API endpoints
     path('api/clientes/', include('apps.clients.urls')),
     path('api/creditos/', include('apps.credits.urls')),
     path('api/bancos/', include('apps.banks.urls')),
+    path('api/jobs/', include('apps.core.urls')),
+    path('api/changes/', ChangeFeedView.as_view(), name='changes'),
+    path('api/stream/', event_stream, name='event-stream'),
+    path('api/batch/', BatchView.as_view(), name='batch'),
+    path('api/graphql/', GraphQLView.as_view(), name='graphql'),
 ]